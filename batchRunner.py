@@ -0,0 +1,106 @@
+import numpy as np
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+
+"""
+This file runs a reactor simulation as a set of independent batches, spread across the cores of the machine with a process pool, and merges their results.
+
+The starting neutrons (and population target, if one is given) are divided between the batches. Each batch is a reactor of its own, drawing its random numbers from a numpy Generator spawned from a single SeedSequence; the streams of different batches are independent, and the result of every batch depends only on the master seed and its place among the batches. A run is therefore reproducible for a given master seed, however many worker processes are used.
+
+The merged results give, for each quantity, the mean over the batches and its standard error (the standard deviation between batches over the square root of their number):
+
+- k_eff: the mean value of k_eff over the steps of a batch (excluding the initial value)
+- k_effData: k_eff at every step
+- meanEnergy: the mean neutron energy at every step
+- eventCounts: the number of each event (fission, capture, scatterU, scatterH, cutoff, leak and roulette) in a batch
+
+Batches run in separate processes, so any further reactor parameters must be plain values which can be sent to them; objects such as a trajectory store or run writer cannot be shared between batches.
+"""
+
+from reactor import Reactor, eventNames
+
+
+def splitCount(total, batches):
+    # Divides a count as evenly as possible between the batches, giving any remainder to the first.
+    counts = np.full(batches, total//batches)
+    counts[:total % batches] += 1
+    return [int(count) for count in counts]
+
+
+def runBatch(parameters, seed):
+    # Runs a single batch, returning only the arrays needed to merge its results.
+    reactor = Reactor(rng = np.random.default_rng(seed), **parameters)
+    reactor.startUp()
+
+    # The tallies end at the last step which scored a neutron; a batch whose population died out is padded to its full length, with no mean energy at the steps after.
+    means = reactor.tallies.steps.means()
+    meanEnergy = np.full(reactor.step + 1, np.nan)
+    meanEnergy[:len(means)] = means
+
+    return {
+        "k_eff": np.mean(reactor.k_effData[1:]),
+        "k_effData": np.array(reactor.k_effData, dtype=float),
+        "meanEnergy": meanEnergy,
+        "eventCounts": np.array([reactor.eventCounts[name] for name in eventNames], dtype=float),
+    }
+
+
+def meanAndError(values):
+    # The mean over the batches (the first axis) and its standard error. Steps at which a batch had no neutrons are left out of that step's average, and a step at which none had any has neither.
+    values = np.asarray(values, dtype=float)
+    count = np.sum(~np.isnan(values), axis=0)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        mean = np.nanmean(values, axis=0)
+
+        if len(values) < 2:
+            return mean, np.full(np.shape(mean), np.nan)
+
+        error = np.nanstd(values, axis=0, ddof=1)/np.sqrt(count)
+    return mean, error
+
+
+def mergeBatches(results):
+    merged = {}
+
+    for name in ("k_eff", "k_effData", "meanEnergy"):
+        merged[name] = meanAndError([result[name] for result in results])
+
+    means, errors = meanAndError([result["eventCounts"] for result in results])
+    merged["eventCounts"] = {name: (means[i], errors[i]) for i, name in enumerate(eventNames)}
+
+    merged["batches"] = results
+    return merged
+
+
+def runBatches(neutronStart, stepCount, batches = 8, masterSeed = 0, workers = None, **parameters):
+    # Runs the batches over a pool of worker processes (as many as there are cores, unless workers is given), returning the merged results. With workers = 1 the batches are run one after the other in this process.
+    seeds = np.random.SeedSequence(masterSeed).spawn(batches)
+
+    starts = splitCount(neutronStart, batches)
+    targets = [None]*batches
+    if parameters.get("populationTarget") is not None:
+        targets = splitCount(parameters["populationTarget"], batches)
+
+    jobs = []
+    for i in range(batches):
+        batchParameters = dict(parameters, neutronStart = starts[i], stepCount = stepCount)
+        if targets[i] is not None:
+            batchParameters["populationTarget"] = targets[i]
+        jobs.append(batchParameters)
+
+    if workers == 1:
+        results = [runBatch(job, seed) for job, seed in zip(jobs, seeds)]
+    else:
+        with ProcessPoolExecutor(max_workers = workers) as executor:
+            results = list(executor.map(runBatch, jobs, seeds))
+
+    return mergeBatches(results)
+
+
+if __name__ == "__main__":
+    merged = runBatches(10000, 100, batches = 8, masterSeed = 3, engine = "vector")
+
+    mean, error = merged["k_eff"]
+    print(F"k_eff = {mean:.4f} +/- {error:.4f} from {len(merged['batches'])} batches")
@@ -0,0 +1,201 @@
+import numpy as np
+import json
+import os
+import sys
+import time
+import timeit
+import platform
+import resource
+import argparse
+import itertools
+import subprocess
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+"""
+This file measures the performance of the simulation, and writes the results as JSON so that they may be compared between commits. It is run from the terminal with:
+
+python benchmarks.py results.json [--quick]
+python benchmarks.py compare old.json new.json
+
+Three sets of measurements are made:
+
+1. importTime: the time to import creatingDistribution, and to build each of its distributions on first use (see lazyDistributions there). Each is timed in a fresh interpreter, as a module is only imported once per process.
+
+2. perCall: the mean cost of a single call of Neutron.setCrossSection, Neutron.chooseEvent and Neutron.randomStep, once the distributions are built.
+
+3. reactor: for each point of a grid of engine, neutronStart, stepCount and thermal, the wall time of Reactor.startUp, the number of collisions (events ending a step), the collisions per second, and the peak resident memory (RSS) of the process. Each point is run in a new process, so that its peak memory is its own; the memory after importing the reactor and building the distributions is also given, as the baseline of that peak.
+
+The JSON also records the commit (if run from the git repository), the time of the run, and the machine. compare prints the ratio new/old of every measurement the two files share; for times and memory a ratio above one is a slowdown, for collisions per second it is an improvement.
+"""
+
+grid = {
+    "engine": ["history", "vector"],
+    "neutronStart": [100, 1000],
+    "stepCount": [25, 50],
+    "thermal": [False, True],
+}
+
+quickGrid = {
+    "engine": ["history", "vector"],
+    "neutronStart": [100],
+    "stepCount": [10],
+    "thermal": [False],
+}
+
+
+def peakMemory():
+    # The peak resident memory of this process, in MiB; getrusage gives it in KiB on Linux, and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak/2**20
+    return peak/2**10
+
+
+def importTime(statement, repeats = 5):
+    # The time taken by the statement in a fresh interpreter, run from this folder; the fastest of several runs is taken, as the others are slowed only by the machine.
+    code = F"import time; start = time.perf_counter(); {statement}; print(time.perf_counter() - start)"
+    folder = os.path.dirname(os.path.abspath(__file__))
+
+    times = []
+    for i in range(repeats):
+        output = subprocess.run([sys.executable, "-c", code], cwd = folder, capture_output = True, text = True, check = True)
+        times.append(float(output.stdout))
+    return min(times)
+
+
+def importTimes(repeats = 5):
+    results = {"creatingDistribution": importTime("import creatingDistribution", repeats)}
+
+    import creatingDistribution
+    for name in creatingDistribution.lazyDistributions:
+        results[name] = importTime(F"import creatingDistribution; creatingDistribution.distribution('{name}')", repeats)
+
+    return results
+
+
+def perCall(number = 20000):
+    # Each function is called on a fresh neutron with an energy in the middle of the spectrum; randomStep and chooseEvent move or change it, so the neutron is reset before every call outside of the timing.
+    from neutron import Neutron
+    import creatingDistribution
+
+    creatingDistribution.distribution("crossSectionTable")
+    creatingDistribution.distribution("newPromptNeutronCDF")
+    creatingDistribution.distribution("moderation")
+
+    neutron = Neutron(energy = 1e3)
+    crossSectionValues = neutron.setCrossSection()
+
+    def reset():
+        neutron.energy = 1e3
+        neutron.absorbed = False
+        neutron.eventType = None
+        neutron.x = neutron.y = 0
+        neutron.posDataX = [0]
+        neutron.posDataY = [0]
+        neutron.energyData = []
+
+    results = {}
+    results["setCrossSection"] = min(timeit.repeat(neutron.setCrossSection, number = number, repeat = 3))/number
+
+    for name, call in (("chooseEvent", lambda: neutron.chooseEvent(crossSectionValues)), ("randomStep", neutron.randomStep)):
+        times = []
+        for i in range(number):
+            reset()
+            start = time.perf_counter()
+            call()
+            times.append(time.perf_counter() - start)
+        results[name] = float(np.mean(times))
+
+    return results
+
+
+def runReactor(settings):
+    # Runs on one point of the grid in a process of its own. Finished neutrons are not kept, so that the memory measured is that of the live population and the tallies.
+    from reactor import Reactor
+    import creatingDistribution
+
+    # The distributions are built before the timing begins, as they are only built once however long the run.
+    for name in creatingDistribution.lazyDistributions:
+        creatingDistribution.distribution(name)
+
+    baseline = peakMemory()
+    reactor = Reactor(settings["neutronStart"], settings["stepCount"], thermal = settings["thermal"], engine = settings["engine"], keepHistory = False)
+
+    start = time.perf_counter()
+    reactor.startUp()
+    seconds = time.perf_counter() - start
+
+    collisions = sum(count for name, count in reactor.eventCounts.items() if name not in ("cutoff", "roulette"))
+
+    return dict(settings, seconds = seconds, collisions = collisions, collisionsPerSecond = collisions/seconds, peakRSS = peakMemory(), baselineRSS = baseline)
+
+
+def reactorGrid(grid):
+    context = multiprocessing.get_context("spawn")
+
+    results = []
+    for values in itertools.product(*grid.values()):
+        settings = dict(zip(grid, values))
+        with ProcessPoolExecutor(max_workers = 1, mp_context = context) as executor:
+            results.append(executor.submit(runReactor, settings).result())
+
+    return results
+
+
+def commit():
+    try:
+        output = subprocess.run(["git", "rev-parse", "HEAD"], cwd = os.path.dirname(os.path.abspath(__file__)), capture_output = True, text = True, check = True)
+        return output.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def runBenchmarks(quick = False):
+    return {
+        "commit": commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "machine": {"platform": platform.platform(), "processor": platform.processor(), "python": platform.python_version(), "numpy": np.__version__, "cpus": os.cpu_count()},
+        "importTime": importTimes(repeats = 1 if quick else 5),
+        "perCall": perCall(number = 2000 if quick else 20000),
+        "reactor": reactorGrid(quickGrid if quick else grid),
+    }
+
+
+def compare(old, new):
+    # Prints the ratio new/old of every measurement in both results. Reactor results are matched by their settings.
+    for section in ("importTime", "perCall"):
+        for name in old[section]:
+            if name in new[section]:
+                print(F"{section}.{name}: {new[section][name]/old[section][name]:.3f}")
+
+    settingNames = list(grid)
+    oldPoints = {tuple(point[name] for name in settingNames): point for point in old["reactor"]}
+
+    for point in new["reactor"]:
+        key = tuple(point[name] for name in settingNames)
+        if key in oldPoints:
+            ratios = ", ".join(F"{name} {point[name]/oldPoints[key][name]:.3f}" for name in ("seconds", "collisionsPerSecond", "peakRSS"))
+            print(F"reactor {dict(zip(settingNames, key))}: {ratios}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        parser = argparse.ArgumentParser(description = "Compare two sets of benchmark results")
+        parser.add_argument("command")
+        parser.add_argument("old")
+        parser.add_argument("new")
+        arguments = parser.parse_args()
+
+        with open(arguments.old) as oldFile, open(arguments.new) as newFile:
+            compare(json.load(oldFile), json.load(newFile))
+    else:
+        parser = argparse.ArgumentParser(description = "Benchmark the simulation")
+        parser.add_argument("output", nargs = "?", default = "benchmarks.json")
+        parser.add_argument("--quick", action = "store_true", help = "a much smaller grid and fewer repeats, to check the benchmarks run")
+        arguments = parser.parse_args()
+
+        results = runBenchmarks(arguments.quick)
+        with open(arguments.output, "w") as file:
+            json.dump(results, file, indent = 2)
+        print(F"Results written to {arguments.output}")
@@ -0,0 +1,65 @@
+import numpy as np
+import json
+import os
+
+"""
+This file saves and reads the checkpoints of a reactor run (see Reactor.checkpoint and Reactor.resume). A checkpoint holds only what the run needs to carry on: the state of every live neutron, the state of the random number generator, k_effData and the event counts, and the accumulators of the tallies. Finished neutrons and their histories are not saved, so its size depends on the live population rather than the length of the run.
+
+A checkpoint is a single .npz file of named arrays, with a JSON string under "meta" holding the format version, the reactor's parameters and the scalar state. It is written to a temporary file and renamed into place, so a run stopped while saving leaves the previous checkpoint intact.
+
+The generator state is saved in the form numpy gives it: a dictionary for a Generator, and a tuple with an array of keys for the legacy RandomState.
+"""
+
+checkpointVersion = 1
+
+
+def rngState(rng):
+    # The state as a JSON-ready dictionary, with any arrays moved to the arrays of the checkpoint.
+    if isinstance(rng, np.random.RandomState):
+        kind, keys, pos, hasGauss, cachedGaussian = rng.get_state()
+        return {"kind": "RandomState", "pos": int(pos), "hasGauss": int(hasGauss), "cachedGaussian": float(cachedGaussian)}, {"rng.keys": keys}
+
+    state = rng.bit_generator.state
+    arrays = {}
+    if isinstance(state["state"], dict) and isinstance(state["state"].get("key"), np.ndarray):
+        state = dict(state, state = dict(state["state"]))
+        arrays["rng.keys"] = state["state"].pop("key")
+    return {"kind": "Generator", "state": state}, arrays
+
+
+def restoreRng(rng, meta, arrays):
+    # Sets the state of rng, or of a new Generator if rng is None or of the wrong kind, returning the generator to use.
+    if meta["kind"] == "RandomState":
+        if not isinstance(rng, np.random.RandomState):
+            rng = np.random.RandomState()
+        rng.set_state(("MT19937", arrays["rng.keys"], meta["pos"], meta["hasGauss"], meta["cachedGaussian"]))
+        return rng
+
+    state = meta["state"]
+    if "rng.keys" in arrays:
+        state = dict(state, state = dict(state["state"], key = arrays["rng.keys"]))
+
+    if not isinstance(rng, np.random.Generator) or type(rng.bit_generator).__name__ != state["bit_generator"]:
+        rng = np.random.Generator(getattr(np.random, state["bit_generator"])())
+    rng.bit_generator.state = state
+    return rng
+
+
+def writeCheckpoint(path, meta, arrays):
+    meta = dict(meta, version = checkpointVersion)
+    temporary = F"{path}.tmp{os.getpid()}.npz"
+
+    with open(temporary, "wb") as file:
+        np.savez(file, meta = np.array(json.dumps(meta)), **arrays)
+    os.replace(temporary, path)
+
+
+def readCheckpoint(path):
+    with np.load(path, allow_pickle = False) as file:
+        arrays = {name: file[name] for name in file.files}
+
+    meta = json.loads(str(arrays.pop("meta")))
+    if meta["version"] > checkpointVersion:
+        raise ValueError(F"Checkpoint {path} has version {meta['version']}; this code reads up to version {checkpointVersion}")
+
+    return meta, arrays
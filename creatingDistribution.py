@@ -1,9 +1,9 @@
 import numpy as np
-import matplotlib.pyplot as plt
-from scipy import interpolate, special
-from scipy.stats import norm
 import csv
-import matplotlib.colors as mcolors
+import bisect
+import hashlib
+import os
+import shutil
 
 """
 This file will serve to create any distributions, or deal with any data files required for the neutron class. This involves:
@@ -12,7 +12,11 @@ This file will serve to create any distributions, or deal with any data files re
 2. Cross Section interpolation
 3. Neutron Moderator CDF interpolation
 
+along with the group constants of the multigroup mode, collapsed from the cross sections.
+
 It is not required to run this file prior to simulationFile.py; the simulation will be generated as necessary by neutron class objects.
+
+Importing this file does almost nothing: each of newPromptNeutronCDF, crossSectionTable, crossSections, eventTable, moderatorTable and moderation is only built the first time it is used (see section 4). For the same reason scipy is imported inside the function which needs it, and matplotlib only in the (commented-out) plots.
 """
 
 
@@ -35,25 +39,52 @@ def promptNeutronPDF(E):
 
 def calcPromptNeutronCDF(energies):
     
-    probs = []
-    
-    for energy in energies:
-        probs.append(promptNeutronPDF(energy))
-
-    sumProbs = sum(probs)
-    promptNeutronCDF = np.cumsum([x/sumProbs for x in probs])
+    probs = promptNeutronPDF(np.asarray(energies, dtype=float))
+    promptNeutronCDF = np.cumsum(probs/probs.sum())
 
     return promptNeutronCDF
 
-# Where the cdf is by definition a one-to-one function, we may invert the interpolation such that inputting a random number [0,1) to the resulting function will return an energy.
+# Where the cdf is by definition a one-to-one function, we may invert it such that inputting a random number [0,1) to the resulting function will return an energy.
+
+# Rather than interpolating the inverse cdf afresh for every random number, the sampler tabulates it once at equally spaced probabilities: entry i of the table is the value below which a fraction i/tableSize of samples fall. A random number then picks its interval by a single multiplication, and is interpolated linearly within it, so each sample costs the same however finely the cdf was calculated. Random numbers below the first value of the cdf return the first value, rather than being extrapolated.
+
+class InverseCDFSampler():
+    def __init__(self, cdf, values, tableSize = 2**16):
+        self.tableSize = tableSize
+        self.table = np.interp(np.linspace(0, 1, tableSize + 1), cdf, values)
+        self.steps = np.diff(self.table)
+
+    def __call__(self, rand):
+        # Converts a random number in [0,1), or an array of them, into samples from the distribution. This matches the interpolation functions the sampler replaces, so it may be called in the same way.
+        if np.ndim(rand) == 0:
+            scaled = float(rand)*self.tableSize
+            index = min(int(scaled), self.tableSize - 1)
+            return self.table[index] + (scaled - index)*self.steps[index]
+
+        scaled = np.asarray(rand, dtype=float)*self.tableSize
+        index = np.minimum(scaled.astype(np.int64), self.tableSize - 1)
+        return self.table[index] + (scaled - index)*self.steps[index]
+
+    def sample(self, n, rng = None):
+        # Draws n samples at once, using numpy's global random state unless another generator is given.
+        if rng is None:
+            rng = np.random
+        return self(rng.random(n))
+
+    # Makes a sampler from a table already calculated, such as a row of the moderator table (see section 3).
+    @classmethod
+    def fromTable(cls, table):
+        sampler = cls.__new__(cls)
+        sampler.tableSize = len(table) - 1
+        sampler.table = np.asarray(table, dtype=float)
+        sampler.steps = np.diff(sampler.table)
+        return sampler
 
 def interPromptNeutronCDF(energies):
-    func = interpolate.interp1d(calcPromptNeutronCDF(energies), energies)
-    return func
-
-newPromptNeutronCDF = interPromptNeutronCDF(energies)
+    return InverseCDFSampler(calcPromptNeutronCDF(energies), energies)
 
 """
+import matplotlib.pyplot as plt
 plt.figure(1)
 plt.plot(energies, calcPromptNeutronCDF(energies))
 plt.show()
@@ -64,36 +95,178 @@ plt.show()
 
 # We define values to convert microscopic cross sections (stored in the csv files read into the paper), to macroscopic cross sections in cm^-2. Hence, all lengths in the reactor are measured in these units.
 
-# It is convenient in this case to hold the function in a single place; the crossSections list is iterated over, with the string held at each index overwritten by its corresponding interpolated function. Here, we maintain the interpolation order, since we want to input an energy (x-axis) and recieve a cross-section (y-axis).
+N_U = 9.48e20 * .39
+N_H = 66.7e21 * .61
 
-def makeCrossSections():
-    
-    N_U = 9.48e20 * .39
-    N_H = 66.7e21 * .61
-    
-    barnCm = 1e-24
+barnCm = 1e-24
 
-    crossSections = ["F","C","S","T","H"]
-    
-    NumDensity = [N_U, N_U, N_U, N_U, N_H]
+crossSectionNames = ["F","C","S","T","H"]
+numberDensities = [N_U, N_U, N_U, N_U, N_H]
+
+# Each of the five csv files is given on its own energy grid. Rather than interpolating each of them separately (five interpolations per collision), we merge their energies into a single union grid and evaluate every cross section on it. Since each cross section is piecewise linear in its own data, evaluating it at the extra points of the union grid does not change it: a linear interpolation on the union grid gives the same values as the separate interpolations. Above 20MeV, where the H data ends, its last value is held constant.
+
+# A table is saved as one .npy file per array in a directory, so that it can be loaded back as memory-mapped arrays without any parsing or copying. It is written to a temporary directory and renamed into place, so a reader never sees a half-written cache (and two processes building it at once do not clash).
+
+def saveArrays(path, arrays):
+    temporary = F"{path}.tmp{os.getpid()}"
+    os.makedirs(temporary, exist_ok=True)
+
+    for name, values in arrays.items():
+        np.save(os.path.join(temporary, F"{name}.npy"), values)
+
+    try:
+        os.rename(temporary, path)
+    except OSError:
+        shutil.rmtree(temporary, ignore_errors=True)
+
+
+class CrossSectionTable():
+    def __init__(self, energies, values, slopes = None):
+
+        # energies is the sorted union grid in eV; values holds the macroscopic cross sections side by side, with columns F, C, S, T and H (fission, capture, U-scattering, total U and H-scattering respectively).
+        self.energies = np.asarray(energies, dtype=float)
+        self.values = np.asarray(values, dtype=float)
 
+        # The slopes of each interval are precomputed so that a lookup is a single binary search followed by one multiply-add.
+        if slopes is None:
+            slopes = np.diff(self.values, axis=0)/np.diff(self.energies)[:,None]
+        self.slopes = np.asarray(slopes, dtype=float)
 
-    for i in range(len(crossSections)):
+    def lookup(self, energy):
+        # Returns all five cross sections for an energy, or an (n, 5) array for an array of energies. Energies outside the grid are clamped to its ends.
+        if np.ndim(energy) == 0:
+            return self.lookupScalar(float(energy))
+
+        energy = np.clip(energy, self.energies[0], self.energies[-1])
+        index = np.searchsorted(self.energies, energy, side="right") - 1
+        index = np.minimum(index, len(self.energies) - 2)
+
+        return self.values[index] + (energy - self.energies[index])[...,None]*self.slopes[index]
+
+    def lookupScalar(self, energy):
+        # The same lookup for a single energy, avoiding the overhead of numpy's array functions; this is the path taken once per collision by the neutron class.
+        energy = min(max(energy, self.energies[0]), self.energies[-1])
+        index = min(int(self.energies.searchsorted(energy, side="right")) - 1, len(self.energies) - 2)
+
+        return self.values[index] + (energy - self.energies[index])*self.slopes[index]
+
+    def column(self, i):
+        # Returns a function of energy for a single cross section, in the manner of the interpolation functions this table replaces.
+        def crossSection(energy):
+            return self.lookup(energy)[...,i]
+        return crossSection
+
+    def save(self, path):
+        saveArrays(path, {"energies": self.energies, "values": self.values, "slopes": self.slopes})
+
+    @classmethod
+    def load(cls, path):
+        arrays = [np.load(os.path.join(path, F"{name}.npy"), mmap_mode="r") for name in ("energies", "values", "slopes")]
+        return cls(*arrays)
+
+
+def readCrossSections():
+
+    data = []
+
+    for i in range(len(crossSectionNames)):
         energies=[]
         crossSection = []
         
-        with open(F"crossSection{crossSections[i]}.csv", "r") as file:
+        with open(F"crossSection{crossSectionNames[i]}.csv", "r") as file:
             read = csv.reader(file, quoting=csv.QUOTE_NONNUMERIC)
             
             for row in read:
                 energies.append(row[0]*MeV)
-                crossSection.append(row[1]*barnCm*NumDensity[i])
+                crossSection.append(row[1]*barnCm*numberDensities[i])
         
-        crossSections[i]= interpolate.interp1d(energies, crossSection)
+        data.append((np.array(energies), np.array(crossSection)))
     
-    return crossSections
+    return data
+
+
+# Reading the csv files takes a few seconds, and would otherwise be repeated every time this file is imported. The finished table is therefore cached on disk in crossSectionCache, under a hash of the csv files and the constants used to convert them. If any of these change the hash changes with them, and the table is rebuilt; otherwise it is loaded straight from the cache.
+
+cacheDirectory = "crossSectionCache"
+cacheVersion = 1
+
+def crossSectionHash():
+    hasher = hashlib.sha256()
+    hasher.update(F"{cacheVersion} {MeV} {barnCm} {numberDensities}".encode())
+
+    for name in crossSectionNames:
+        with open(F"crossSection{name}.csv", "rb") as file:
+            hasher.update(file.read())
+
+    return hasher.hexdigest()[:16]
+
 
-crossSections = makeCrossSections()
+def buildCrossSectionTable():
+
+    data = readCrossSections()
+
+    grid = np.unique(np.concatenate([energies for energies, crossSection in data]))
+    values = np.column_stack([np.interp(grid, energies, crossSection) for energies, crossSection in data])
+
+    return CrossSectionTable(grid, values)
+
+
+def makeCrossSectionTable():
+
+    path = os.path.join(cacheDirectory, F"crossSectionTable_{crossSectionHash()}")
+
+    if os.path.isdir(path):
+        return CrossSectionTable.load(path)
+
+    table = buildCrossSectionTable()
+
+    # A cache that cannot be written (a read-only folder, say) is not an error; the table is simply rebuilt next time.
+    try:
+        os.makedirs(cacheDirectory, exist_ok=True)
+        table.save(path)
+    except OSError:
+        pass
+
+    return table
+
+# It is convenient in this case to hold the functions in a single place; the crossSections list holds a function of energy for each column of the table, in the order F, C, S, T, H, so that crossSections[3](energy) gives the total U cross section. Where all five are needed at once, crossSectionTable.lookup should be used instead.
+
+def makeCrossSections():
+    table = distribution("crossSectionTable")
+    return [table.column(i) for i in range(5)]
+
+
+# Every collision chooses its event by comparing a random number with the cumulative probabilities F/(T+H), (F+C)/(T+H) and T/(T+H), and every step samples its length with the total cross section T+H. Whatever part of U235's total cross section is not fission or capture scatters from uranium (S, and the other reactions lumped in with it), so that only the band of H chooses a hydrogen scatter; a material without hydrogen never moderates through it. The eventTable holds these sums precomputed on the energy grid, as the columns F, F+C, T and T+H, so that one lookup gives everything a collision needs. The sums are stored rather than the probabilities themselves: a ratio of cross sections is not linear between the points of the grid, whereas their sums are, so interpolating them gives exactly the thresholds of the interpolated cross sections. The event is then the number of thresholds not above the random number scaled by the total, found by a search of the three cumulative sums.
+
+# A material other than the homogeneous mixture (see geometry.py) has its U235 and H-1 cross sections scaled by u and h.
+class EventTable(CrossSectionTable):
+
+    @classmethod
+    def fromCrossSections(cls, table, u = 1, h = 1):
+        F, C, S, T, H = table.values.T
+        return cls(table.energies, np.column_stack((u*F, u*(F + C), u*T, u*T + h*H)))
+
+    def choose(self, values, rand):
+        # The event (0 for fission, 1 capture, 2 U-scattering and 3 H-scattering) for random numbers in [0, 1), given the values looked up for their energies: a single value, or an array of events for (n, 4) values and n random numbers.
+        if np.ndim(rand) == 0:
+            F, FC, T, total = values.tolist()
+            return bisect.bisect_right((F, FC, T), rand*total)
+
+        return np.count_nonzero(values[:,:3] <= (rand*values[:,3])[:,None], axis=1)
+
+    def chooseSurvival(self, values, rand):
+        # The event as for choose, but never a capture, as in implicit capture (see varianceReduction.py): the random number falls along the cross sections with capture taken out, F, T - C and T+H - C, and the event is fission, U-scattering or H-scattering.
+        if np.ndim(rand) == 0:
+            F, FC, T, total = values.tolist()
+            return (0, 2, 3)[bisect.bisect_right((F, T - FC + F), rand*(total - FC + F))]
+
+        capture = values[:,1] - values[:,0]
+        thresholds = np.column_stack((values[:,0], values[:,2] - capture))
+        return survivalEvents[np.count_nonzero(thresholds <= (rand*(values[:,3] - capture))[:,None], axis=1)]
+
+
+# The events chosen by EventTable.chooseSurvival, in the order of its thresholds.
+survivalEvents = np.array([0, 2, 3])
 
 
 
@@ -108,9 +281,11 @@ k = 8.617333262e-5
 
 
 def moderatorFuncDown(ePrime, temp):
+    from scipy import special
     return special.erf((ePrime/(k*temp))**(1/2))
 
 def moderatorFuncUp(e, ePrime, temp):
+    from scipy import special
     return (np.exp((e-ePrime)/(k*temp)))*special.erf((e/(k*temp))**(1/2))
 
 
@@ -121,49 +296,34 @@ def calcModeratorCDF(temp, method):
     if method == "upScatter":
         
         enPrime = np.arange(1e-3, 4e-3, 1e-7)
-
-        ratio = []
-        enDensity = []
-
-        for energy in enPrime:
-            
-            ratio.append(energy/en)
-            enDensity.append(moderatorFuncUp(en, energy, temp))
-
-        # The energy densities are normalised and the corresponing cdf is created.
-
-        normalEnDensity = np.array(enDensity)/sum(enDensity)
+        enDensity = moderatorFuncUp(en, enPrime, temp)
 
     else:
-        en = 1e-3
         enPrime = np.arange(1e-7, 1e-3, 1e-7)
+        enDensity = moderatorFuncDown(enPrime, temp)
 
-        ratio = []
-        enDensity = []
+    ratio = enPrime/en
 
-        for energy in enPrime:
-            
-            ratio.append(energy/en)
-            enDensity.append(moderatorFuncDown(energy, temp))
-
-        # The energy densities are normalised and the corresponing cdf is created.
-
-        normalEnDensity = np.array(enDensity)/sum(enDensity)
+    # The energy densities are normalised and the corresponing cdf is created.
+    normalEnDensity = enDensity/enDensity.sum()
     
     return ratio, normalEnDensity.cumsum(), enDensity
 
-# This function holds a redundant random number variable to mitigate argument errors when implemented in the neutron class; the corresponding interpolate function requires this parameter.
+# This function holds a redundant random number variable to mitigate argument errors when implemented in the neutron class; the corresponding samplers require this parameter.
 def averageMod(randNo = 0):
     return (0.9)
 
 def logAvgMod(randNo = 0):
     return np.exp(-0.927)
 
+# The down- and up-scattering cdfs are inverted with the same equal-probability tables as the prompt neutron distribution. This builds them afresh for a single temperature; the simulation takes them from the moderator table below instead.
 def runModeratorCDF(temp=600, E=None):
 
-    downScatter = interpolate.interp1d(calcModeratorCDF(temp, "downScatter")[1], calcModeratorCDF(temp, "downScatter")[0], fill_value="extrapolate")
+    downRatio, downCDF, _ = calcModeratorCDF(temp, "downScatter")
+    downScatter = InverseCDFSampler(downCDF, downRatio)
     
-    upScatter = interpolate.interp1d(calcModeratorCDF(temp, "upScatter")[1], calcModeratorCDF(temp, "upScatter")[0], fill_value="extrapolate")
+    upRatio, upCDF, _ = calcModeratorCDF(temp, "upScatter")
+    upScatter = InverseCDFSampler(upCDF, upRatio)
    
     avg = averageMod
     
@@ -171,13 +331,313 @@ def runModeratorCDF(temp=600, E=None):
     
     return  downScatter, upScatter, avg, logAvg
 
-moderation = runModeratorCDF()
+
+# Building the tables for a temperature takes a fraction of a second, which is too slow to repeat for every temperature of a study, or for every collision where the temperature varies through the reactor. The tables are therefore built once over a grid of moderator temperatures, and held together in a ModeratorTable: row i of down (and up) is the equal-probability table of the down- (and up-) scattering ratio at temperatures[i].
+#
+# The table for a temperature between two on the grid is interpolated linearly between their rows, entry by entry; this interpolates the inverse cdf itself, so the result is again a valid inverse cdf. For a single temperature the rows are interpolated once, into an ordinary sampler (see moderationAt), and sampling costs exactly what it did; where the temperature differs from neutron to neutron, sample interpolates for each neutron, at the cost of a second table lookup. Temperatures outside the grid are clamped to its ends.
+
+moderatorTemperatures = np.linspace(300, 900, 25)
+moderatorTemperature = 600
+
+class ModeratorTable():
+    def __init__(self, temperatures, down, up):
+        self.temperatures = np.asarray(temperatures, dtype=float)
+        self.down = np.asarray(down, dtype=float)
+        self.up = np.asarray(up, dtype=float)
+        self.tableSize = self.down.shape[1] - 1
+
+    def interpolation(self, temp):
+        # The row below each temperature, and the fraction of the way to the next row.
+        temp = np.clip(temp, self.temperatures[0], self.temperatures[-1])
+        index = np.minimum(np.searchsorted(self.temperatures, temp, side="right") - 1, len(self.temperatures) - 2)
+        fraction = (temp - self.temperatures[index])/(self.temperatures[index + 1] - self.temperatures[index])
+        return index, fraction
+
+    def samplers(self, temp):
+        # The down- and up-scattering samplers for a single temperature.
+        index, fraction = self.interpolation(float(temp))
+        return [InverseCDFSampler.fromTable((1 - fraction)*rows[index] + fraction*rows[index + 1]) for rows in (self.down, self.up)]
+
+    def sample(self, rand, temp, up):
+        # Converts random numbers into scattering ratios, each at its own temperature; up chooses up-scattering rather than down-scattering for each.
+        rand, temp, up = np.broadcast_arrays(np.asarray(rand, dtype=float), np.asarray(temp, dtype=float), np.asarray(up, dtype=bool))
+        index, fraction = self.interpolation(temp)
+
+        scaled = rand*self.tableSize
+        entry = np.minimum(scaled.astype(np.int64), self.tableSize - 1)
+        within = scaled - entry
+
+        ratio = np.empty(rand.shape)
+        for rows, chosen in ((self.down, ~up), (self.up, up)):
+            row, column, part = index[chosen], entry[chosen], within[chosen]
+            below = rows[row, column] + part*(rows[row, column + 1] - rows[row, column])
+            above = rows[row + 1, column] + part*(rows[row + 1, column + 1] - rows[row + 1, column])
+            ratio[chosen] = below + fraction[chosen]*(above - below)
+
+        return ratio
+
+    def save(self, path):
+        saveArrays(path, {"temperatures": self.temperatures, "down": self.down, "up": self.up})
+
+    @classmethod
+    def load(cls, path):
+        return cls(*[np.load(os.path.join(path, F"{name}.npy"), mmap_mode="r") for name in ("temperatures", "down", "up")])
+
+
+def buildModeratorTable(temperatures = moderatorTemperatures):
+    down = []
+    up = []
+    for temp in temperatures:
+        downScatter, upScatter, _, _ = runModeratorCDF(temp)
+        down.append(downScatter.table)
+        up.append(upScatter.table)
+    return ModeratorTable(temperatures, down, up)
+
+
+# The moderator table is cached on disk beside the cross-section table, under a hash of everything it is calculated from. The moderator functions themselves are not part of the hash, so cacheVersion must be raised if they are changed.
+def makeModeratorTable():
+    hasher = hashlib.sha256()
+    hasher.update(F"{cacheVersion} {k} {list(moderatorTemperatures)} {InverseCDFSampler.__init__.__defaults__}".encode())
+    path = os.path.join(cacheDirectory, F"moderatorTable_{hasher.hexdigest()[:16]}")
+
+    if os.path.isdir(path):
+        return ModeratorTable.load(path)
+
+    table = buildModeratorTable()
+    try:
+        os.makedirs(cacheDirectory, exist_ok=True)
+        table.save(path)
+    except OSError:
+        pass
+
+    return table
+
+
+# The same list as runModeratorCDF gives, for a single moderator temperature, taken from the moderator table.
+def moderationAt(temp = moderatorTemperature):
+    downScatter, upScatter = distribution("moderatorTable").samplers(temp)
+    return downScatter, upScatter, averageMod, logAvgMod
+
+
+# The moderator seen by the neutrons of a reactor whose temperature is not the default: either a single temperature for the whole run, or a function giving the temperature (in K) at a position (x, y) in cm, for a reactor whose temperature varies from region to region.
+class Moderator():
+    def __init__(self, temperature):
+        self.temperature = temperature
+        self.samplers = None if callable(temperature) else moderationAt(temperature)[:2]
+
+    def ratio(self, rand, energy, x, y):
+        # The ratio of outgoing to incident energy for random numbers rand, for neutrons of the given energies and positions; as in Neutron.scatterEventH, neutrons below 0.05eV are up-scattered.
+        up = np.asarray(energy) < 0.05
+
+        if self.samplers is None:
+            return distribution("moderatorTable").sample(rand, self.temperature(x, y), up)
+
+        if np.ndim(rand) == 0:
+            return self.samplers[1 if up else 0](rand)
+
+        ratio = np.empty(np.shape(rand))
+        ratio[up] = self.samplers[1](np.asarray(rand)[up])
+        ratio[~up] = self.samplers[0](np.asarray(rand)[~up])
+        return ratio
+
+
+
+### Multigroup Constants
+
+# For studies where a coarse energy resolution is good enough, the reactor may transport neutrons in groups of energy rather than with continuous energies (Reactor(..., groups=...)). The cross sections are then collapsed into constants for each group, so that a collision looks up a row of a small table by the neutron's group, rather than searching and interpolating the full energy grid.
+#
+# Within group g, from edges[g] to edges[g+1], each cross section is averaged with a weighting spectrum phi(E), the flux expected in the reactor: sigma_g = integral(sigma*phi)/integral(phi). The integrals are taken by the trapezium rule over the union energy grid of the cross sections, refined with points equally spaced in lethargy so that every group holds many of them. Each group is represented by the mean energy of its flux, which is the energy its neutrons are given (for their speed and the tallies).
+#
+# Scattering moves a neutron between groups, with a probability given by the group-to-group scattering matrix of each scatterer: row g holds the probability of each outgoing group for a neutron scattered in group g. The rows are found by sampling incident energies within each group from the weighting spectrum, scattering them as the neutron class does (elastically from U235, and from the moderator distribution of H-1 at the moderator temperature), and counting the outgoing groups, weighted by the scattering cross section at each incident energy. A fixed seed is used, so the matrices are the same every time they are built. Fission neutrons are born into groups with the probabilities of the Watt spectrum integrated over each group.
+#
+# A collapsed library is cached on disk beside the cross-section table, under a hash of the cross-section data, the group edges, the values of the weighting spectrum on the integration grid and the moderator temperature, so changing any of these builds a new one. Libraries are also kept in memory, so the reactors of one process share them.
+
+groupSamples = 4000
+
+def groupEdges(groups = 40, low = 1e-5, high = 2e7):
+    # The boundaries of the groups in eV: groups equally spaced in lethargy between low and high, or the boundaries given.
+    if np.ndim(groups) == 0:
+        return np.logspace(np.log10(low), np.log10(high), int(groups) + 1)
+    return np.sort(np.asarray(groups, dtype=float))
+
+
+def weightingSpectrum(E, temp = moderatorTemperature):
+    # The default weighting spectrum of a thermal reactor: a Maxwellian at the moderator temperature, joined to a 1/E slowing-down spectrum above a few kT, and the fission spectrum above about 1MeV. The three are matched so that each dominates in its own range.
+    kT = k*temp
+    maxwellian = E/kT**2*np.exp(-E/kT)
+    slowingDown = 0.1/E*(1 - np.exp(-(E/(5*kT))**2))
+    fission = 2*promptNeutronPDF(E)/MeV
+    return maxwellian + slowingDown + fission
+
+
+class MultigroupLibrary():
+    def __init__(self, edges, energies, values, scatterU, scatterH, fission):
+
+        # edges holds the G + 1 group boundaries in eV, and energies the G energies the groups are represented by. values holds the group constants F, C, S, T and H (as in the cross-section table), and eventValues the cumulative sums F, F+C, T and T+H used to choose an event (see EventTable). The scattering matrices and fission spectrum are held as cumulative probabilities, so that an outgoing group is found by a search with a random number.
+        self.edges = np.asarray(edges, dtype=float)
+        self.energies = np.asarray(energies, dtype=float)
+        self.values = np.asarray(values, dtype=float)
+        self.scatterU = np.asarray(scatterU, dtype=float)
+        self.scatterH = np.asarray(scatterH, dtype=float)
+        self.fission = np.asarray(fission, dtype=float)
+
+        F, C, S, T, H = self.values.T
+        self.eventValues = np.column_stack((F, F + C, T, T + H))
+
+        self.innerEdges = self.edges[1:-1]
+        self.innerEdgeList = self.innerEdges.tolist()
+        self.groups = len(self.energies)
+
+        # The matrices by scatterer, with their rows as lists for the searches of single neutrons.
+        self.matrices = {"U": self.scatterU, "H": self.scatterH}
+        self.matrixRows = {name: matrix.tolist() for name, matrix in self.matrices.items()}
+
+    def groupOf(self, energy):
+        # The group holding each energy; energies beyond the edges are put in the first or last group.
+        if np.ndim(energy) == 0:
+            return bisect.bisect_right(self.innerEdgeList, energy)
+        return np.searchsorted(self.innerEdges, energy, side="right")
+
+    def scatter(self, scatterer, group, rand):
+        # The outgoing group of neutrons scattered from "U" or "H" in the given groups, found from the cumulative rows of its matrix.
+        if np.ndim(rand) == 0:
+            return min(bisect.bisect_right(self.matrixRows[scatterer][group], rand), self.groups - 1)
+        return np.minimum(np.count_nonzero(self.matrices[scatterer][group] <= np.asarray(rand)[:,None], axis=1), self.groups - 1)
+
+    def fissionGroups(self, rand):
+        return np.minimum(np.searchsorted(self.fission, rand, side="right"), self.groups - 1)
+
+    def save(self, path):
+        saveArrays(path, {"edges": self.edges, "energies": self.energies, "values": self.values, "scatterU": self.scatterU, "scatterH": self.scatterH, "fission": self.fission})
+
+    @classmethod
+    def load(cls, path):
+        return cls(*[np.load(os.path.join(path, F"{name}.npy")) for name in ("edges", "energies", "values", "scatterU", "scatterH", "fission")])
+
+
+def integrationGrid(edges, table):
+    # The union grid of the cross sections within the groups, refined with 200 points per group equally spaced in lethargy and holding every edge.
+    inside = table.energies[(table.energies > edges[0]) & (table.energies < edges[-1])]
+    refined = np.logspace(np.log10(edges[0]), np.log10(edges[-1]), 200*(len(edges) - 1) + 1)
+    return np.unique(np.concatenate((inside, refined, edges)))
+
+
+def groupIntegrals(grid, edges, integrand):
+    # The integral of the integrand (given at each point of the grid, with any further axes) over each group, by the trapezium rule.
+    steps = np.diff(grid).reshape((-1,) + (1,)*(np.ndim(integrand) - 1))
+    cumulative = np.concatenate((np.zeros((1,) + np.shape(integrand)[1:]), np.cumsum(steps*(integrand[1:] + integrand[:-1])/2, axis=0)))
+    return np.diff(cumulative[np.searchsorted(grid, edges)], axis=0)
+
+
+def scatteringMatrix(edges, grid, phi, crossSection, ratio, rng):
+    # The cumulative group-to-group scattering matrix for a scatterer whose ratio of outgoing to incident energy is sampled by ratio(energies, rng).
+    groups = len(edges) - 1
+    matrix = np.zeros((groups, groups))
+    cumulativeFlux = np.concatenate(([0], np.cumsum(np.diff(grid)*(phi[1:] + phi[:-1])/2)))
+
+    for g in range(groups):
+        # Incident energies are sampled from the flux within the group by inverting its cumulative integral.
+        low, high = np.interp(edges[g:g + 2], grid, cumulativeFlux)
+        incident = np.interp(rng.uniform(low, high, groupSamples), cumulativeFlux, grid)
+
+        outgoing = np.clip(np.searchsorted(edges[1:-1], ratio(incident, rng)*incident, side="right"), 0, groups - 1)
+        counts = np.bincount(outgoing, weights = crossSection(incident), minlength = groups)
+        matrix[g] = counts/counts.sum() if counts.sum() > 0 else np.eye(groups)[g]
+
+    return np.cumsum(matrix, axis=1)
+
+
+def buildMultigroupLibrary(edges, spectrum, temp):
+    table = distribution("crossSectionTable")
+    grid = integrationGrid(edges, table)
+    phi = spectrum(grid)
+
+    flux = groupIntegrals(grid, edges, phi)
+    energies = groupIntegrals(grid, edges, grid*phi)/flux
+    values = groupIntegrals(grid, edges, table.lookup(grid)*phi[:,None])/flux[:,None]
+
+    rng = np.random.default_rng(0)
+
+    alpha = (234/236)**2
+    def ratioU(incident, rng):
+        return (1/2)*(1 + alpha + (1-alpha)*np.cos(rng.uniform(0, 2*np.pi, len(incident))))
+
+    moderator = Moderator(temp)
+    def ratioH(incident, rng):
+        return moderator.ratio(rng.random(len(incident)), incident, 0, 0)
+
+    scatterU = scatteringMatrix(edges, grid, phi, table.column(2), ratioU, rng)
+    scatterH = scatteringMatrix(edges, grid, phi, table.column(4), ratioH, rng)
+
+    chi = groupIntegrals(grid, edges, promptNeutronPDF(grid))
+    fission = np.cumsum(chi/chi.sum())
+
+    return MultigroupLibrary(edges, energies, values, scatterU, scatterH, fission)
+
+
+multigroupLibraries = {}
+
+def multigroupLibrary(groups = 40, spectrum = None, temp = moderatorTemperature):
+    # The collapsed library for the given groups (a number of groups, or their edges), weighting spectrum (a function of energy in eV, by default weightingSpectrum at the moderator temperature) and moderator temperature.
+    if spectrum is None:
+        spectrum = lambda E: weightingSpectrum(E, temp)
+
+    edges = groupEdges(groups)
+    grid = integrationGrid(edges, distribution("crossSectionTable"))
+
+    hasher = hashlib.sha256()
+    hasher.update(F"{cacheVersion} {crossSectionHash()} {float(temp)} {groupSamples} {method}".encode())
+    hasher.update(edges.tobytes())
+    hasher.update(np.asarray(spectrum(grid), dtype=float).tobytes())
+    key = hasher.hexdigest()[:16]
+
+    if key in multigroupLibraries:
+        return multigroupLibraries[key]
+
+    path = os.path.join(cacheDirectory, F"multigroupLibrary_{key}")
+    if os.path.isdir(path):
+        library = MultigroupLibrary.load(path)
+    else:
+        library = buildMultigroupLibrary(edges, spectrum, temp)
+        try:
+            os.makedirs(cacheDirectory, exist_ok=True)
+            library.save(path)
+        except OSError:
+            pass
+
+    multigroupLibraries[key] = library
+    return library
+
+
+### 4. Building on first use
+
+# None of the distributions above are made when this file is imported. Instead, each is built the first time it is asked for (either as creatingDistribution.name or through "from creatingDistribution import name"), and is then stored as an ordinary variable of this file so that later uses cost nothing extra.
+
+lazyDistributions = {
+    "newPromptNeutronCDF": lambda: interPromptNeutronCDF(energies),
+    "crossSectionTable": makeCrossSectionTable,
+    "crossSections": makeCrossSections,
+    "eventTable": lambda: EventTable.fromCrossSections(distribution("crossSectionTable")),
+    "moderatorTable": makeModeratorTable,
+    "moderation": moderationAt,
+}
+
+def distribution(name):
+    if name not in globals():
+        globals()[name] = lazyDistributions[name]()
+    return globals()[name]
+
+def __getattr__(name):
+    if name in lazyDistributions:
+        return distribution(name)
+    raise AttributeError(F"module {__name__!r} has no attribute {name!r}")
 
 
 
 # This graph is not necessary to the simulation; it just shows the behaviour of the moderator distribution for a variety of temperatures. Extensions to the project would have me test this but time was up!! We assume a fixed reactor temperature, however the dependence we see here opens to the doors to implmeneting a moderator-temperature dependence, recreating the negative temperature coefficient which characterises the PWR.
 
 """
+import matplotlib.pyplot as plt
 temperatures = np.linspace(300, 750, 10)
 tempColours = ["brown","red", "orange", "gold", "green", "deepskyblue", "navy", "blueviolet", "violet", "deeppink"]
 #temperatures = np.logspace(-1,4, num=5, endpoint=False)
@@ -186,10 +646,11 @@ tempColours = ["brown","red", "orange", "gold", "green", "deepskyblue", "navy",
 x = np.arange(0.01, 0.99, 0.01)
 plt.figure(2)
 
+# The samplers for each temperature are interpolated from the moderator table, rather than built afresh.
 for temperature in temperatures:
-    
-    plt.plot(x, runModeratorCDF(temperature)[1](x), color=tempColours[np.where(temperatures == temperature)[0][0]])
-    plt.plot(x, runModeratorCDF(temperature)[0](x), color=tempColours[np.where(temperatures == temperature)[0][0]])
+    downScatter, upScatter = moderatorTable.samplers(temperature)
+    plt.plot(x, upScatter(x), color=tempColours[np.where(temperatures == temperature)[0][0]])
+    plt.plot(x, downScatter(x), color=tempColours[np.where(temperatures == temperature)[0][0]])
 plt.legend()
 plt.show()
 
@@ -24,7 +24,7 @@ lengthData = []
 
 # Creating the neutron list to be iterated over
 for i in range(testCount):
-    neutron = Neutron(name = F"neutron{i+1}")
+    neutron = Neutron(neutronId = i+1)
     neutronList.append(neutron)
 
 
@@ -0,0 +1,92 @@
+import numpy as np
+
+"""
+This class describes a bounded, heterogeneous 2-D reactor, in place of the infinite homogeneous mixture of fuel and water. The reactor is a rectangle, from (0, 0) to (width, height) in cm, divided into a regular grid of cells, each holding one material. Finding the material at a point is then a single index into the grid, however many regions the reactor has; curved boundaries (such as those of fuel pins) are followed as closely as the grid is fine.
+
+A material is given by the number densities of U235 and H-1 it holds, as multiples of those of the homogeneous mixture (N_U and N_H in creatingDistribution.py), so that its macroscopic cross sections are the columns of the cross-section table scaled accordingly. materials holds the three used here: the mixture itself, the UO2 fuel and the light water which make it up (61% water and 39% fuel by volume). Any other material may be given directly by its pair of multiples, such as (1.25, 1) for the mixture with fuel enriched to 5% U235 rather than 4%.
+
+Neutrons are tracked through the geometry by Woodcock delta tracking. Rather than stopping at every boundary between materials, each flight is sampled with the majorant cross section, the largest total cross section of any material at the neutron's energy. At the end of a flight the neutron has a real collision with probability sigma/majorant, where sigma is the total cross section of the material it has reached; otherwise the collision is virtual, and the neutron flies on in the same direction with the same energy. This gives exactly the distribution of collision sites of a neutron crossing every boundary, with only a lookup of the material at each collision. A neutron which flies out of the rectangle leaks from the reactor and is lost. A periodic geometry has no edges: it is tiled endlessly with copies of itself, so that a lattice of pins becomes an infinite lattice, and a block of a single material an infinite medium of it. Neutrons then never leak, and the material at any point is that at its position folded back into the rectangle.
+
+The majorant is precomputed on the energy grid of the cross-section table. Every cross section is linear in energy between two points of the grid, so the largest total cross section of any material at either end of an interval is a majorant over the whole interval.
+"""
+
+import creatingDistribution
+
+# The U235 and H-1 number densities of each material, as multiples of those of the homogeneous mixture.
+materials = {
+    "mixture": (1, 1),
+    "fuel": (1/0.39, 0),
+    "water": (0, 1/0.61),
+}
+
+
+class Geometry():
+    def __init__(self, materialGrid, cellSize, materialNames, periodic = False):
+
+        # materialGrid holds, for each cell, the index of its material in materialNames (a name from materials, or a pair of multiples). Cell (i, j) covers x from i*cellSize[0] and y from j*cellSize[1].
+        self.materialGrid = np.asarray(materialGrid, dtype=np.int64)
+        self.cellSize = np.asarray(cellSize, dtype=float)
+        self.materialNames = list(materialNames)
+        self.periodic = periodic
+
+        self.shape = self.materialGrid.shape
+        self.width = self.shape[0]*self.cellSize[0]
+        self.height = self.shape[1]*self.cellSize[1]
+
+        # The event table of every material (see creatingDistribution.EventTable) is held side by side in a single table, so that one lookup gives the values of all of them; each collision then takes the four columns of its own material.
+        table = creatingDistribution.crossSectionTable
+        tables = [creatingDistribution.EventTable.fromCrossSections(table, u, h) for u, h in (materials[name] if isinstance(name, str) else name for name in self.materialNames)]
+        self.eventTable = creatingDistribution.EventTable(table.energies, np.hstack([materialTable.values for materialTable in tables]))
+
+        self.energies = table.energies
+        nodes = self.eventTable.values[:,3::4].max(axis=1)
+        self.majorants = np.maximum(nodes[:-1], nodes[1:])
+
+
+    def inside(self, x, y):
+        if self.periodic:
+            return np.ones(np.shape(x), dtype=bool)
+        return (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+
+
+    def material(self, x, y):
+        # The index of the material at each point, for points inside the reactor. Folding a point just below zero can round it onto the far edge, so the cell indices are clamped to the grid.
+        if self.periodic:
+            x = np.mod(x, self.width)
+            y = np.mod(y, self.height)
+
+        if np.ndim(x) == 0:
+            return self.materialGrid[min(int(x/self.cellSize[0]), self.shape[0] - 1), min(int(y/self.cellSize[1]), self.shape[1] - 1)]
+
+        i = np.minimum((np.asarray(x)/self.cellSize[0]).astype(np.int64), self.shape[0] - 1)
+        j = np.minimum((np.asarray(y)/self.cellSize[1]).astype(np.int64), self.shape[1] - 1)
+        return self.materialGrid[i, j]
+
+
+    def majorant(self, energy):
+        index = np.searchsorted(self.energies, energy, side="right") - 1
+        return self.majorants[np.clip(index, 0, len(self.majorants) - 1)]
+
+
+    def eventValues(self, energy, material):
+        # The event-table values (F, F+C, T and T+H) of the given materials at the given energies, as eventTable.lookup gives them for the mixture.
+        values = self.eventTable.lookup(energy)
+        if np.ndim(energy) == 0:
+            return values[4*material:4*material + 4]
+        return values.reshape(len(values), len(self.materialNames), 4)[np.arange(len(values)), material]
+
+
+# A square lattice of cylindrical fuel pins in water, pins[0] by pins[1], with the given pitch and pin radius in cm (by default those of a typical PWR). Each pitch is divided into resolution cells in each direction, and a cell is fuel if its centre lies within a pin.
+def pinCellLattice(pins = (5,5), pitch = 1.26, radius = 0.41, resolution = 20, periodic = False):
+    cellSize = pitch/resolution
+    centres = (np.arange(resolution) + 0.5)*cellSize - pitch/2
+    pin = (centres[:,None]**2 + centres[None,:]**2 <= radius**2).astype(np.int64)
+
+    # Material 0 is fuel and 1 is water.
+    grid = np.tile(1 - pin, pins)
+    return Geometry(grid, (cellSize, cellSize), ["fuel", "water"], periodic)
+
+
+# A block of a single material, by default the homogeneous mixture: the same medium as the infinite reactor, but with leakage at its edges unless it is periodic.
+def homogeneous(width = 10, height = 10, material = "mixture", periodic = False):
+    return Geometry(np.zeros((1,1)), (width, height), [material], periodic)
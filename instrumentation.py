@@ -0,0 +1,107 @@
+import numpy as np
+import os
+import sys
+import time
+import resource
+
+"""
+This class collects the statistics of an instrumented reactor run, made with Reactor(..., instrument=True), to show where the time of a run goes. The reactor gives it to its neutrons (or population), and each part of the step loop adds the time it took to a named phase:
+
+- crossSection: looking up the cross sections of the neutrons' energies.
+- transport: sampling each neutron's direction and step length, and moving it.
+- event: choosing the event which ends the step and carrying it out, including the sampling of scattered and prompt neutron energies.
+- trajectory: writing the step to a trajectory store.
+- fissionNeutrons: creating the neutrons produced by fission.
+- bookkeeping: counting events, collecting the energies of the step, and compacting the active set.
+- populationControl, weightWindow, tallies, output and checkpoint: the work of the reactor at the end of each step.
+
+Random numbers are drawn throughout the step, so their cost is counted in the phase which draws them. The timers are laps of time.perf_counter, each costing well under a microsecond, and are only taken when the run is instrumented; a reactor without instrumentation takes no timings.
+
+At the end of every step, the wall time of the step, the live population, the resident memory of the process and the number of each event in the step (fission, capture, scatterU, scatterH, cutoff for the neutrons removed below 1e-5eV, leak for those which left a bounded geometry, and roulette for those killed by Russian roulette) are recorded. All of this may be had as a dictionary of arrays from arrays(), or as a printed report from summary().
+"""
+
+# The events in the order of Reactor.eventCounts.
+from neutronPopulation import countNames as eventNames
+
+
+def residentMemory():
+    # The current resident memory of the process in MiB. This is read from /proc where it exists; elsewhere the peak resident memory is the best available.
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1])*os.sysconf("SC_PAGE_SIZE")/2**20
+    except OSError:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak/2**20 if sys.platform == "darwin" else peak/2**10
+
+
+class RunStats():
+    def __init__(self):
+        self.phaseTime = {}
+        self.phaseCalls = {}
+
+        self.stepTime = []
+        self.population = []
+        self.memory = []
+        self.events = []
+
+        self.stepStart = None
+        self.lastEvents = np.zeros(len(eventNames), dtype=np.int64)
+
+
+    def lap(self, name, start):
+        # Adds the time since start to the named phase, returning the time now so that the next phase may begin from it. With no start, only the time is returned.
+        now = time.perf_counter()
+        if start is not None:
+            self.phaseTime[name] = self.phaseTime.get(name, 0) + now - start
+            self.phaseCalls[name] = self.phaseCalls.get(name, 0) + 1
+        return now
+
+
+    def beginStep(self):
+        self.stepStart = time.perf_counter()
+
+
+    def endStep(self, population, eventCounts):
+        # Records a finished step, given the live population and the running total of each event over the run.
+        eventCounts = np.array([eventCounts[name] for name in eventNames], dtype=np.int64)
+
+        self.stepTime.append(time.perf_counter() - self.stepStart)
+        self.population.append(population)
+        self.memory.append(residentMemory())
+        self.events.append(eventCounts - self.lastEvents)
+        self.lastEvents = eventCounts
+
+
+    def arrays(self):
+        return {
+            "phaseTime": dict(self.phaseTime),
+            "phaseCalls": dict(self.phaseCalls),
+            "stepTime": np.array(self.stepTime),
+            "population": np.array(self.population, dtype=np.int64),
+            "memory": np.array(self.memory),
+            "events": {name: np.array(self.events, dtype=np.int64).reshape(-1, len(eventNames))[:,i] for i, name in enumerate(eventNames)},
+        }
+
+
+    def summary(self):
+        # A report of the run: the time spent in each phase, the events, and the population and memory over the steps.
+        total = sum(self.stepTime)
+        events = np.sum(self.events, axis=0) if self.events else np.zeros(len(eventNames), dtype=np.int64)
+        collisions = events[:4].sum()
+
+        lines = [F"{len(self.stepTime)} steps in {total:.3f}s ({total/max(len(self.stepTime), 1)*1e3:.3f}ms per step, {collisions/total if total else 0:.0f} collisions per second)", ""]
+
+        lines.append(F"{'phase':<20}{'seconds':>10}{'share':>8}{'calls':>12}")
+        for name, seconds in sorted(self.phaseTime.items(), key = lambda item: -item[1]):
+            lines.append(F"{name:<20}{seconds:>10.3f}{seconds/total if total else 0:>8.1%}{self.phaseCalls[name]:>12}")
+        untimed = total - sum(self.phaseTime.values())
+        lines.append(F"{'(untimed)':<20}{untimed:>10.3f}{untimed/total if total else 0:>8.1%}")
+
+        lines.append("")
+        lines.append("events: " + ", ".join(F"{name} {count}" for name, count in zip(eventNames, events)))
+
+        if self.population:
+            lines.append(F"population: first {self.population[0]}, last {self.population[-1]}, max {max(self.population)}")
+            lines.append(F"memory: first {self.memory[0]:.1f}MiB, last {self.memory[-1]:.1f}MiB, max {max(self.memory):.1f}MiB")
+
+        return "\n".join(lines)
@@ -0,0 +1,157 @@
+import numpy as np
+
+"""
+This class tallies where in the reactor events happen, over a regular 2-D mesh of cells, in place of plotting the trajectory of every neutron. It is given to the reactor as Reactor(..., mesh=MeshTally()) and covers the reactor dimensions, unless another extent ((xMin, xMax), (yMin, yMax)) is given. Each step, the tracks of all the neutrons which moved are scored at once, with np.bincount over the flattened cell index, so the memory used depends only on the number of cells.
+
+Three quantities are accumulated in each cell, weighted by the neutrons' statistical weights:
+
+- collisions: the number of steps ending in the cell. Every step ends in an event, so this is the collision density.
+- fissions: the number of steps ending in a fission in the cell.
+- trackLength: the length of track lying within the cell. Its sum over the run, divided by the area of the cell, is the track-length estimate of the flux (integrated over time).
+
+A track is cut at every grid line it crosses, so the length in each cell is exact. The medium is infinite, so parts of tracks lying outside the extent, and events outside it, are not scored.
+"""
+
+
+class MeshTally():
+    def __init__(self, shape = (50,50), extent = None):
+        self.shape = tuple(shape)
+        self.collisions = np.zeros(self.shape)
+        self.fissions = np.zeros(self.shape)
+        self.trackLength = np.zeros(self.shape)
+
+        self.extent = None
+        if extent is not None:
+            self.setExtent(extent)
+
+
+    def setExtent(self, extent):
+        # The reactor gives a mesh without an extent its dimensions, [x, y], which are taken as (0, x) and (0, y).
+        extent = [limits if np.ndim(limits) else (0, limits) for limits in extent]
+        self.extent = np.array(extent, dtype=float)
+
+        self.edgesX = np.linspace(*self.extent[0], self.shape[0] + 1)
+        self.edgesY = np.linspace(*self.extent[1], self.shape[1] + 1)
+        self.cellSize = np.diff(self.extent, axis=1)[:,0]/self.shape
+
+
+    def cellIndex(self, x, y):
+        # The flattened index of the cell holding each point, with -1 for points outside the extent.
+        i = np.floor((x - self.extent[0,0])/self.cellSize[0]).astype(np.int64)
+        j = np.floor((y - self.extent[1,0])/self.cellSize[1]).astype(np.int64)
+        inside = (i >= 0) & (i < self.shape[0]) & (j >= 0) & (j < self.shape[1])
+        return np.where(inside, i*self.shape[1] + j, -1)
+
+
+    def addTo(self, tally, index, weights):
+        inside = index >= 0
+        tally += np.bincount(index[inside], weights[inside], minlength=tally.size).reshape(self.shape)
+
+
+    def score(self, x0, y0, x1, y1, weights, fission, fissionWeights = None):
+        # Scores one step: the tracks from (x0, y0) to (x1, y1) of every neutron which moved, their weights, and whether each ended in fission. With implicit capture (see varianceReduction.py) a neutron's weight is reduced at its collision, so a fission is scored with the reduced weight, given as fissionWeights.
+        x0, y0, x1, y1 = (np.asarray(values, dtype=float) for values in (x0, y0, x1, y1))
+        weights = np.broadcast_to(np.asarray(weights, dtype=float), x0.shape)
+        fission = np.asarray(fission, dtype=bool)
+
+        end = self.cellIndex(x1, y1)
+        self.addTo(self.collisions, end, weights)
+        if fissionWeights is None:
+            fissionWeights = weights
+        else:
+            fissionWeights = np.broadcast_to(np.asarray(fissionWeights, dtype=float), x0.shape)
+
+        self.addTo(self.fissions, end[fission], fissionWeights[fission])
+        self.scoreTracks(x0, y0, x1, y1, weights)
+
+
+    def scoreTracks(self, x0, y0, x1, y1, weights):
+        dx = x1 - x0
+        dy = y1 - y0
+        length = np.hypot(dx, dy)
+
+        # Each track is first clipped to the extent (by the Liang-Barsky method), as the part of the track [tStart, tEnd] of its length lying inside.
+        tStart = np.zeros(len(x0))
+        tEnd = np.ones(len(x0))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for p, q in ((-dx, x0 - self.extent[0,0]), (dx, self.extent[0,1] - x0), (-dy, y0 - self.extent[1,0]), (dy, self.extent[1,1] - y0)):
+                t = q/p
+                tStart = np.where(p < 0, np.maximum(tStart, t), tStart)
+                tEnd = np.where(p > 0, np.minimum(tEnd, t), tEnd)
+                tEnd = np.where((p == 0) & (q < 0), -1, tEnd)
+
+        keep = (tEnd > tStart) & (length > 0)
+        if not np.any(keep):
+            return
+
+        x0, y0, dx, dy, length, weights = x0[keep], y0[keep], dx[keep], dy[keep], length[keep], weights[keep]
+        tStart, tEnd = tStart[keep], tEnd[keep]
+
+        # The track is cut wherever it crosses a grid line. In units of cells, these are the integers lying strictly between the coordinates of its (clipped) ends.
+        track = np.arange(len(x0))
+        cuts = [tStart, tEnd]
+        owners = [track, track]
+
+        for start, delta, low, size in ((x0, dx, self.extent[0,0], self.cellSize[0]), (y0, dy, self.extent[1,0], self.cellSize[1])):
+            a = (start + tStart*delta - low)/size
+            b = (start + tEnd*delta - low)/size
+            first = np.floor(np.minimum(a, b)) + 1
+            count = np.maximum(np.ceil(np.maximum(a, b)) - first, 0).astype(np.int64)
+
+            owner = np.repeat(track, count)
+            offset = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+            line = first[owner] + offset
+
+            cuts.append(tStart[owner] + (line - a[owner])*(tEnd - tStart)[owner]/(b - a)[owner])
+            owners.append(owner)
+
+        cuts = np.concatenate(cuts)
+        owners = np.concatenate(owners)
+        order = np.lexsort((cuts, owners))
+        cuts = cuts[order]
+        owners = owners[order]
+
+        # Consecutive cuts of the same track bound a piece lying within a single cell, found from its midpoint.
+        same = owners[1:] == owners[:-1]
+        owner = owners[1:][same]
+        middle = (cuts[1:] + cuts[:-1])[same]/2
+        pieceLength = (cuts[1:] - cuts[:-1])[same]*length[owner]
+
+        index = self.cellIndex(x0[owner] + middle*dx[owner], y0[owner] + middle*dy[owner])
+        self.addTo(self.trackLength, index, pieceLength*weights[owner])
+
+
+    def cellArea(self):
+        return self.cellSize[0]*self.cellSize[1]
+
+    # The tallies per unit area of each cell.
+    def collisionDensity(self):
+        return self.collisions/self.cellArea()
+
+    def fissionDensity(self):
+        return self.fissions/self.cellArea()
+
+    def flux(self):
+        return self.trackLength/self.cellArea()
+
+
+    # The accumulators, as saved in a checkpoint (see checkpoint.py).
+    def state(self):
+        return {"collisions": self.collisions, "fissions": self.fissions, "trackLength": self.trackLength, "extent": self.extent}
+
+    def restore(self, state):
+        self.shape = np.shape(state["collisions"])
+        self.setExtent(state["extent"])
+        self.collisions = np.array(state["collisions"])
+        self.fissions = np.array(state["fissions"])
+        self.trackLength = np.array(state["trackLength"])
+
+    # The tallies as a dictionary of arrays, in the form they are saved by runFormat.py.
+    def arrays(self):
+        return {
+            "meshEdgesX": self.edgesX,
+            "meshEdgesY": self.edgesY,
+            "meshCollisions": self.collisions,
+            "meshFissions": self.fissions,
+            "meshTrackLength": self.trackLength,
+        }
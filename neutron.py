@@ -1,4 +1,3 @@
-from random import seed
 import numpy as np
 import math 
 
@@ -6,27 +5,63 @@ import math
 """This class creates an instance of the neutron, with a randomised starting position and fixed thermal energy (0.025) to ensure the recactor is super-critcal for low initial neutron counts. Neutron motion is characterised by a random walk, under the assumption that the particles are perfectly point like and moving in a homogeneous medium."""
 
 
-# Importing the distributions for prompt neutron energy, cross sections, and moderation energy.
-from creatingDistribution import newPromptNeutronCDF, crossSections, moderation
+# Importing the distributions for prompt neutron energy, cross sections, and moderation energy. These are used as creatingDistribution.name so that each is only built when a neutron first needs it, rather than when this file is imported.
+import creatingDistribution
+
+# Every random number a neutron draws comes from its own generator, rng. By default this is defaultRng, a single generator shared by all neutrons and seeded for repeatable runs; a reactor may instead give its neutrons a numpy Generator of its own (see batchRunner.py), so that independent runs draw independent streams without touching numpy's global random state.
+defaultRng = np.random.RandomState(3)
+
+# The legacy RandomState and the newer Generator name their integer functions differently.
+def randomIntegers(rng, low, high, size = None):
+    if hasattr(rng, "integers"):
+        return rng.integers(low, high, size)
+    return rng.randint(low, high, size)
+
+# The events chosen by the event table, in its order, with the method carrying out each.
+eventTypes = ("fission", "capture", "scatterU", "scatterH")
+eventMethods = ("fissionEvent", "captureEvent", "scatterEventU", "scatterEventH")
 
 # All values are intialised in SI units, with energy in eV. Position is tracked in cm and hence velocities and speeds are given in cm/s, as is convention for reactor physics.
+
+# A reactor creates a neutron for every fission product, most of which live for only a few steps, so a neutron is kept small: its attributes are held in __slots__ rather than a dictionary of its own, its position is a pair of floats, and it is known by an integer id (and the id of the neutron whose fission produced it, with 0 for the neutrons the reactor starts with) rather than by a name.
 class Neutron():
+    __slots__ = (
+        "id", "parentId", "rng", "energy", "time", "speed", "eventType", "eventCount", "x", "y", "angle", "sample",
+        "trajectory", "posDataX", "posDataY", "energyData", "absorbed", "stats", "moderator", "geometry", "weight", "newNeutronEnergies",
+        "multigroup", "group", "implicitCapture",
+    )
+
     def __init__(
         self,       
-        name = "neutron",
-        parent = "reactor",
         energy = 0.025,
         time = 0, 
-        
-        startPos = np.array([0,0], dtype=float),
-        startVel = np.array([0,0], dtype=float),
-
+        startPos = (0, 0),
         eventCount = 0,
-        absorbed = False
+        absorbed = False,
+        weight = 1.0,
+        neutronId = 0,
+        parentId = 0,
+        trajectory = None,
+        rng = None,
+        stats = None,
+        moderator = None,
+        geometry = None,
+        multigroup = None,
+        implicitCapture = False,
+        keepPath = True
         ):
 
-        self.name = name
-        self.parent = parent
+        self.id = neutronId
+        self.parentId = parentId
+        self.rng = defaultRng if rng is None else rng
+
+        # In the multigroup mode (see creatingDistribution.MultigroupLibrary) a neutron is transported in its energy group, and is given the energy representing the group.
+        self.multigroup = multigroup
+        self.group = None
+        if multigroup is not None:
+            self.group = multigroup.groupOf(energy)
+            energy = float(multigroup.energies[self.group])
+
         self.energy = energy
         self.time = time
         self.speed = self.energySpeed() 
@@ -34,36 +69,96 @@ class Neutron():
         self.eventType = None
         self.eventCount = eventCount
         
-        self.pos = np.array(startPos, dtype=float)
-        self.vel = np.array(startVel, dtype=float)
+        self.x = float(startPos[0])
+        self.y = float(startPos[1])
+
+        # The neutron's history is held in its own lists, unless a trajectory store (see trajectoryStore.py) is given; it is then written to the store under the neutron's id, and the lists are not kept. A reactor which does not keep its finished neutrons has no use for their paths, and creates them without lists (keepPath = False).
+        self.trajectory = trajectory
+
+        if trajectory is None and keepPath:
+            self.posDataX = [self.x]
+            self.posDataY = [self.y]
+            self.energyData = []
+        else:
+            self.posDataX = self.posDataY = self.energyData = None
 
-        self.posDataX = [self.pos[0]]
-        self.posDataY = [self.pos[1]]
-    
-        self.energyData = []
         self.absorbed = absorbed
 
+        # If the reactor is instrumented, the time of each part of a step is added to its statistics (see instrumentation.py).
+        self.stats = stats
+
+        # The moderator is at the default temperature unless the reactor gives another (see creatingDistribution.Moderator).
+        self.moderator = moderator
+
+        # Without a geometry the neutron moves through an infinite homogeneous mixture; with one it is tracked through its materials, and may leak from its edges (see geometry.py).
+        self.geometry = geometry
+
+        # The statistical weight of the neutron. This is one unless the reactor applies population control, which may split a neutron into copies of lower weight or kill neutrons and raise the weight of the rest.
+        self.weight = weight
+
+        # With implicit capture the neutron is never captured; its weight is reduced at each collision instead (see varianceReduction.py).
+        self.implicitCapture = implicitCapture
+
         self.sample = 0
         self.angle = 0
+        self.newNeutronEnergies = None
 
 
-    # Sets a random seed
-    np.random.seed(3)
+    # The name, position and velocity of the neutron, found when they are asked for rather than stored with it.
+    @property
+    def name(self):
+        return F"neutron{self.id}"
+
+    @property
+    def pos(self):
+        return np.array([self.x, self.y])
+
+    @property
+    def vel(self):
+        return self.speed*np.array([np.cos(self.angle), np.sin(self.angle)])
 
 
 # Sets the position of a neutron within set of dimensions. This is determined in the reactor class and called through this function during initialisation.
     def setPosition(self, dimensionX = 10, dimensionY = 10):
-        self.pos[0] = np.random.uniform(0, dimensionX)
-        self.pos[1] = np.random.uniform(0, dimensionY)
+        self.x = self.rng.uniform(0, dimensionX)
+        self.y = self.rng.uniform(0, dimensionY)
         #self.vel[0] = np.random.uniform(0,10)
         #self.vel[1] = np.random.uniform(0,10)
-        self.posDataX = [self.pos[0]]
-        self.posDataY = [self.pos[1]]
+        if self.posDataX is not None:
+            self.posDataX = [self.x]
+            self.posDataY = [self.y]
+
+
+    # Records the starting point of the neutron's walk in the trajectory store, once it has been placed. Neutrons keeping their own lists begin them on creation, so this does nothing for them.
+    def startTrajectory(self):
+        if self.trajectory is not None:
+            self.trajectory.record(self.id, self.x, self.y, self.energy, 0)
+
+
+    # Returns an independent copy of the neutron in its current state, including its preset angle and its history, for use when population control splits it.
+    def split(self, neutronId = 0):
+        copy = Neutron.__new__(Neutron)
+        for name in Neutron.__slots__:
+            setattr(copy, name, getattr(self, name))
+
+        copy.id = neutronId
+
+        if self.posDataX is not None:
+            copy.posDataX = list(self.posDataX)
+            copy.posDataY = list(self.posDataY)
+            copy.energyData = list(self.energyData)
+
+        return copy
+
+
+    def setGroup(self, group):
+        self.group = group
+        self.energy = float(self.multigroup.energies[group])
 
 
     # The functions which follow sample a random angle, and calculate the speed of a neutron. The speed conversion takes energies in eV and outputs speeds in cm/s.
     def randomDirection(self):
-        return np.random.uniform(0, 2*math.pi)
+        return self.rng.uniform(0, 2*math.pi)
 
     def energySpeed(self):
         return 1.38e6*self.energy**(1/2)
@@ -75,78 +170,122 @@ class Neutron():
         # We first check that our neutron is in the computational range; if its energy falls too low it may no longer participate in the random walk. 
         if self.energy > 1e-5:
 
-            # We calculate the total macroscopic cross-section corresponding to a neutrons energy: the sum of total U235 and H-1 cross-sections scaled to desired proportions.
-            sigma = crossSections[3](self.energy) + crossSections[4](self.energy)
+            stats = self.stats
+            if stats is not None:
+                start = stats.lap(None, None)
+
+            # We calculate the total macroscopic cross-section corresponding to a neutrons energy: the sum of total U235 and H-1 cross-sections scaled to desired proportions. It comes from a single lookup of the event table, together with the cumulative cross sections which choose the event, and these are passed on so they need not be found again. In a heterogeneous geometry they depend on where the neutron collides, and are found by deltaTrack instead.
+            if self.geometry is None:
+                crossSectionValues = self.setCrossSection()
+                sigma = crossSectionValues[3]
+
+            if stats is not None:
+                start = stats.lap("crossSection", start)
 
             # If a neutron's previous step was a scatter, it will already have a new angle characterising its next step since this is required to define the change in energy brought about by the scattering.
             if self.eventType != "scatterU":
                 self.angle = self.randomDirection()
             
-            self.sample = np.random.exponential(scale = (1/sigma))
             self.speed = self.energySpeed()
 
-            # The neutron's position and velocity is updated and so are the corresponding histories.
-            self.pos[0] = self.pos[0] + self.sample*np.cos(self.angle) 
-            self.pos[1] = self.pos[1] + self.sample*np.sin(self.angle)
-        
-            self.vel[0] = self.speed*np.cos(self.angle) 
-            self.vel[1] = self.speed*np.sin(self.angle)
+            # The neutron's position is updated and so are the corresponding histories; its velocity follows from its speed and angle.
+            if self.geometry is None:
+                self.sample = self.rng.exponential(scale = (1/sigma))
+                self.x = self.x + self.sample*np.cos(self.angle) 
+                self.y = self.y + self.sample*np.sin(self.angle)
+            else:
+                crossSectionValues = self.deltaTrack()
 
-            self.posDataX.append(self.pos[0])
-            self.posDataY.append(self.pos[1])
+            if self.posDataX is not None:
+                self.posDataX.append(self.x)
+                self.posDataY.append(self.y)
 
-            # Since a particle's energy is characterised by its previous step, we only now update it's energy list.
-            self.energyData.append(self.energy)
+                # Since a particle's energy is characterised by its previous step, we only now update it's energy list.
+                self.energyData.append(self.energy)
+
+            stepEnergy = self.energy
     
             self.time += self.sample/self.speed
+
+            if stats is not None:
+                start = stats.lap("transport", start)
             
             # This takes our new parameters and 
-            self.chooseEvent()
+            if crossSectionValues is None:
+                self.leakEvent()
+            else:
+                self.chooseEvent(crossSectionValues)
+
+            if stats is not None:
+                start = stats.lap("event", start)
+
+            # A store records the step together with the event which ended it.
+            if self.trajectory is not None:
+                self.trajectory.record(self.id, self.x, self.y, stepEnergy, self.eventType)
+
+                if stats is not None:
+                    stats.lap("trajectory", start)
         
         else:
             self.absorbed = True
 
 
-    def setCrossSection(self):
-        # This function iterates over the list of cross-section functions corresponding to different reactor events, calculating the values for a given energy.
-
-        tempCrossSections = []
+    def deltaTrack(self):
+        # Moves the neutron to its next real collision in the reactor geometry by Woodcock delta tracking (see geometry.py), returning the event-table values of the material there, or None if the neutron leaves the reactor first. The flights between virtual collisions are in a straight line, so the whole distance travelled is the step length.
+        geometry = self.geometry
+        majorant = geometry.majorant(self.energy)
+        cos = np.cos(self.angle)
+        sin = np.sin(self.angle)
+        self.sample = 0
 
-        for function in crossSections:
-            tempCrossSections.append(function(self.energy))
-        
-        return tempCrossSections    
+        while True:
+            flight = self.rng.exponential(scale = (1/majorant))
+            self.sample += flight
+            self.x = self.x + flight*cos
+            self.y = self.y + flight*sin
 
+            if not geometry.inside(self.x, self.y):
+                return None
 
-    def chooseEvent(self):
-        # This method is triggered following a random step; it chooses a neutron event based on probabilties created by a neutron's cross-section.
-        
-        self.eventCount += 1
-        
-        num = np.random.random()
+            crossSectionValues = geometry.eventValues(self.energy, geometry.material(self.x, self.y))
+            if self.rng.random()*majorant < crossSectionValues[3]:
+                return crossSectionValues
 
-        # Unpacking the calculated cross-section values: fission, capture, U-scattering, total U and H-scattering respectively. A random number decides the event based upon weighted probabilties given by these cross-sectopms. A method correspondong to the chosen event is triggered.
-        F,C,S,T,H = self.setCrossSection() 
 
-        if 0 <= num < F/(T+H):
-            self.eventType = "fission"
+    def leakEvent(self):
+        # A neutron leaving a bounded reactor is lost, as if absorbed.
+        self.eventCount += 1
+        self.eventType = "leak"
+        self.absorbed = True
 
-            self.fissionEvent()
 
-        elif F/(T+H) <= num < (F+C)/(T+H):
-            self.eventType = "capture"
+    def setCrossSection(self):
+        # This function looks up the cross-sections corresponding to different reactor events for the neutron's energy. The event table (see creatingDistribution.py) holds them on one energy grid as the cumulative sums F, F+C, T and the total T+H, so they are found together with a single search. In the multigroup mode they are simply the row of the neutron's group.
+        if self.multigroup is not None:
+            return self.multigroup.eventValues[self.group]
+        return creatingDistribution.eventTable.lookup(self.energy)
 
-            self.captureEvent()
 
-        elif (F+C)/(T+H) <= num < (F+C+S)/(T+H):
-            self.eventType = "scatterU"
+    def chooseEvent(self, crossSectionValues = None):
+        # This method is triggered following a random step; it chooses a neutron event based on probabilties created by a neutron's cross-section. The cross-sections found during the step may be passed in; otherwise they are looked up.
+        
+        self.eventCount += 1
+        
+        num = self.rng.random()
 
-            self.scatterEventU()
+        if crossSectionValues is None:
+            crossSectionValues = self.setCrossSection()
 
-        # We coose else rather than a final elif here to ensure the probabilities of each event occuring sum to one, accounting for rounding errors.
-        else: 
-            self.eventType = "scatterH"
-            self.scatterEventH()
+        # A random number decides the event based upon weighted probabilties given by the cross-sections: the event table finds which of the cumulative thresholds it lies between, and the method corresponding to the chosen event is triggered. A number beyond the last threshold is always a hydrogen scatter, so the probabilities of the events sum to one, accounting for rounding errors.
+        if self.implicitCapture:
+            # The neutron survives the collision with its weight reduced by the capture probability, and the event is chosen from the others.
+            F, FC, T, total = crossSectionValues.tolist()
+            self.weight *= 1 - (FC - F)/total
+            event = creatingDistribution.eventTable.chooseSurvival(crossSectionValues, num)
+        else:
+            event = creatingDistribution.eventTable.choose(crossSectionValues, num)
+        self.eventType = eventTypes[event]
+        getattr(self, eventMethods[event])()
         
 
     def captureEvent(self):
@@ -156,18 +295,25 @@ class Neutron():
         
         # This function chooses the number of prompt neutrons produced in a fission event and assigns them an energy, characterised by the prompt neutron distribution.
         self.absorbed = True  
-        self.newNeutronEnergies = []
 
-        # We create a list of new neutron energies as ab object variable, so we can assign the correct parent and position to these new neutrons.
-        for i in range(np.random.randint(1,3)):
-            rand = np.random.random()
-            self.newNeutronEnergies.append(newPromptNeutronCDF(rand))
+        # We create a list of new neutron energies as ab object variable, so the reactor can bank them with the position and id of their parent. The energies are drawn together from the prompt neutron sampler.
+        count = randomIntegers(self.rng, 1, 3)
+        if self.multigroup is not None:
+            self.newNeutronEnergies = list(self.multigroup.energies[self.multigroup.fissionGroups(self.rng.random(count))])
+        else:
+            self.newNeutronEnergies = list(creatingDistribution.newPromptNeutronCDF.sample(count, self.rng))
 
 
     def scatterEventU(self):
         # In order to know the energy of the neutron as a consequence of scattering, we must preemptively set a new, randomly generated angle. This angle will characterise its next step in the walk: it will NOT be regenerated at the next step.
 
         self.angle = self.randomDirection()
+
+        # In the multigroup mode the outgoing group is sampled from the scattering matrix instead, independently of the angle.
+        if self.multigroup is not None:
+            self.setGroup(self.multigroup.scatter("U", self.group, self.rng.random()))
+            return
+
         alpha = (234/236)**2
         ratio = (1/2)*(1 + alpha + (1-alpha)*np.cos(self.angle))
         self.energy = ratio*self.energy
@@ -176,12 +322,18 @@ class Neutron():
     def scatterEventH(self):
 
         # moderation gives a list of four functions characterising interpolated down and up-scattering. We enact function corresponding to a particle's energy: for lower-energy neutrons in the thermal range we implement up-scattering; for high-energy neutrons we implement downscattering. We assume the reactor T = 600 and take the threshold energy to be approx kT.
-        rand = np.random.random()
-    
-        if self.energy < 0.05:
-            ratio = moderation[1](rand) 
+        rand = self.rng.random()
+
+        if self.multigroup is not None:
+            self.setGroup(self.multigroup.scatter("H", self.group, rand))
+            return
+
+        if self.moderator is not None:
+            ratio = self.moderator.ratio(rand, self.energy, self.x, self.y)
+        elif self.energy < 0.05:
+            ratio = creatingDistribution.moderation[1](rand) 
         else:
-            ratio = moderation[0](rand)
+            ratio = creatingDistribution.moderation[0](rand)
 
         self.energy = ratio*self.energy
 
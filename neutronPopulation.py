@@ -0,0 +1,418 @@
+import numpy as np
+import math
+
+"""This class holds an entire population of neutrons as a structure of arrays, rather than a list of neutron objects. Each neutron is an index into the arrays x, y, energy, angle, time, alive and eventCount, such that a step of the random walk can be evaluated for every live neutron at once.
+
+The physics of a step is identical to that of Neutron.randomStep and Neutron.chooseEvent: an exponentially distributed step length given by the total macroscopic cross-section, a uniformly distributed angle (unless the previous event was a uranium scatter, which sets the next angle), and an event chosen from the weighted cross-sections. Only the order in which random numbers are drawn differs, so results agree with the neutron class statistically rather than number for number.
+
+The step is event-based rather than history-based. Where a neutron object branches into the method for its own event, the population first samples the event of every moving neutron, then sorts them into one queue per event, and carries out each event for its whole queue at once: captureEvent, scatterEventU, scatterEventH and fissionEvent correspond to the methods of the neutron class, each taking the indices of its queue.
+"""
+
+# Importing the distributions for prompt neutron energy, cross sections, and moderation energy; as in the neutron class, they are built on first use.
+import creatingDistribution
+from neutron import defaultRng, randomIntegers
+
+# Integer codes for the event which terminated a neutron's last step; eventNames maps these back to the strings used by the neutron class.
+NONE = 0
+FISSION = 1
+CAPTURE = 2
+SCATTER_U = 3
+SCATTER_H = 4
+LEAK = 5
+
+eventNames = [None, "fission", "capture", "scatterU", "scatterH", "leak"]
+
+# The names of the entries of eventCounts: the events which end a step in the infinite medium, the neutrons removed at the energy cutoff, the neutrons which leak from a bounded geometry, and the neutrons killed by Russian roulette (see varianceReduction.py).
+countNames = ["fission", "capture", "scatterU", "scatterH", "cutoff", "leak", "roulette"]
+ROULETTE = countNames.index("roulette")
+
+
+class NeutronPopulation():
+
+    # The names of the per-neutron arrays, in the order they are grown and copied.
+    fields = ("id", "x", "y", "energy", "angle", "time", "weight", "alive", "eventCount", "eventType")
+
+    def __init__(self, capacity = 1024, trajectory = None, mesh = None, rng = None, stats = None, moderator = None, geometry = None, multigroup = None, implicitCapture = False):
+
+        self.size = 0
+        self.capacity = 0
+
+        # Every neutron is given an integer id in order of creation, starting from 1 as for the names of the neutron class. If a trajectory store is given, each neutron's starting point and every step are written to it.
+        self.createdCount = 0
+        self.trajectory = trajectory
+
+        # If a mesh tally is given, the track of every step is scored in it (see meshTally.py).
+        self.mesh = mesh
+
+        # If the reactor is instrumented, the time of each part of a step is added to its statistics (see instrumentation.py).
+        self.stats = stats
+
+        # The moderator is at the default temperature unless another is given (see creatingDistribution.Moderator).
+        self.moderator = moderator
+
+        # Neutrons move through an infinite homogeneous mixture unless a geometry is given, when they are tracked through its materials by delta tracking and may leak from it (see geometry.py).
+        self.geometry = geometry
+
+        # In the multigroup mode (see creatingDistribution.MultigroupLibrary) every energy is that representing its group, and the group of each neutron is found from its energy when it steps.
+        self.multigroup = multigroup
+
+        # With implicit capture no neutron is captured; each has its weight reduced at its collision instead (see varianceReduction.py). The energies of the neutrons which collided in the last step and the weights taken from them are kept as capturedEnergy and capturedWeight, for the reactor to score.
+        self.implicitCapture = implicitCapture
+        self.capturedEnergy = np.empty(0)
+        self.capturedWeight = np.empty(0)
+
+        # As for the neutron class, random numbers come from the shared default generator unless one is given.
+        self.rng = defaultRng if rng is None else rng
+
+        # The number of each event (fission, capture, scatterU, scatterH), followed by the number of neutrons removed at the energy cutoff, the number which leaked and the number killed by roulette, over every step taken, named as in countNames.
+        self.eventCounts = np.zeros(len(countNames), dtype=np.int64)
+
+        self.id = np.empty(0, dtype=np.int64)
+        self.x = np.empty(0, dtype=float)
+        self.y = np.empty(0, dtype=float)
+        self.energy = np.empty(0, dtype=float)
+        self.angle = np.empty(0, dtype=float)
+        self.time = np.empty(0, dtype=float)
+        self.weight = np.empty(0, dtype=float)
+        self.alive = np.empty(0, dtype=bool)
+        self.eventCount = np.empty(0, dtype=np.int64)
+        self.eventType = np.empty(0, dtype=np.int8)
+
+        self.grow(capacity)
+
+
+    def __len__(self):
+        return self.size
+
+
+    # The arrays are over-allocated and doubled when full, so that adding the neutrons produced in a step costs amortised constant time per neutron rather than a copy of the whole population.
+    def grow(self, required):
+        if required <= self.capacity:
+            return
+
+        newCapacity = max(required, 2*self.capacity)
+
+        for name in self.fields:
+            old = getattr(self, name)
+            new = np.zeros(newCapacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+        self.capacity = newCapacity
+
+
+    def addNeutrons(self, x, y, energy, weight = 1.0):
+        # New neutrons begin with no time elapsed, no events and no preset angle.
+        count = len(energy)
+        self.grow(self.size + count)
+
+        new = slice(self.size, self.size + count)
+        self.id[new] = np.arange(self.createdCount + 1, self.createdCount + count + 1)
+        self.x[new] = x
+        self.y[new] = y
+        self.energy[new] = energy
+        if self.multigroup is not None:
+            self.energy[new] = self.multigroup.energies[self.multigroup.groupOf(self.energy[new])]
+        self.angle[new] = 0
+        self.time[new] = 0
+        self.weight[new] = weight
+        self.alive[new] = True
+        self.eventCount[new] = 0
+        self.eventType[new] = NONE
+
+        self.size += count
+        self.createdCount += count
+
+        if self.trajectory is not None:
+            self.trajectory.append(self.id[new], self.x[new], self.y[new], self.energy[new], NONE)
+
+
+    # Copies the neutrons at the given indices of another population (all of them, if no indices are given) onto the end of this one, keeping their full state.
+    def extend(self, source, index = None):
+        if index is None:
+            index = np.arange(source.size)
+
+        count = len(index)
+        self.grow(self.size + count)
+
+        for name in self.fields:
+            getattr(self, name)[self.size:self.size + count] = getattr(source, name)[index]
+
+        self.size += count
+
+
+    # Removes finished neutrons from the population, so that the arrays only hold live neutrons and every step costs time in proportion to those alone. The live neutrons keep their relative order. Finished neutrons are copied to the archive population if one is given, and otherwise dropped.
+    def compact(self, archive = None):
+        alive = self.alive[:self.size]
+        dead = np.flatnonzero(~alive)
+
+        if len(dead) == 0:
+            return
+
+        if archive is not None:
+            archive.extend(self, dead)
+
+        live = np.flatnonzero(alive)
+        for name in self.fields:
+            array = getattr(self, name)
+            array[:len(live)] = array[live]
+
+        self.size = len(live)
+
+
+    # Applies population control: the neutrons at the given indices are carried forward with the given weights, in that order, with repeated indices becoming copies. Any live neutron not selected is killed, and moved to the archive if one is given.
+    def resample(self, index, weights, archive = None):
+        killed = np.ones(self.size, dtype=bool)
+        killed[index] = False
+        killed &= self.alive[:self.size]
+
+        if archive is not None and np.any(killed):
+            self.alive[:self.size][killed] = False
+            archive.extend(self, np.flatnonzero(killed))
+
+        for name in self.fields:
+            array = getattr(self, name)
+            setattr(self, name, array[index])
+
+        self.size = self.capacity = len(index)
+        self.weight[:] = weights
+
+        # Every copy of a split neutron after the first is a new neutron, and is given a new id.
+        first = np.zeros(len(index), dtype=bool)
+        first[np.unique(index, return_index=True)[1]] = True
+        copies = np.flatnonzero(~first)
+        self.id[copies] = np.arange(self.createdCount + 1, self.createdCount + len(copies) + 1)
+        self.createdCount += len(copies)
+
+        if self.trajectory is not None:
+            self.trajectory.append(self.id[copies], self.x[copies], self.y[copies], self.energy[copies], NONE)
+
+
+    # Equivalent to Neutron.setPosition for a whole set of starting neutrons.
+    def generate(self, count, dimensionX = 10, dimensionY = 10, energy = 0.025):
+        x = self.rng.uniform(0, dimensionX, count)
+        y = self.rng.uniform(0, dimensionY, count)
+        self.addNeutrons(x, y, np.full(count, energy, dtype=float))
+
+
+    def liveIndices(self):
+        return np.flatnonzero(self.alive[:self.size])
+
+
+    # Sorts the moving neutrons into a queue for each event, returning a list of their indices indexed by event code. A single stable sort groups the neutrons of each event together, keeping them in population order within each queue.
+    def eventQueues(self, moving, events):
+        order = np.argsort(events, kind="stable")
+        ends = np.cumsum(np.bincount(events, minlength=LEAK + 1))
+        sortedMoving = moving[order]
+        return [sortedMoving[end - count:end] for end, count in zip(ends, np.diff(ends, prepend=0))]
+
+
+    # The events, each carried out for a whole queue of neutrons at once.
+    def captureEvent(self, index):
+        self.alive[index] = False
+
+    # Neutrons which leave a bounded reactor are lost, as if absorbed.
+    def leakEvent(self, index):
+        self.alive[index] = False
+
+
+    def deltaTrack(self, moving, energy, angle):
+        # Moves each neutron to its next real collision in the reactor geometry by Woodcock delta tracking, as in Neutron.deltaTrack. Every neutron still in flight takes a flight at once, with the majorant cross section; those which leave the reactor leak, and those which reach a material have a real collision with probability sigma/majorant. The rest fly on, until every neutron has collided or leaked. Returns the distance each travelled, the event-table values of the material of each real collision (those of a leaked neutron are left as a placeholder), and which neutrons leaked.
+        geometry = self.geometry
+        count = len(moving)
+
+        x = self.x[moving]
+        y = self.y[moving]
+        cos = np.cos(angle)
+        sin = np.sin(angle)
+        majorant = geometry.majorant(energy)
+
+        distance = np.zeros(count)
+        crossSectionValues = np.tile([0, 0, 0, 1.0], (count, 1))
+        leaked = np.zeros(count, dtype=bool)
+        flying = np.arange(count)
+
+        while len(flying) > 0:
+            flight = self.rng.exponential(scale = 1/majorant[flying])
+            x[flying] += flight*cos[flying]
+            y[flying] += flight*sin[flying]
+            distance[flying] += flight
+
+            outside = ~geometry.inside(x[flying], y[flying])
+            leaked[flying[outside]] = True
+            flying = flying[~outside]
+
+            values = geometry.eventValues(energy[flying], geometry.material(x[flying], y[flying]))
+            real = self.rng.random(len(flying))*majorant[flying] < values[:,3]
+            crossSectionValues[flying[real]] = values[real]
+            flying = flying[~real]
+
+        self.x[moving] = x
+        self.y[moving] = y
+        return distance, crossSectionValues, leaked
+
+
+    def scatterEventU(self, index):
+        # Uranium scattering presets the angle of the next step, which in turn determines the change in energy.
+        newAngle = self.rng.uniform(0, 2*math.pi, len(index))
+        self.angle[index] = newAngle
+
+        if self.multigroup is not None:
+            self.scatterGroups("U", index)
+            return
+
+        alpha = (234/236)**2
+        self.energy[index] *= (1/2)*(1 + alpha + (1-alpha)*np.cos(newAngle))
+
+
+    def scatterEventH(self, index):
+        # Hydrogen scattering up-scatters thermal neutrons and down-scatters the rest, as in Neutron.scatterEventH.
+        if self.multigroup is not None:
+            self.scatterGroups("H", index)
+            return
+
+        if self.moderator is not None:
+            self.energy[index] *= self.moderator.ratio(self.rng.random(len(index)), self.energy[index], self.x[index], self.y[index])
+            return
+
+        thermal = self.energy[index] < 0.05
+        ratio = np.empty(len(index))
+        ratio[thermal] = creatingDistribution.moderation[1].sample(np.count_nonzero(thermal), self.rng)
+        ratio[~thermal] = creatingDistribution.moderation[0].sample(np.count_nonzero(~thermal), self.rng)
+        self.energy[index] *= ratio
+
+
+    # Scattering in the multigroup mode moves each neutron to a group sampled from the row of its own group of the scattering matrix.
+    def scatterGroups(self, scatterer, index):
+        groups = self.multigroup.scatter(scatterer, self.multigroup.groupOf(self.energy[index]), self.rng.random(len(index)))
+        self.energy[index] = self.multigroup.energies[groups]
+
+
+    def fissionEvent(self, index):
+        # Each fission produces one or two prompt neutrons at the site of the fission. The fissioning neutrons die, and the indices of the parent of each prompt neutron are returned with the prompt neutron energies, so that the bank of new neutrons can be made from them.
+        self.alive[index] = False
+
+        promptCounts = randomIntegers(self.rng, 1, 3, len(index))
+        parents = np.repeat(index, promptCounts)
+        if self.multigroup is not None:
+            newEnergies = self.multigroup.energies[self.multigroup.fissionGroups(self.rng.random(len(parents)))]
+        else:
+            newEnergies = creatingDistribution.newPromptNeutronCDF.sample(len(parents), self.rng)
+        return parents, newEnergies
+
+
+    # Speed conversion as in Neutron.energySpeed, taking energies in eV and outputting speeds in cm/s.
+    def energySpeed(self, energy):
+        return 1.38e6*np.sqrt(energy)
+
+
+    def step(self):
+        # This function takes one step of the random walk for every live neutron. It returns the indices of the neutrons which stepped (in population order, matching the order of the reactor's neutron list), the gain and loss of neutrons through the step (weighted by the neutrons' statistical weights), and the positions, energies and weights of the prompt neutrons produced by fission, which inherit the weight of their parent. The fission neutrons are not added here; as in the reactor's history loop they only begin their walk from the next step.
+        stats = self.stats
+        if stats is not None:
+            start = stats.lap(None, None)
+
+        index = self.liveIndices()
+
+        # Neutrons which have fallen below the computational range are removed without an event, as in Neutron.randomStep.
+        cutoff = self.energy[index] <= 1e-5
+        self.alive[index[cutoff]] = False
+        moving = index[~cutoff]
+        count = len(moving)
+
+        energy = self.energy[moving]
+
+        # A neutron whose previous step was a uranium scatter already holds its next angle; all others sample a new one.
+        needAngle = self.eventType[moving] != SCATTER_U
+        self.angle[moving[needAngle]] = self.rng.uniform(0, 2*math.pi, np.count_nonzero(needAngle))
+        angle = self.angle[moving]
+
+        if stats is not None:
+            start = stats.lap("transport", start)
+
+        startX = self.x[moving]
+        startY = self.y[moving]
+        speed = self.energySpeed(energy)
+
+        if self.geometry is None:
+            # One lookup of the event table gives the cumulative cross sections and the total for every moving neutron; in the multigroup mode these are the rows of their groups.
+            if self.multigroup is not None:
+                crossSectionValues = self.multigroup.eventValues[self.multigroup.groupOf(energy)]
+            else:
+                crossSectionValues = creatingDistribution.eventTable.lookup(energy)
+            sigma = crossSectionValues[:,3]
+            leaked = np.zeros(count, dtype=bool)
+
+            if stats is not None:
+                start = stats.lap("crossSection", start)
+
+            sample = self.rng.exponential(scale = 1/sigma)
+
+            self.x[moving] += sample*np.cos(angle)
+            self.y[moving] += sample*np.sin(angle)
+        else:
+            sample, crossSectionValues, leaked = self.deltaTrack(moving, energy, angle)
+
+        self.time[moving] += sample/speed
+        self.eventCount[moving] += 1
+
+        if stats is not None:
+            start = stats.lap("transport", start)
+
+        # The event is chosen from the event table as in Neutron.chooseEvent; anything beyond the first three thresholds is a hydrogen scatter.
+        num = self.rng.random(count)
+        weight = self.weight[moving]
+        if self.implicitCapture:
+            # The weight of every neutron which collides is reduced by its capture probability, and its event is chosen from the others; a leaked neutron's placeholder values have no capture.
+            self.capturedEnergy = energy
+            self.capturedWeight = weight*(crossSectionValues[:,1] - crossSectionValues[:,0])/crossSectionValues[:,3]
+            self.weight[moving] = weight - self.capturedWeight
+            events = (FISSION + creatingDistribution.eventTable.chooseSurvival(crossSectionValues, num)).astype(np.int8)
+        else:
+            events = (FISSION + creatingDistribution.eventTable.choose(crossSectionValues, num)).astype(np.int8)
+        events[leaked] = LEAK
+        self.eventType[moving] = events
+
+        counts = np.bincount(events, minlength=LEAK + 1)
+        self.eventCounts[:4] += counts[FISSION:SCATTER_H + 1]
+        self.eventCounts[4] += np.count_nonzero(cutoff)
+        self.eventCounts[5] += counts[LEAK]
+
+        if stats is not None:
+            start = stats.lap("event", start)
+
+        if self.trajectory is not None:
+            self.trajectory.append(self.id[moving], self.x[moving], self.y[moving], energy, events)
+
+            if stats is not None:
+                start = stats.lap("trajectory", start)
+
+        if self.mesh is not None:
+            self.mesh.score(startX, startY, self.x[moving], self.y[moving], weight, events == FISSION, self.weight[moving])
+
+            if stats is not None:
+                start = stats.lap("tallies", start)
+
+        queues = self.eventQueues(moving, events)
+        fission = queues[FISSION]
+        capture = queues[CAPTURE]
+
+        self.captureEvent(capture)
+        self.leakEvent(queues[LEAK])
+        self.scatterEventU(queues[SCATTER_U])
+        self.scatterEventH(queues[SCATTER_H])
+
+        if stats is not None:
+            start = stats.lap("event", start)
+
+        parents, newEnergies = self.fissionEvent(fission)
+
+        nGain = self.weight[parents].sum()
+        nLoss = self.weight[fission].sum() + self.weight[capture].sum() + self.weight[queues[LEAK]].sum()
+        if self.implicitCapture:
+            nLoss += self.capturedWeight.sum()
+
+        if stats is not None:
+            stats.lap("fissionNeutrons", start)
+
+        return index, nGain, nLoss, self.x[parents], self.y[parents], newEnergies, self.weight[parents]
@@ -1,6 +1,10 @@
 import pytest
+import numpy as np
 
 from neutron import Neutron
+import creatingDistribution
+from creatingDistribution import crossSectionTable, CrossSectionTable
+from varianceReduction import WeightWindow
 
 """
 This file is used to perform unit tests on key functions in the neutron class. Ensure all files are run in the same directory; perform the test (function on VSCode) by writing in the terminal:
@@ -38,3 +42,145 @@ def test_down_Scatter_Event_H():
 
     assert neutron.energy < 1
 
+
+def test_cross_section_lookup():
+    # A batched lookup should give the same values as a single lookup for each energy.
+    energies = np.array([1e-4, 0.025, 1, 1e6])
+    batch = crossSectionTable.lookup(energies)
+
+    assert batch.shape == (4, 5)
+    for i, energy in enumerate(energies):
+        assert np.allclose(batch[i], crossSectionTable.lookup(energy))
+
+def test_cross_section_cache(tmp_path):
+    # A cached table should load back as memory-mapped arrays holding the same values.
+    path = str(tmp_path / "table")
+    crossSectionTable.save(path)
+    loaded = CrossSectionTable.load(path)
+
+    assert isinstance(np.load(str(tmp_path / "table" / "values.npy"), mmap_mode="r"), np.memmap)
+    assert np.array_equal(loaded.values, crossSectionTable.values)
+    assert np.allclose(loaded.lookup(0.025), crossSectionTable.lookup(0.025))
+
+def test_event_table():
+    # The event chosen from the cumulative sums should be that of the thresholds calculated from the five cross sections, for single values and for arrays.
+    rng = np.random.default_rng(5)
+    energies = 10**rng.uniform(-4, 7, 1000)
+    numbers = rng.random(1000)
+
+    F, C, S, T, H = crossSectionTable.lookup(energies).T
+    expected = (numbers[:,None] >= np.column_stack((F, F + C, T))/(T + H)[:,None]).sum(axis=1)
+
+    table = creatingDistribution.eventTable
+    values = table.lookup(energies)
+    assert np.allclose(values[:,3], T + H)
+    assert np.array_equal(table.choose(values, numbers), expected)
+    assert [table.choose(table.lookup(energy), number) for energy, number in zip(energies[:50], numbers[:50])] == list(expected[:50])
+
+def test_fuel_events():
+    # Fuel holds no hydrogen, so the whole of its cross section beyond fission and capture scatters from uranium and none from hydrogen; the mixture keeps the band of H for hydrogen scattering.
+    fuel = creatingDistribution.EventTable.fromCrossSections(crossSectionTable, 1/0.39, 0)
+    rng = np.random.default_rng(9)
+    energies = 10**rng.uniform(-4, 7, 20000)
+
+    events = fuel.choose(fuel.lookup(energies), rng.random(20000))
+    assert not np.any(events == 3)
+    assert np.any(events == 2)
+    assert fuel.choose(fuel.lookup(1e6), 0.999) == 2
+
+    values = creatingDistribution.eventTable.lookup(1e6)
+    F, C, S, T, H = crossSectionTable.lookup(1e6)
+    assert values[2] == pytest.approx(T) and values[3] - values[2] == pytest.approx(H)
+
+def test_mixture_events():
+    # In the standard homogeneous mixture, U235 scatters in the whole of its cross section beyond fission and capture, and hydrogen only in its own.
+    table = creatingDistribution.eventTable
+    F, C, S, T, H = crossSectionTable.lookup(1e6)
+    count = 100000
+    events = table.choose(np.tile(table.lookup(1e6), (count, 1)), (np.arange(count) + 0.5)/count)
+
+    assert np.count_nonzero(events == 2)/count == pytest.approx((T - F - C)/(T + H), abs=2/count)
+    assert np.count_nonzero(events == 3)/count == pytest.approx(H/(T + H), abs=2/count)
+
+def test_implicit_capture():
+    # Without capture the events should follow the remaining cross sections, and the neutron should survive its collision with its weight reduced by the capture probability.
+    rng = np.random.default_rng(6)
+    energies = 10**rng.uniform(-4, 7, 20000)
+    table = creatingDistribution.eventTable
+    values = table.lookup(energies)
+
+    events = table.chooseSurvival(values, rng.random(20000))
+    F, FC, T, total = values.T
+    assert not np.any(events == 1)
+    assert np.count_nonzero(events == 0) == pytest.approx(np.sum(F/(total - FC + F)), rel=0.1)
+    assert [table.chooseSurvival(values[i], number) for i, number in enumerate(np.linspace(0, 0.999, 50))] == list(table.chooseSurvival(values[:50], np.linspace(0, 0.999, 50)))
+
+    neutron = Neutron(energy = 0.025, rng = np.random.RandomState(2), implicitCapture = True)
+    F, FC, T, total = neutron.setCrossSection()
+    neutron.chooseEvent()
+    assert neutron.eventType != "capture"
+    assert neutron.weight == pytest.approx(1 - (FC - F)/total)
+
+def test_weight_window():
+    # Roulette and splitting keep the expected weight, and leave every weight within the window.
+    window = WeightWindow([0.5, 0.2], edges = [1e-5, 1, 2e7], upperRatio = 4)
+    weights = np.random.default_rng(7).uniform(0, 3, 200000)
+    energies = np.where(np.arange(200000) % 2, 0.025, 1e6)
+    index, newWeights = window.apply(weights, energies, np.random.default_rng(8))
+
+    lower = np.where(energies[index] < 1, 0.5, 0.2)
+    assert np.all(np.diff(index) >= 0)
+    assert np.all((newWeights >= lower) & (newWeights <= 4*lower))
+    assert newWeights.sum() == pytest.approx(weights.sum(), rel=0.01)
+    assert WeightWindow(**window.parameters()).parameters() == window.parameters()
+
+    with pytest.raises(ValueError):
+        WeightWindow([0.5, 0.2])
+
+def test_multigroup_library():
+    library = creatingDistribution.multigroupLibrary(30)
+
+    # Each group is represented by an energy within it, and every row of probabilities sums to one.
+    assert np.array_equal(library.groupOf(library.energies), np.arange(30))
+    assert np.allclose(library.scatterU[:,-1], 1) and np.allclose(library.scatterH[:,-1], 1) and library.fission[-1] == pytest.approx(1)
+
+    # Scattering from uranium loses little energy, so keeps most neutrons in their group; scattering from hydrogen moves fast neutrons down.
+    assert np.all(np.diff(library.scatterU, axis=1, prepend=0).diagonal() > 0.9)
+    assert library.scatter("H", 25, 0.5) < 25
+    assert creatingDistribution.multigroupLibrary(30) is library
+
+    # A neutron is transported in its group.
+    neutron = Neutron(energy = 1e3, multigroup = library)
+    assert neutron.energy == library.energies[library.groupOf(1e3)]
+    assert np.array_equal(neutron.setCrossSection(), library.eventValues[neutron.group])
+
+def test_prompt_neutron_sampler():
+    # The Watt spectrum has a mean energy of approximately 2MeV, and a batch should be drawn in one call.
+    sampler = creatingDistribution.newPromptNeutronCDF
+    energies = sampler.sample(100000)
+
+    assert energies.shape == (100000,)
+    assert np.mean(energies) == pytest.approx(2e6, rel=0.02)
+    assert sampler(0.5) == pytest.approx(np.median(energies), rel=0.02)
+
+def test_moderator_table():
+    # The table should hold the samplers built for each temperature on its grid, and interpolate smoothly between them.
+    table = creatingDistribution.moderatorTable
+    downScatter, upScatter, _, _ = creatingDistribution.runModeratorCDF(650)
+    assert np.array_equal(table.samplers(650)[0].table, downScatter.table)
+
+    downScatter, upScatter, _, _ = creatingDistribution.runModeratorCDF(612.5)
+    rand = np.linspace(0.01, 0.99, 50)
+    assert np.allclose(table.samplers(612.5)[1](rand), upScatter(rand), rtol=1e-4)
+    assert np.allclose(table.sample(rand, 612.5, True), upScatter(rand), rtol=1e-4)
+    assert np.allclose(table.sample(rand, 612.5, False), downScatter(rand), rtol=1e-4)
+
+def test_moderator_temperature():
+    # A neutron with a moderator at the default temperature scatters exactly as one without, whether the temperature is given as a number or as a function of position.
+    energies = []
+    for moderator in [None, creatingDistribution.Moderator(600), creatingDistribution.Moderator(lambda x, y: 600)]:
+        neutron = Neutron(energy = 1e3, rng = np.random.RandomState(1), moderator = moderator)
+        neutron.scatterEventH()
+        energies.append(neutron.energy)
+
+    assert energies[0] == pytest.approx(energies[1]) == pytest.approx(energies[2])
@@ -0,0 +1,53 @@
+import numpy as np
+
+"""
+This file holds the population control methods used by the reactor to keep the number of live neutrons near a target size. A supercritical reactor would otherwise grow without limit, and a subcritical one die away.
+
+Each method takes the statistical weights of the live neutrons and a target size, and returns the indices of the neutrons to carry forward (an index may appear more than once, in which case the neutron is split into copies) along with their new weights. Neutrons which do not appear are killed. Both methods are unbiased: the expected total weight after control equals the total weight before it, so tallies and k_eff weighted by the neutrons' weights are unchanged on average.
+
+1. Combing: the total weight is laid out along a line, and a comb of target equally spaced teeth, with a random offset, is dropped onto it. Each tooth selects the neutron it lands on. This gives exactly the target number of neutrons, all of equal weight.
+
+2. Russian roulette with splitting: each neutron is given an expected number of copies in proportion to its weight, and rounds this up or down at random. The population size is only near the target, but neutrons are selected independently of each other.
+"""
+
+
+def comb(weights, target, rng = None):
+    if rng is None:
+        rng = np.random
+
+    weights = np.asarray(weights, dtype=float)
+    total = weights.sum()
+
+    if len(weights) == 0 or total <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=float)
+
+    spacing = total/target
+    teeth = spacing*(rng.random() + np.arange(target))
+
+    # The cumulative weights mark where each neutron ends on the line; a tooth belongs to the first neutron ending beyond it.
+    index = np.searchsorted(np.cumsum(weights), teeth, side="right")
+    index = np.minimum(index, len(weights) - 1)
+
+    return index, np.full(target, spacing)
+
+
+def rouletteSplit(weights, target, rng = None):
+    if rng is None:
+        rng = np.random
+
+    weights = np.asarray(weights, dtype=float)
+    total = weights.sum()
+
+    if len(weights) == 0 or total <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=float)
+
+    expected = weights*target/total
+    copies = np.floor(expected).astype(np.int64)
+    copies += rng.random(len(weights)) < expected - copies
+
+    index = np.repeat(np.arange(len(weights)), copies)
+
+    return index, np.full(len(index), total/target)
+
+
+methods = {"comb": comb, "roulette": rouletteSplit}
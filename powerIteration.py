@@ -0,0 +1,140 @@
+import numpy as np
+
+"""
+This class estimates k_eff by power iteration, the standard method for a criticality calculation, rather than from the gain and loss of neutrons within a single step as Reactor.calcCrit does.
+
+The simulation proceeds in cycles (generations). Each cycle begins with a fixed number of source neutrons, and follows every one of them to its death with the vectorised engine of neutronPopulation.py. The neutrons produced by fission are not followed; instead their sites and energies are stored in a fission bank. The k_eff of the cycle is the number of neutrons in the bank divided by the number of source neutrons, and the next cycle's source is resampled from the bank (by combing, see populationControl.py) back to the fixed size.
+
+The first cycles are inactive: the source has not yet settled into its converged spatial and energy distribution, so their values of k_eff are discarded. The remaining, active cycles give the estimate: their mean, with the standard error of the mean and a confidence interval. Whether the inactive cycles were enough may be judged from the Shannon entropy of the source, calculated each cycle over a mesh of the reactor dimensions; it should have settled to a steady value before the active cycles begin. The medium is infinite and homogeneous, so positions are folded back into the reactor dimensions (as if it were tiled with identical copies of itself) before being counted in the mesh. In a bounded geometry (see geometry.py) neutrons are tracked through its materials and may leak from it; every fission site then lies within the reactor, and folding leaves it unchanged.
+"""
+
+from neutronPopulation import NeutronPopulation
+from neutron import defaultRng
+import populationControl
+import creatingDistribution
+
+
+class PowerIteration():
+    def __init__(
+        self,
+        generationSize = 1000,
+        inactive = 10,
+        active = 40,
+        dimensions = [10,10],
+        entropyMesh = (8,8),
+        thermal = False,
+        rng = None,
+        maxSteps = 100000,
+        moderator = None,
+        geometry = None,
+        multigroup = None
+        ):
+
+        self.generationSize = generationSize
+        self.inactive = inactive
+        self.active = active
+        self.dimensions = dimensions
+        self.entropyMesh = entropyMesh
+        self.thermal = thermal
+        self.rng = defaultRng if rng is None else rng
+        self.moderator = moderator
+        self.geometry = geometry
+        self.multigroup = multigroup
+
+        # A safeguard against a generation which never dies out; it is far beyond the number of steps any neutron takes.
+        self.maxSteps = maxSteps
+
+        self.k_cycles = []
+        self.entropy = []
+
+
+    def initialSource(self):
+        # The first source is spread uniformly over the reactor dimensions, with energies from the prompt fission spectrum (or thermal, if requested).
+        x = self.rng.uniform(0, self.dimensions[0], self.generationSize)
+        y = self.rng.uniform(0, self.dimensions[1], self.generationSize)
+        energy = self.fissionEnergies(self.generationSize)
+        return x, y, energy
+
+
+    def fissionEnergies(self, count):
+        if self.thermal:
+            return np.full(count, 0.025)
+        return creatingDistribution.newPromptNeutronCDF.sample(count, self.rng)
+
+
+    def runCycle(self, source):
+        # Follows one generation of source neutrons until every one has died, returning the fission bank: the positions and energies of the neutrons produced.
+        population = NeutronPopulation(capacity = len(source[0]), rng = self.rng, moderator = self.moderator, geometry = self.geometry, multigroup = self.multigroup)
+        population.addNeutrons(*source)
+
+        bankX, bankY, bankEnergy = [], [], []
+        steps = 0
+
+        while population.size > 0 and steps < self.maxSteps:
+            stepped, nGain, nLoss, newX, newY, newEnergies, newWeights = population.step()
+            population.compact()
+
+            bankX.append(newX)
+            bankY.append(newY)
+            bankEnergy.append(newEnergies)
+            steps += 1
+
+        bankX = np.concatenate(bankX) if bankX else np.empty(0)
+        bankY = np.concatenate(bankY) if bankY else np.empty(0)
+        bankEnergy = np.concatenate(bankEnergy) if bankEnergy else np.empty(0)
+
+        if self.thermal:
+            bankEnergy = np.full(len(bankEnergy), 0.025)
+
+        return bankX, bankY, bankEnergy
+
+
+    def shannonEntropy(self, x, y):
+        # The entropy, in bits, of the distribution of source sites over the mesh.
+        foldedX = np.mod(x, self.dimensions[0])
+        foldedY = np.mod(y, self.dimensions[1])
+
+        counts, _, _ = np.histogram2d(foldedX, foldedY, bins = self.entropyMesh, range = [[0, self.dimensions[0]], [0, self.dimensions[1]]])
+        fractions = counts[counts > 0]/counts.sum()
+
+        return -np.sum(fractions*np.log2(fractions))
+
+
+    def run(self):
+        source = self.initialSource()
+
+        for cycle in range(self.inactive + self.active):
+
+            bankX, bankY, bankEnergy = self.runCycle(source)
+
+            if len(bankX) == 0:
+                raise RuntimeError(F"The fission bank is empty after cycle {cycle}; the system cannot sustain a chain reaction from {self.generationSize} neutrons")
+
+            self.k_cycles.append(len(bankX)/len(source[0]))
+            self.entropy.append(self.shannonEntropy(bankX, bankY))
+
+            # The next source is resampled from the bank to the fixed generation size.
+            index, weights = populationControl.comb(np.ones(len(bankX)), self.generationSize, self.rng)
+            source = (bankX[index], bankY[index], bankEnergy[index])
+
+        return self
+
+
+    # The active cycles, which give the estimate of k_eff.
+    def activeCycles(self):
+        return np.array(self.k_cycles[self.inactive:])
+
+    def k_mean(self):
+        return np.mean(self.activeCycles())
+
+    def k_error(self):
+        cycles = self.activeCycles()
+        return np.std(cycles, ddof=1)/np.sqrt(len(cycles))
+
+    def confidenceInterval(self, level = 0.95):
+        # A confidence interval for k_eff from the t-distribution of the active cycles.
+        from scipy import stats
+
+        cycles = self.activeCycles()
+        half = stats.t.ppf((1 + level)/2, len(cycles) - 1)*self.k_error()
+        return self.k_mean() - half, self.k_mean() + half
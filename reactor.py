@@ -1,17 +1,60 @@
 import numpy as np
 import copy
+import time
 
-from sympy import true
+import populationControl
+import varianceReduction
 
 """This class creates an instance of the reactor, characterised by an initial neutron count, and desired step count. Neutron motion triggered by the .startUp() method: this generates a list of the desired initial neutrons and iterates over them for as many steps as requested. Neutrons are added or removed from this list as fission and absorbtion events demand.
 
 We model the reactor as a homogeneous mixture of 61% light water and 39% U02 fuel; the latter is enriched to 4% U235 content.
 
 The reactor takes in a parameter 'thermal' which is a boolean value indicating whether neutrons produced in a fission event have a properly distributed energy, or whether they are uniformly themal (given E = 0.025)
+
+The parameter 'engine' chooses how the walk is evaluated: "history" steps a list of neutron objects one at a time; "vector" holds the whole population in numpy arrays (see neutronPopulation.py) and steps every live neutron at once. Both fill k_effData and the tallies (see tallies.py) in the same format and agree statistically; the vector engine is far faster for large neutron counts, but does not keep neutron objects with their position histories.
+
+Either engine only steps the neutrons which are still alive: these are held in an active set (activeNeutrons, or the population arrays) which is compacted at the end of every step. The parameter 'keepHistory' decides what happens to finished neutrons. If True (the default) they are kept, so that neutronData() can return every neutron which existed in the simulation; if False they are dropped, and memory is bounded by the live population.
+
+A supercritical reactor grows its population without limit. Giving a 'populationTarget' applies population control at the end of every step (see populationControl.py), splitting or killing neutrons so that the live population stays near the target, and adjusting their statistical weights to keep the results unbiased. The gain and loss used to calculate k_eff are weighted accordingly. 'controlMethod' chooses the method, "comb" (the default) or "roulette".
+
+Neutron trajectories may be written to a shared TrajectoryStore (see trajectoryStore.py) by passing one as 'trajectory'. The neutrons of either engine then record every step in the store's typed arrays, rather than in lists of their own, and the store can be read per step or per neutron once the run is finished.
+
+A MeshTally (see meshTally.py) passed as 'mesh' is scored with the track of every step, giving maps of the collision density, fission density and flux over the reactor dimensions (or the mesh's own extent) without keeping trajectories.
+
+A run may be saved as it goes by passing a RunWriter (see runFormat.py) as 'output': the k_eff, gain, loss, live population and energy rows of every step are appended to its files as soon as the step is finished.
+
+Random numbers are drawn from 'rng', which is given to every neutron. By default this is the generator shared by all neutrons (see neutron.py); giving an integer seed, a SeedSequence or a numpy Generator makes the run draw from its own independent stream, as the batch runner does to run reactors in parallel.
+
+Giving instrument=True records where the time of the run goes: the time spent in each phase of the step loop, and the population, memory and events of every step, in a RunStats object held as 'stats' (see instrumentation.py); stats.summary() gives a report.
+
+A long run may be checkpointed every 'checkpointEvery' steps to the file 'checkpointPath' (see checkpoint.py). A checkpoint holds the live neutrons, the state of the random number generator, k_effData and the tallies, but not the finished neutrons; Reactor.resume(checkpointPath) rebuilds the reactor from it and carries on, drawing exactly the same random numbers, so the run finishes as it would have done had it never stopped.
+
+The moderator is at 600K unless 'moderatorTemperature' is given: either a temperature in K for the whole reactor, or a function temperature(x, y) of position for a reactor whose temperature varies from region to region. Scattering from hydrogen is then sampled from the moderator table, built once over a grid of temperatures (see creatingDistribution.py), so a temperature study need not rebuild the moderator distribution for every run.
+
+The reactor is an infinite homogeneous mixture unless a 'geometry' is given (see geometry.py): a bounded rectangle of regions of fuel and water, such as a lattice of fuel pins, through which neutrons are tracked by delta tracking. The reactor dimensions are then those of the geometry, and neutrons flying out of it leak and are lost, counting towards the loss of each step. A geometry is not saved in a checkpoint, and must be given again to resume the run.
+
+A run may also be watched as it goes: iterSteps() is a generator which runs the reactor one step at a time, yielding a summary of each step (the live population, gain and loss, k_eff and mean energy) as soon as it is finished. Both it and startUp take a list of stopping rules (see stoppingRules.py), such as a target for the relative standard error of k_eff or a limit on the wall time, which end the run before stepCount steps once its answer is good enough. A finished run cannot be run again; leaving the loop over iterSteps() early only pauses the run, which a later iterSteps() or startUp() carries on, and finishRun() ends it there.
+
+Giving 'groups' runs the reactor in the multigroup mode: rather than with continuous energies, neutrons are transported in energy groups, with cross sections collapsed into constants for each group and group-to-group scattering matrices (see creatingDistribution.py). 'groups' is the number of groups, equally spaced in lethargy, or their edges in eV; 'groupSpectrum' is the weighting spectrum used to collapse the cross sections, a function of energy in eV. Every collision then looks up a row of a small table, which is far cheaper than interpolating the full cross-section data, at the cost of the energy resolution of the groups. The collapsed library is cached, so it is only built once for each set of groups. A weighting spectrum, like a moderator temperature given as a function, is not saved in a checkpoint and must be given again to resume the run.
+
+Giving implicitCapture=True applies survival biasing (see varianceReduction.py): rather than ending a history at a capture, every collision reduces the neutron's weight by the capture probability, and the weight taken away is counted in the loss of the step and in the tallies. Russian roulette below 'weightCutoff' then removes neutrons whose weight has fallen too far to be worth following. A 'weightWindow' (a varianceReduction.WeightWindow, or its parameters as a dictionary) replaces the cutoff with energy-dependent bounds, splitting neutrons above them as well as playing roulette below them. Population control sets the weights itself, and is used instead of either. figureOfMeritReport there measures the speedup.
+
+As an alternative to startUp, powerIteration() estimates k_eff by power iteration over generations of neutronStart neutrons (see powerIteration.py), giving a converged value with a confidence interval.
+
+The reactor also counts the events ending each step in eventCounts: fission, capture, scatterU and scatterH, along with cutoff for neutrons removed because their energy fell below the computational range, leak for those which left a bounded geometry, and roulette for those killed by Russian roulette.
 """
 
 # Importing the neutron class
-from neutron import Neutron
+from neutron import Neutron, defaultRng
+import creatingDistribution
+from neutronPopulation import NeutronPopulation, eventNames as populationEventNames, countNames, ROULETTE
+from powerIteration import PowerIteration
+from tallies import Tallies
+from meshTally import MeshTally
+import checkpoint
+from instrumentation import RunStats
+
+eventNames = countNames
 
 class Reactor():
     def __init__(
@@ -21,86 +64,336 @@ class Reactor():
         stepCount = 100,
         k_eff = 1,
         dimensions = [10,10],
-        thermal = False
+        thermal = False,
+        engine = "history",
+        keepHistory = True,
+        populationTarget = None,
+        controlMethod = "comb",
+        trajectory = None,
+        mesh = None,
+        output = None,
+        keepEnergyList = False,
+        checkpointPath = None,
+        checkpointEvery = None,
+        instrument = False,
+        moderatorTemperature = None,
+        geometry = None,
+        groups = None,
+        groupSpectrum = None,
+        implicitCapture = False,
+        weightCutoff = 0.25,
+        weightWindow = None,
+        rng = None
         ):
 
         self.neutronStart = neutronStart
         self.stepCount = stepCount
         self.neutronList = []
+        self.activeNeutrons = []
         self.newNeutronList = []
+        self.createdCount = 0
         self.k_eff = k_eff
         self.energyList = []
+        self.keepEnergyList = keepEnergyList
+        self.tallies = Tallies(stepCount)
         self.k_effData = [1]
     
         self.thermal = thermal
+
+        self.geometry = geometry
+        if geometry is not None:
+            dimensions = [geometry.width, geometry.height]
         self.dimensions = dimensions
 
+        if engine not in ("history", "vector"):
+            raise ValueError(F"Unknown engine '{engine}'; expected 'history' or 'vector'")
+
+        if controlMethod not in populationControl.methods:
+            raise ValueError(F"Unknown population control '{controlMethod}'; expected one of {list(populationControl.methods)}")
+
+        self.engine = engine
+        self.keepHistory = keepHistory
+        self.populationTarget = populationTarget
+        self.controlMethod = controlMethod
+        self.trajectory = trajectory
+        self.output = output
+
+        self.mesh = mesh
+        if mesh is not None and mesh.extent is None:
+            mesh.setExtent(dimensions)
+
+        if rng is None:
+            rng = defaultRng
+        elif isinstance(rng, (int, np.integer, np.random.SeedSequence)):
+            rng = np.random.default_rng(rng)
+        self.rng = rng
+
+        self.eventCounts = dict.fromkeys(eventNames, 0)
+        self.population = None
+        self.archive = None
+
+        # The number of steps taken so far, from which a resumed run carries on, and why the last run stopped before stepCount if a stopping rule ended it.
+        self.step = 0
+        self.started = False
+        self.finished = False
+        self.stopReason = None
+        self.checkpointPath = checkpointPath
+        self.checkpointEvery = checkpointEvery
+        if checkpointEvery and checkpointPath is None:
+            raise ValueError(F"A run checkpointed every {checkpointEvery} steps needs a checkpointPath to save to")
+
+        self.stats = RunStats() if instrument else None
+
+        self.moderatorTemperature = moderatorTemperature
+        self.moderator = None if moderatorTemperature is None else creatingDistribution.Moderator(moderatorTemperature)
+
+        self.groups = groups
+        self.multigroup = None
+        if groups is not None:
+            if geometry is not None or callable(moderatorTemperature):
+                raise ValueError("The multigroup mode takes neither a geometry nor a moderator temperature varying with position")
+
+            temperature = creatingDistribution.moderatorTemperature if moderatorTemperature is None else moderatorTemperature
+            self.multigroup = creatingDistribution.multigroupLibrary(groups, groupSpectrum, temperature)
+
+        # The weight window applied at the end of every step: the one given, or for implicit capture without one, roulette below the weight cutoff. Population control sets the weights itself, and takes the place of either.
+        if isinstance(weightWindow, dict):
+            weightWindow = varianceReduction.WeightWindow(**weightWindow)
+        if weightWindow is not None and populationTarget is not None:
+            raise ValueError("Population control sets the weights of the neutrons itself; give a weightWindow or a populationTarget, not both")
+
+        self.implicitCapture = implicitCapture
+        self.weightCutoff = weightCutoff
+        self.weightWindow = weightWindow
+        self.window = weightWindow
+        if weightWindow is None and implicitCapture and populationTarget is None:
+            self.window = varianceReduction.WeightWindow.cutoff(weightCutoff)
+
     def generateList(self):
-        # This generates a list of the starting neutrons in the reactor, also storing their initial energy and speed. energyHolder is used to contain all the information about a single step in one list, such that the energyList can be indexed by the step in the simulation.
-        energyHolder = []
+        # This generates a list of the starting neutrons in the reactor, also scoring their initial energy and speed as step 0 of the tallies.
+        if self.trajectory is not None:
+            self.trajectory.setStep(0)
+
+        neutrons = [self.createNeutron(place = True) for i in range(self.neutronStart)]
+
+        return self.recordStep(0, [neutron.energy for neutron in neutrons], [neutron.energySpeed() for neutron in neutrons], [neutron.weight for neutron in neutrons])
+
+
+    # The energies, speeds and weights of the neutrons which took a step are scored in the tallies, and returned as the (n, 2) array of [energy, speed] rows written to the output. The rows are only kept in energyList, indexed by step, if keepEnergyList is set; for a large run this list holds far more than the tallies, and is meant for debugging. With implicit capture, the weights captured in the step are scored as well, at the energies of their collisions, in place of the captured neutrons of an analog run; they are not neutrons, and are not written to the rows.
+    def recordStep(self, step, energies, speeds, weights, capturedEnergies = (), capturedWeights = ()):
+        energies = np.asarray(energies, dtype=float)
+        speeds = np.asarray(speeds, dtype=float)
+
+        self.tallies.score(step, energies, speeds, weights)
+        if len(capturedEnergies):
+            capturedEnergies = np.asarray(capturedEnergies, dtype=float)
+            self.tallies.score(step, capturedEnergies, 1.38e6*np.sqrt(capturedEnergies), capturedWeights)
+
+        rows = np.column_stack((energies, speeds))
+        if self.keepEnergyList:
+            self.energyList.append(rows)
+
+        return rows
 
-        for i in range(self.neutronStart):
 
-            neutron = Neutron(name = F"neutron{i+1}")
+    # Every neutron is created here, so that it is given an id by its place in the order of creation and, if the history is kept, recorded in neutronList in that order. It is also added to the active set; for fission neutrons this is left until the end of the step (see bankNeutrons). Starting neutrons are placed at random within the reactor dimensions; fission neutrons are given their position.
+    def createNeutron(self, active = True, place = False, **kwargs):
+        self.createdCount += 1
+        neutron = Neutron(neutronId = self.createdCount, trajectory = self.trajectory, rng = self.rng, stats = self.stats, moderator = self.moderator, geometry = self.geometry, multigroup = self.multigroup, implicitCapture = self.implicitCapture, keepPath = self.keepHistory, **kwargs)
+
+        if place:
             neutron.setPosition(self.dimensions[0], self.dimensions[1])
-            
+        neutron.startTrajectory()
+
+        if self.keepHistory:
             self.neutronList.append(neutron)
+        if active:
+            self.activeNeutrons.append(neutron)
+
+        return neutron
+
+
+    # Turns entries of the fission bank into neutrons, as they join the active set.
+    def bankNeutrons(self, bank):
+        return [self.createNeutron(active = False, startPos = (x, y), energy = energy, weight = weight, parentId = parentId) for x, y, energy, weight, parentId in bank]
+
+
+    def startUp(self, stoppingRules = ()):
+
+        # This function generates the intial list of neutrons and sends them off on their random walk, for stepCount steps or until one of the stopping rules is met (see iterSteps). The energy, speed and weight of every neutron which steps are collected over the step, and scored in the tallies at its end (see recordStep).
+        for summary in self.iterSteps(stoppingRules):
+            pass
+
+
+    def iterSteps(self, stoppingRules = ()):
+
+        # Runs the reactor one step at a time, yielding a summary of each step as soon as it is finished: the step, the live population, the gain and loss of neutrons, k_eff, the mean neutron energy, and the wall time since the iteration began. The run ends after stepCount steps, or when one of the stopping rules (see stoppingRules.py) is met; each rule is called with the reactor and the summary of the step, and the first to give a reason for stopping ends the run, its reason being kept as stopReason. The output is then finished, and the reactor cannot be run again. Leaving the loop over the steps early only pauses the run: the output is left open, and iterating again carries on from the next step.
+        if self.finished:
+            raise ValueError(F"The run is finished, at step {self.step} of {self.stepCount}; create a new Reactor, or resume this one from a checkpoint, to run further")
+        if not self.started:
+            self.begin()
+
+        self.stopReason = None
+        steps = self.vectorSteps() if self.engine == "vector" else self.historySteps()
+        start = time.perf_counter()
+
+        # Whether the caller holds a summary, in which case the generator being closed means the loop was left early.
+        paused = False
+        try:
+            for nGain, nLoss, population in steps:
+                summary = {
+                    "step": self.step,
+                    "population": population,
+                    "gain": nGain,
+                    "loss": nLoss,
+                    "k_eff": self.k_eff,
+                    "meanEnergy": self.tallies.steps.mean[self.step] if self.tallies.steps.weight[self.step] > 0 else np.nan,
+                    "elapsed": time.perf_counter() - start,
+                }
+                paused = True
+                yield summary
+                paused = False
 
-            energyHolder.append([neutron.energy, neutron.energySpeed()])  
+                for rule in stoppingRules:
+                    reason = rule(self, summary)
+                    if reason is not None:
+                        self.stopReason = reason
+                        return
+        finally:
+            if paused:
+                self.countEvents()
+            else:
+                self.finishRun()
 
-        self.energyList.append(energyHolder) 
 
-            
-            
+    # Creates the starting neutrons and begins the output; a resumed run begins from its checkpoint instead (see resume).
+    def begin(self):
+        if self.engine == "vector":
+            self.beginVector()
+        else:
+            self.beginOutput(self.generateList())
+        self.started = True
 
-    def startUp(self):
 
-        # This function generates the intial list of neutrons and sends them off on their random walk. Data corresponding to the speed and energy of the neutrons in a given step is stored in the same manner as generatList (i.e. with an energyHolder collating the energies of neutrons in a given step, before this is appended to the total list).
-        
-        self.generateList()
+    # Ends the run, finishing its output; a finished reactor cannot be run again.
+    def finishRun(self):
+        self.countEvents()
+        self.endOutput()
+        self.finished = True
 
-        for i in range(self.stepCount):
 
-            # In each step we want to check how many neutrons are added to the system from fission, only adding them to the reactor neutron list after all neutrons in original list have had their steps evaluated. That is, a fission-produced neutron only begin's its random walk in the count index after it has been generated. We hold the new neutron information in the new_neutrons list.
-            new_neutrons = []
-            energyHolder = []
+    # Copies the event counts of the vector engine's population to the reactor.
+    def countEvents(self):
+        if self.engine == "vector":
+            for name, count in zip(eventNames, self.population.eventCounts):
+                self.eventCounts[name] = int(count)
+
+
+    def historySteps(self):
+
+        # The steps of the history engine, from the current step to the last, yielding the gain, loss and live population of each.
+        for i in range(self.step, self.stepCount):
+
+            if self.stats is not None:
+                self.stats.beginStep()
+
+            if self.trajectory is not None:
+                self.trajectory.setStep(i + 1)
+
+            # In each step we want to check how many neutrons are added to the system from fission, only adding them to the reactor neutron list after all neutrons in original list have had their steps evaluated. That is, a fission-produced neutron only begin's its random walk in the count index after it has been generated. We hold the new neutron information in the fission bank, as a tuple (x, y, energy, weight, parentId) for each; the neutrons themselves are only created when they join the active set at the end of the step (see bankNeutrons).
+            bank = []
+            energies = []
+            speeds = []
+            weights = []
+            tracks = []
+            capturedEnergies = []
+            capturedWeights = []
 
             # These parameters are used to calculate the reactivity of the system, corresponding to gain in neutrons and loss of neutrons through a given step, respectiely.
             nGain = 0
             nLoss = 0
             oldnLoss = 0
 
-            # We begin iterating over the neutron list; if a neutron is absorbed, it is passed over; if not, it is allowed to take a step in its walk.
-            for neutron in self.neutronList:               
+            stats = self.stats
+
+            # We begin iterating over the active neutrons; only neutrons which have not been absorbed are held here, so each is allowed to take a step in its walk.
+            for neutron in self.activeNeutrons:               
+
+                eventCount = neutron.eventCount
+                startX = neutron.x
+                startY = neutron.y
+                startEnergy = neutron.energy
+                startWeight = neutron.weight
+                neutron.randomStep() 
+
+                if stats is not None:
+                    start = stats.lap(None, None)
+
+                # A neutron which is removed for falling below the computational range takes no event.
+                if neutron.eventCount == eventCount:
+                    self.eventCounts["cutoff"] += 1
+                else:
+                    self.eventCounts[neutron.eventType] += 1
+                    if self.mesh is not None:
+                        tracks.append((startX, startY, neutron.x, neutron.y, startWeight, neutron.eventType == "fission", neutron.weight))
+
+                    # With implicit capture, the weight the collision took from the neutron is captured.
+                    if neutron.weight != startWeight:
+                        nLoss += startWeight - neutron.weight
+                        capturedEnergies.append(startEnergy)
+                        capturedWeights.append(startWeight - neutron.weight)
                 
-                if not neutron.absorbed: 
+                energies.append(neutron.energy)
+                speeds.append(neutron.energySpeed())
+                weights.append(neutron.weight)
 
-                    neutron.randomStep() 
-                    
-                    energyHolder.append([neutron.energy, neutron.energySpeed()])   
+                if stats is not None:
+                    start = stats.lap("bookkeeping", start)
 
-                    # This checks if a neutron has fissioned, collecting the new neutron data if True.
-                    if neutron.eventType == "fission":
+                # This checks if a neutron has fissioned, collecting the new neutron data if True.
+                if neutron.eventType == "fission":
 
-                        # We lose the incident fission neutron and gain however many are produced in the fission event.
-                        nGain += len(neutron.newNeutronEnergies)
-                        nLoss += 1
+                    # We lose the incident fission neutron and gain however many are produced in the fission event.
+                    nGain += neutron.weight*len(neutron.newNeutronEnergies)
+                    nLoss += neutron.weight
 
-                        # Here we create the neutron objects produced in the fission; the hashed-out statement would create the particles with equal, thermal energy 0.025eV. The correspodning implement statement creates them with distributed energies. It is left in to be able to produced the graph given in the report.
+                    # Here we bank the neutrons produced in the fission at its site; a thermal reactor gives them all the thermal energy 0.025eV, and otherwise they have the energies sampled in the fission. It is left in to be able to produced the graph given in the report.
 
-                        for j in neutron.newNeutronEnergies:
-                            if self.thermal == True:
-                                new_neutrons.append(Neutron(startPos = np.array(neutron.pos, dtype=float), name = F"neutron{len(self.neutronList) + len(new_neutrons) + 1}"))
-                            else:
-                                new_neutrons.append(Neutron(startPos = np.array(neutron.pos, dtype=float), energy=j ,name = F"neutron{len(self.neutronList) + len(new_neutrons) + 1}"))
-                    
-                    elif neutron.eventType == "capture":
-                        nLoss += 1
+                    for j in neutron.newNeutronEnergies:
+                        if self.thermal == True:
+                            bank.append((neutron.x, neutron.y, 0.025, neutron.weight, neutron.id))
+                        else:
+                            bank.append((neutron.x, neutron.y, j, neutron.weight, neutron.id))
+                
+                elif neutron.eventType in ("capture", "leak"):
+                    nLoss += neutron.weight
 
+                if stats is not None:
+                    stats.lap("fissionNeutrons", start)
                 
-            # This adds the new neutrons produced in a given fission event to the total new neutrons added to the reactor after a step is fully evaluated.
-            for newNeutron in new_neutrons:
-                self.neutronList.append(newNeutron)
+            # The tracks of the step are scored in the mesh together.
+            start = self.lap(None, None)
+            if tracks:
+                self.mesh.score(*np.array(tracks).T)
+            start = self.lap("tallies", start)
+
+            # The active set is compacted, dropping the neutrons absorbed in this step, and the new neutrons produced in fission events are added to it after the step is fully evaluated. With population control, only the banked neutrons which it selects are ever created.
+            self.activeNeutrons = [neutron for neutron in self.activeNeutrons if not neutron.absorbed]
+
+            if self.populationTarget is not None:
+                start = self.lap("bookkeeping", start)
+                self.controlPopulation(bank)
+                start = self.lap("populationControl", start)
+            elif self.window is not None:
+                # A weight window is applied to the bank along with the active neutrons, so that the entries it kills are never made into neutrons.
+                start = self.lap("bookkeeping", start)
+                self.applyWindow(bank)
+                start = self.lap("weightWindow", start)
+            else:
+                # Creating the neutrons of the fission bank is timed with the fission neutrons, as it was when they were created during the step.
+                start = self.lap("bookkeeping", start)
+                self.activeNeutrons.extend(self.bankNeutrons(bank))
+                start = self.lap("fissionNeutrons", start)
 
 
             oldnLoss = copy.copy(nLoss) 
@@ -108,15 +401,353 @@ class Reactor():
             self.calcCrit(nGain, oldnLoss)
             self.k_effData.append(self.k_eff)
 
-            self.energyList.append(energyHolder)   
+            rows = self.recordStep(i + 1, energies, speeds, weights, capturedEnergies, capturedWeights)
+            start = self.lap("tallies", start)
+
+            if self.output is not None:
+                self.output.writeStep(self.k_eff, nGain, nLoss, len(self.activeNeutrons), rows)
+                self.lap("output", start)
+
+            self.endStep(i + 1)
+            yield nGain, nLoss, len(self.activeNeutrons)
 
     
     
+    def beginVector(self):
+
+        # The vectorised equivalent of generateList, creating the starting population.
+        if self.trajectory is not None:
+            self.trajectory.setStep(0)
+
+        self.population = NeutronPopulation(capacity = self.neutronStart, trajectory = self.trajectory, mesh = self.mesh, rng = self.rng, stats = self.stats, moderator = self.moderator, geometry = self.geometry, multigroup = self.multigroup, implicitCapture = self.implicitCapture)
+        if self.keepHistory:
+            self.archive = NeutronPopulation()
+        self.population.generate(self.neutronStart, self.dimensions[0], self.dimensions[1])
+
+        live = slice(0, self.population.size)
+        energies = self.population.energy[live]
+        self.beginOutput(self.recordStep(0, energies, self.population.energySpeed(energies), self.population.weight[live]))
+
+
+    def vectorSteps(self):
+
+        # The steps of the vector engine, from the current step to the last. Neutrons produced by fission are added to the population after the step is evaluated, so they only begin their walk in the following step.
+        for i in range(self.step, self.stepCount):
+
+            if self.stats is not None:
+                self.stats.beginStep()
+
+            if self.trajectory is not None:
+                self.trajectory.setStep(i + 1)
+
+            stepped, nGain, nLoss, newX, newY, newEnergies, newWeights = self.population.step()
+
+            start = self.lap(None, None)
+            energies = self.population.energy[stepped]
+            if self.implicitCapture:
+                rows = self.recordStep(i + 1, energies, self.population.energySpeed(energies), self.population.weight[stepped], self.population.capturedEnergy, self.population.capturedWeight)
+            else:
+                rows = self.recordStep(i + 1, energies, self.population.energySpeed(energies), self.population.weight[stepped])
+            start = self.lap("tallies", start)
+
+            if self.thermal == True:
+                newEnergies = np.full(len(newEnergies), 0.025)
+
+            # Finished neutrons are moved out of the population (into the archive, if the history is kept) before the new ones are added.
+            self.population.compact(self.archive)
+            self.population.addNeutrons(newX, newY, newEnergies, newWeights)
+            start = self.lap("bookkeeping", start)
+
+            if self.populationTarget is not None:
+                index, weights = populationControl.methods[self.controlMethod](self.population.weight[:self.population.size], self.populationTarget, self.rng)
+                self.population.resample(index, weights, self.archive)
+                start = self.lap("populationControl", start)
+
+            if self.window is not None:
+                self.applyWindowVector()
+                start = self.lap("weightWindow", start)
+
+            self.calcCrit(nGain, nLoss)
+            self.k_effData.append(self.k_eff)
+
+            if self.output is not None:
+                self.output.writeStep(self.k_eff, nGain, nLoss, self.population.size, rows)
+                self.lap("output", start)
+
+            self.endStep(i + 1)
+            yield nGain, nLoss, self.population.size
+
+
+    # Marks a step as finished, saving a checkpoint if one is due, and recording the step if the run is instrumented.
+    def endStep(self, step):
+        self.step = step
+        if self.checkpointEvery and step % self.checkpointEvery == 0:
+            start = self.lap(None, None)
+            self.checkpoint(self.checkpointPath)
+            self.lap("checkpoint", start)
+
+        if self.stats is not None:
+            if self.engine == "vector":
+                self.stats.endStep(self.population.size, dict(zip(eventNames, self.population.eventCounts)))
+            else:
+                self.stats.endStep(len(self.activeNeutrons), self.eventCounts)
+
+
+    # Adds the time since start to a phase of an instrumented run (see instrumentation.py); without instrumentation this does nothing.
+    def lap(self, name, start):
+        if self.stats is None:
+            return None
+        return self.stats.lap(name, start)
+
+
+    # The live neutrons as arrays, in the order they will step. The history engine's neutron objects are converted to the fields of a NeutronPopulation, with their event as its code.
+    def liveState(self):
+        if self.engine == "vector":
+            live = self.population.liveIndices()
+            return {F"neutron.{name}": getattr(self.population, name)[live] for name in NeutronPopulation.fields}
+
+        neutrons = self.activeNeutrons
+        return {
+            "neutron.id": np.array([neutron.id for neutron in neutrons], dtype=np.int64),
+            "neutron.x": np.array([neutron.x for neutron in neutrons], dtype=float),
+            "neutron.y": np.array([neutron.y for neutron in neutrons], dtype=float),
+            "neutron.energy": np.array([neutron.energy for neutron in neutrons], dtype=float),
+            "neutron.angle": np.array([neutron.angle for neutron in neutrons], dtype=float),
+            "neutron.time": np.array([neutron.time for neutron in neutrons], dtype=float),
+            "neutron.weight": np.array([neutron.weight for neutron in neutrons], dtype=float),
+            "neutron.eventCount": np.array([neutron.eventCount for neutron in neutrons], dtype=np.int64),
+            "neutron.eventType": np.array([populationEventNames.index(neutron.eventType) for neutron in neutrons], dtype=np.int8),
+        }
+
+
+    # Saves the state of the run at the end of the current step.
+    def checkpoint(self, path):
+        rngMeta, arrays = checkpoint.rngState(self.rng)
+        arrays.update(self.liveState())
+        arrays.update({F"tallies.{name}": values for name, values in self.tallies.state().items()})
+        if self.mesh is not None:
+            arrays.update({F"mesh.{name}": values for name, values in self.mesh.state().items()})
+        arrays["k_effData"] = np.array(self.k_effData, dtype=float)
+
+        eventCounts = self.eventCounts
+        if self.engine == "vector":
+            eventCounts = dict(zip(eventNames, self.population.eventCounts.tolist()))
+
+        meta = {
+            "parameters": dict(self.parameters(), k_eff = self.k_eff, keepHistory = self.keepHistory, keepEnergyList = self.keepEnergyList, checkpointEvery = self.checkpointEvery),
+            "step": self.step,
+            "createdCount": self.createdCount if self.engine == "history" else self.population.createdCount,
+            "eventCounts": eventCounts,
+            "rng": rngMeta,
+            "mesh": self.mesh is not None,
+        }
+        checkpoint.writeCheckpoint(path, meta, arrays)
+
+
+    # Rebuilds a reactor from a checkpoint and runs it to its last step, or until one of the stopping rules is met. The run may be given new values for any parameter which does not change the physics: a trajectory store, mesh, output, or checkpoint file (by default the run carries on checkpointing to the file it was resumed from, every checkpointEvery steps). A new output or trajectory store begins from the resumed step, with the live neutrons as its starting point. The random numbers carry on from the generator's saved state; a run which used the shared default generator sets its state. A moderator temperature given as a function cannot be saved, and must be given again.
+    @classmethod
+    def resume(cls, path, stoppingRules = (), **kwargs):
+        meta, arrays = checkpoint.readCheckpoint(path)
+
+        parameters = dict(meta["parameters"], **kwargs)
+        parameters.setdefault("checkpointPath", path)
+        if meta["mesh"] and parameters.get("mesh") is None:
+            parameters["mesh"] = MeshTally()
+
+        rng = parameters.pop("rng", None)
+        if rng is None and meta["rng"]["kind"] == "RandomState":
+            rng = defaultRng
+        rng = checkpoint.restoreRng(rng, meta["rng"], arrays)
+
+        reactor = cls(rng = rng, **parameters)
+        reactor.restore(meta, arrays)
+        reactor.beginOutput(reactor.recordRestart())
+        reactor.started = True
+
+        for summary in reactor.iterSteps(stoppingRules):
+            pass
+
+        return reactor
+
+
+    def restore(self, meta, arrays):
+        self.step = meta["step"]
+        self.k_effData = arrays["k_effData"].tolist()
+        self.k_eff = self.k_effData[-1]
+        self.eventCounts.update(meta["eventCounts"])
+
+        self.tallies.restore({name[len("tallies."):]: values for name, values in arrays.items() if name.startswith("tallies.")})
+        if meta["mesh"]:
+            self.mesh.restore({name[len("mesh."):]: values for name, values in arrays.items() if name.startswith("mesh.")})
+
+        if self.trajectory is not None:
+            self.trajectory.setStep(self.step)
+
+        neutrons = {name[len("neutron."):]: values for name, values in arrays.items() if name.startswith("neutron.")}
+
+        if self.engine == "vector":
+            self.population = NeutronPopulation(capacity = len(neutrons["id"]), trajectory = self.trajectory, mesh = self.mesh, rng = self.rng, stats = self.stats, moderator = self.moderator, geometry = self.geometry, multigroup = self.multigroup, implicitCapture = self.implicitCapture)
+            for name in NeutronPopulation.fields:
+                getattr(self.population, name)[:len(neutrons["id"])] = neutrons[name]
+            self.population.size = len(neutrons["id"])
+            self.population.createdCount = meta["createdCount"]
+            self.population.eventCounts[:] = [self.eventCounts[name] for name in eventNames]
+            if self.keepHistory:
+                self.archive = NeutronPopulation()
+            return
+
+        self.createdCount = meta["createdCount"]
+        for i in range(len(neutrons["id"])):
+            neutron = Neutron(neutronId = int(neutrons["id"][i]), energy = float(neutrons["energy"][i]), time = float(neutrons["time"][i]), startPos = (neutrons["x"][i], neutrons["y"][i]), eventCount = int(neutrons["eventCount"][i]), weight = float(neutrons["weight"][i]), trajectory = self.trajectory, rng = self.rng, stats = self.stats, moderator = self.moderator, geometry = self.geometry, multigroup = self.multigroup, implicitCapture = self.implicitCapture, keepPath = self.keepHistory)
+            neutron.angle = float(neutrons["angle"][i])
+            neutron.eventType = populationEventNames[neutrons["eventType"][i]]
+
+            if self.keepHistory:
+                self.neutronList.append(neutron)
+            self.activeNeutrons.append(neutron)
+
+
+    # The live neutrons of a resumed run are its new starting point, for a new trajectory store and output.
+    def recordRestart(self):
+        state = self.liveState()
+        energies = state["neutron.energy"]
+
+        if self.trajectory is not None:
+            self.trajectory.append(state["neutron.id"], state["neutron.x"], state["neutron.y"], energies, 0)
+
+        # The speeds are found as in Neutron.energySpeed.
+        return np.column_stack((energies, 1.38e6*np.sqrt(energies)))
+
+
+    def powerIteration(self, inactive = 10, active = 40, entropyMesh = (8,8)):
+
+        # Runs the reactor in power iteration mode, with neutronStart neutrons in every generation. The finished iteration is returned, and its mean k_eff over the active cycles is taken as the reactor's k_eff.
+        self.generations = PowerIteration(self.neutronStart, inactive, active, self.dimensions, entropyMesh, self.thermal, self.rng, moderator = self.moderator, geometry = self.geometry, multigroup = self.multigroup).run()
+        self.k_eff = self.generations.k_mean()
+
+        return self.generations
+
+
+    # The parameters which define a run, as saved with its output.
+    def parameters(self):
+        return {
+            "neutronStart": self.neutronStart,
+            "stepCount": self.stepCount,
+            "dimensions": list(self.dimensions),
+            "thermal": self.thermal,
+            "engine": self.engine,
+            "populationTarget": self.populationTarget,
+            "controlMethod": self.controlMethod,
+            "moderatorTemperature": None if callable(self.moderatorTemperature) else self.moderatorTemperature,
+            "groups": self.groups if self.groups is None or np.ndim(self.groups) == 0 else list(self.groups),
+            "implicitCapture": self.implicitCapture,
+            "weightCutoff": self.weightCutoff,
+            "weightWindow": None if self.weightWindow is None else self.weightWindow.parameters(),
+        }
+
+
+    # Begins the output of a run with its parameters, and the energies of the starting neutrons as its first step.
+    def beginOutput(self, rows):
+        if self.output is None:
+            return
+
+        self.output.begin(self.parameters())
+        self.output.writeStep(self.k_eff, 0, 0, len(rows), rows)
+
+
+    # Ends the output of a run, saving its tallies with it.
+    def endOutput(self):
+        if self.output is None:
+            return
+
+        arrays = self.tallies.arrays()
+        if self.mesh is not None:
+            arrays.update(self.mesh.arrays())
+
+        self.output.writeTallies(arrays)
+        self.output.close()
+
+
+    def controlPopulation(self, bank = ()):
+
+        # Population control for the history engine, over the active neutrons followed by the entries of the fission bank.
+        weights = np.array([neutron.weight for neutron in self.activeNeutrons] + [entry[3] for entry in bank])
+        index, newWeights = populationControl.methods[self.controlMethod](weights, self.populationTarget, self.rng)
+        self.selectNeutrons(bank, index, newWeights)
+
+
+    def applyWindow(self, bank = ()):
+
+        # The weight window for the history engine, over the active neutrons followed by the entries of the fission bank, with the neutrons killed by roulette counted.
+        energies = [neutron.energy for neutron in self.activeNeutrons] + [entry[2] for entry in bank]
+        weights = [neutron.weight for neutron in self.activeNeutrons] + [entry[3] for entry in bank]
+        index, newWeights = self.window.apply(weights, energies, self.rng)
+        self.eventCounts["roulette"] += len(weights) - self.selectNeutrons(bank, index, newWeights)
+
+
+    def applyWindowVector(self):
+
+        # The weight window for the vector engine, over the live population, with the neutrons killed by roulette counted.
+        population = self.population
+        weights = population.weight[:population.size]
+        index, newWeights = self.window.apply(weights, population.energy[:population.size], self.rng)
+
+        # Most steps leave every neutron in place, and only their weights need be changed.
+        if len(index) == population.size and np.all(index == np.arange(population.size)):
+            weights[:] = newWeights
+            return
+
+        population.eventCounts[ROULETTE] += population.size - len(np.unique(index))
+        population.resample(index, newWeights, self.archive)
+
+
+    def selectNeutrons(self, bank, index, newWeights):
+
+        # Carries forward the neutrons at the given indices of the active neutrons followed by the entries of the bank, with their new weights, returning how many were selected. A neutron selected more than once is split, with each extra copy created as a new neutron. Neutrons which are not selected are killed, and bank entries which are not selected are never made into neutrons.
+        active = len(self.activeNeutrons)
+        selected = []
+        used = set()
+
+        for i, weight in zip(index, newWeights):
+            if i >= active:
+                neutron = self.bankNeutrons([bank[i - active]])[0]
+            elif i in used:
+                self.createdCount += 1
+                neutron = self.activeNeutrons[i].split(neutronId = self.createdCount)
+                neutron.startTrajectory()
+                if self.keepHistory:
+                    self.neutronList.append(neutron)
+            else:
+                neutron = self.activeNeutrons[i]
+            used.add(i)
+
+            neutron.weight = weight
+            selected.append(neutron)
+
+        for i, neutron in enumerate(self.activeNeutrons):
+            if i not in used:
+                neutron.absorbed = True
+
+        self.activeNeutrons = selected
+        return len(used)
+
+
     # Calculate values of k_eff; the if statement mitigates against division by zero
     def calcCrit(self, gain, loss):
         if gain and loss != 0:
             self.k_eff = gain/loss
 
-    # Returns the a list of neutrons which have existed at any point in the simulation. Each neutron has a memory of its path.
+    # Returns the a list of neutrons which have existed at any point in the simulation. Each neutron has a memory of its path. The vector engine keeps no neutron objects, so a population holding the final state of every archived neutron, followed by those still alive, is returned instead. If the history was not kept, only the live neutrons are returned.
     def neutronData(self):
-        return self.neutronList
\ No newline at end of file
+        if self.engine == "vector":
+            if self.archive is None:
+                return self.population
+
+            neutrons = NeutronPopulation(capacity = self.archive.size + self.population.size)
+            neutrons.extend(self.archive)
+            neutrons.extend(self.population)
+            return neutrons
+
+        if self.keepHistory:
+            return self.neutronList
+        return self.activeNeutrons
\ No newline at end of file
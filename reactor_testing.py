@@ -0,0 +1,427 @@
+import pytest
+import numpy as np
+
+from reactor import Reactor
+import populationControl
+from trajectoryStore import TrajectoryStore
+from runFormat import RunWriter, loadRun
+from batchRunner import runBatches
+import sweep
+from stoppingRules import RelativeError, WallClock
+from meshTally import MeshTally
+import geometry
+from neutron import Neutron
+from neutronPopulation import NeutronPopulation
+from varianceReduction import WeightWindow, figureOfMerit
+
+"""
+This file performs unit tests on the reactor class, and checks the two engines against each other. As with neutron_testing.py, it is run from the terminal with:
+
+pythom -m pytest reactor_testing.py
+"""
+
+def test_vector_engine_shapes():
+    reactor = Reactor(50, 20, engine="vector", keepEnergyList=True)
+    reactor.startUp()
+
+    assert len(reactor.k_effData) == reactor.stepCount + 1
+    assert len(reactor.energyList) == reactor.stepCount + 1
+    assert len(reactor.energyList[0]) == 50
+    assert reactor.energyList[1].shape[1] == 2
+
+def test_vector_engine_thermal():
+    # After a single step the fission neutrons have not yet moved, so they should all hold the thermal energy.
+    reactor = Reactor(200, 1, engine="vector", thermal=True)
+    reactor.startUp()
+
+    population = reactor.population
+    newNeutrons = population.eventType[:population.size] == 0
+    assert np.count_nonzero(newNeutrons) > 0
+    assert np.all(population.energy[:population.size][newNeutrons] == 0.025)
+
+def test_engines_agree():
+    # The mean k_eff over a short run should agree between the engines to within statistical noise.
+    means = []
+    for engine in ["history", "vector"]:
+        reactor = Reactor(200, 40, engine=engine)
+        reactor.startUp()
+        means.append(np.mean(reactor.k_effData[1:]))
+
+    assert means[0] == pytest.approx(means[1], rel=0.15)
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        Reactor(engine="gpu")
+
+@pytest.mark.parametrize("engine", ["history", "vector"])
+def test_active_set_compaction(engine):
+    # Without the history, only live neutrons are kept; with it, every neutron which was created is returned.
+    reactor = Reactor(100, 20, engine=engine, keepHistory=False)
+    reactor.startUp()
+
+    if engine == "vector":
+        assert np.all(reactor.population.alive[:reactor.population.size])
+    else:
+        assert not any(neutron.absorbed for neutron in reactor.neutronData())
+
+    reactor = Reactor(100, 20, engine=engine)
+    reactor.startUp()
+
+    assert len(reactor.neutronData()) > 100
+
+def test_comb_preserves_weight():
+    weights = np.random.uniform(0.5, 2, 1000)
+    index, newWeights = populationControl.comb(weights, 300)
+
+    assert len(index) == 300
+    assert newWeights.sum() == pytest.approx(weights.sum())
+
+@pytest.mark.parametrize("engine", ["history", "vector"])
+def test_population_control(engine):
+    # A supercritical reactor under combing should hold its live population at the target.
+    reactor = Reactor(100, 60, engine=engine, keepHistory=False, populationTarget=100)
+    reactor.startUp()
+
+    live = reactor.population.size if engine == "vector" else len(reactor.activeNeutrons)
+    assert live == 100
+    assert np.mean(reactor.k_effData[1:]) > 1
+
+def test_trajectory_store_matches_lists():
+    # With the same random numbers, a trajectory store should hold exactly the paths the neutrons would otherwise keep in their own lists.
+    reactor = Reactor(20, 10, rng = 7)
+    reactor.startUp()
+
+    store = TrajectoryStore(chunkSize = 64)
+    stored = Reactor(20, 10, trajectory = store, rng = 7)
+    stored.startUp()
+
+    for neutron in reactor.neutronData():
+        rows = store.forNeutron(neutron.id)
+        assert np.array_equal(rows["x"], neutron.posDataX)
+        assert np.array_equal(rows["y"], neutron.posDataY)
+        assert np.array_equal(rows["energy"][1:], neutron.energyData)
+
+def test_trajectory_store_vector(tmp_path):
+    # Every step of the vector engine is written to the store, and may be spilled to disk.
+    store = TrajectoryStore(chunkSize = 100, spillPath = str(tmp_path))
+    reactor = Reactor(200, 10, engine="vector", trajectory = store, keepEnergyList = True)
+    reactor.startUp()
+
+    steps = store.column("step")
+    assert isinstance(store.column("x"), np.memmap)
+    assert np.all(np.diff(steps) >= 0)
+    assert len(store.forStep(0)["id"]) == 200
+    assert len(store.forStep(1)["id"]) == len(reactor.energyList[1]) + np.count_nonzero(store.forStep(1)["event"] == 0)
+
+@pytest.mark.parametrize("engine", ["history", "vector"])
+def test_run_format(tmp_path, engine):
+    # A saved run should read back the reactor's k_effData, energyList and tallies, and its trajectories.
+    writer = RunWriter(str(tmp_path / "run"))
+    reactor = Reactor(50, 15, engine=engine, output=writer, trajectory=writer.trajectoryStore(), keepEnergyList=True)
+    reactor.startUp()
+
+    run = loadRun(str(tmp_path / "run"))
+    assert run.complete
+    assert run.parameters["neutronStart"] == 50
+    assert np.allclose(run.k_effData, reactor.k_effData)
+    assert len(run.energyList) == len(reactor.energyList)
+    assert np.allclose(run.energyList[-1], reactor.energyList[-1])
+    assert len(run.trajectory.forStep(0)["id"]) == 50
+    assert np.allclose(run.tally("stepMean"), reactor.tallies.steps.means(), equal_nan=True)
+
+@pytest.mark.parametrize("engine", ["history", "vector"])
+def test_tallies_match_energy_list(engine):
+    # Without population control every weight is 1, so the tallies should give the plain statistics of energyList.
+    reactor = Reactor(100, 10, engine=engine, keepEnergyList=True)
+    reactor.startUp()
+
+    tallies = reactor.tallies
+    means = [np.mean(step[:,0]) for step in reactor.energyList]
+    variances = [np.var(step[:,0]) for step in reactor.energyList]
+    assert np.allclose(tallies.steps.means(), means)
+    assert np.allclose(tallies.steps.variances(), variances)
+
+    final = reactor.energyList[-1]
+    thermal = (final[:,0] >= 0.01) & (final[:,0] < 1)
+    assert tallies.thermalEnergy.last.sum() == np.count_nonzero(thermal)
+    assert np.isclose(tallies.thermalFlux.last.sum(), final[thermal, 1].sum())
+
+    # Unless it is asked for, energyList is not kept.
+    reactor = Reactor(100, 10, engine=engine)
+    reactor.startUp()
+    assert reactor.energyList == []
+    assert len(reactor.tallies.steps.means()) == 11
+
+@pytest.mark.parametrize("engine", ["history", "vector"])
+def test_mesh_tally(engine):
+    # With an extent covering every neutron, the mesh should hold every collision and fission in the run.
+    mesh = MeshTally((20,20), extent = ((-1000, 1000), (-1000, 1000)))
+    reactor = Reactor(100, 10, engine=engine, mesh=mesh)
+    reactor.startUp()
+
+    events = reactor.eventCounts
+    assert mesh.collisions.sum() == events["fission"] + events["capture"] + events["scatterU"] + events["scatterH"]
+    assert mesh.fissions.sum() == events["fission"]
+    assert mesh.trackLength.sum() > 0
+
+def test_mesh_tally_track_length():
+    # A track crossing several cells is divided between them, and the part outside the extent is not counted.
+    mesh = MeshTally((4,4), extent = [4,4])
+    mesh.score([0.5, -1], [0.5, 2.5], [3.5, 2], [0.5, 2.5], 1.0, [True, False])
+
+    assert np.allclose(mesh.trackLength[:,0], [0.5, 1, 1, 0.5])
+    assert np.allclose(mesh.trackLength[:,2], [1, 1, 0, 0])
+    assert mesh.fissions[3,0] == 1
+    assert mesh.collisions.sum() == 2
+
+@pytest.mark.parametrize("engine", ["history", "vector"])
+def test_checkpoint_resume(tmp_path, engine):
+    # A run resumed from a checkpoint should finish exactly as the uninterrupted run did.
+    path = str(tmp_path / "checkpoint.npz")
+    reactor = Reactor(100, 25, engine=engine, rng=4, populationTarget=120, mesh=MeshTally((5,5)), checkpointPath=path, checkpointEvery=10)
+    reactor.startUp()
+
+    resumed = Reactor.resume(path)
+    assert resumed.k_effData == reactor.k_effData
+    assert resumed.eventCounts == reactor.eventCounts
+    assert np.array_equal(resumed.tallies.steps.means(), reactor.tallies.steps.means())
+    assert np.array_equal(resumed.mesh.trackLength, reactor.mesh.trackLength)
+
+    with pytest.raises(ValueError, match="checkpointPath"):
+        Reactor(100, 25, engine=engine, checkpointEvery=10)
+
+@pytest.mark.parametrize("engine", ["history", "vector"])
+def test_instrumentation(engine):
+    # Instrumenting a run records every step and event without changing the result.
+    plain = Reactor(100, 10, engine=engine, rng=6)
+    plain.startUp()
+    reactor = Reactor(100, 10, engine=engine, rng=6, instrument=True)
+    reactor.startUp()
+
+    assert reactor.k_effData == plain.k_effData
+    stats = reactor.stats.arrays()
+    assert len(stats["stepTime"]) == 10
+    assert {name: int(counts.sum()) for name, counts in stats["events"].items()} == reactor.eventCounts
+    assert stats["population"][-1] == (reactor.population.size if engine == "vector" else len(reactor.activeNeutrons))
+    assert stats["phaseTime"]["crossSection"] > 0
+    assert "events:" in reactor.stats.summary()
+
+@pytest.mark.parametrize("event, energy", [("scatterEventU", 1e3), ("scatterEventH", 1e3), ("scatterEventH", 0.02)])
+def test_event_queues_match_neutron(event, energy):
+    # An event carried out for a whole queue at once should give the same distribution of energies as the neutron method, carried out one neutron at a time.
+    count = 4000
+    rng = np.random.default_rng(8)
+    population = NeutronPopulation(count, rng = rng)
+    population.addNeutrons(np.zeros(count), np.zeros(count), np.full(count, energy))
+    getattr(population, event)(np.arange(count))
+
+    energies = []
+    for i in range(count):
+        neutron = Neutron(energy = energy, rng = rng)
+        getattr(neutron, event)()
+        energies.append(neutron.energy)
+
+    assert np.mean(population.energy[:count]) == pytest.approx(np.mean(energies), rel=0.05)
+    assert np.median(population.energy[:count]) == pytest.approx(np.median(energies), rel=0.05)
+
+def test_event_queues():
+    # Every moving neutron is in the queue of its event, in population order.
+    population = NeutronPopulation()
+    events = np.array([4, 1, 3, 4, 2, 1], dtype=np.int8)
+    queues = population.eventQueues(np.arange(10, 16), events)
+
+    assert [list(queue) for queue in queues] == [[], [11, 15], [14], [12], [10, 13], []]
+
+def test_moderator_temperature():
+    # A hotter moderator gives thermal neutrons a higher mean energy.
+    means = []
+    for temperature in [300, 900]:
+        reactor = Reactor(300, 60, engine="vector", thermal=True, rng=2, moderatorTemperature=temperature)
+        reactor.startUp()
+        thermal = reactor.tallies.thermalEnergy
+        means.append(np.sum(thermal.total*thermal.centres())/np.sum(thermal.total))
+
+    assert means[1] > means[0]
+
+def test_geometry_material():
+    lattice = geometry.pinCellLattice(pins = (2,2))
+
+    assert lattice.width == pytest.approx(2.52)
+    assert lattice.materialNames[lattice.material(0.63, 0.63)] == "fuel"
+    assert lattice.materialNames[lattice.material(0.05, 0.05)] == "water"
+    assert list(lattice.material(np.array([0.63, 1.89, 0.05]), np.array([1.89, 0.63, 1.3]))) == [0, 0, 1]
+    assert not lattice.inside(-0.1, 1)
+
+@pytest.mark.parametrize("engine", ["history", "vector"])
+def test_geometry_leakage(engine):
+    # A small lattice of pins loses neutrons from its edges; the leaked neutrons count towards the loss of each step.
+    reactor = Reactor(200, 30, engine = engine, rng = 4, geometry = geometry.pinCellLattice(pins = (3,3)))
+    reactor.startUp()
+
+    assert reactor.dimensions == [pytest.approx(3.78), pytest.approx(3.78)]
+    assert reactor.eventCounts["leak"] > 0
+    assert reactor.eventCounts["fission"] > 0
+
+def test_geometry_homogeneous():
+    # A block of the mixture large enough that few neutrons leak behaves as the infinite medium, by power iteration.
+    infinite = Reactor(500, rng = 2).powerIteration(inactive = 5, active = 15)
+    bounded = Reactor(500, rng = 2, geometry = geometry.homogeneous(1000, 1000)).powerIteration(inactive = 5, active = 15)
+
+    assert bounded.k_mean() == pytest.approx(infinite.k_mean(), abs = 4*np.hypot(bounded.k_error(), infinite.k_error()))
+
+def test_geometry_periodic():
+    # A periodic block never leaks, and lookups outside it are folded back into it.
+    lattice = geometry.pinCellLattice(pins = (2,2), periodic = True)
+    assert lattice.material(0.63 + 2.52, -0.63 - 2.52) == lattice.material(0.63, 1.89)
+
+    # A point just below zero folds onto the far edge, which belongs to the last cell.
+    assert lattice.material(-1e-17, 0.5) == lattice.material(lattice.width - 1e-9, 0.5)
+    assert np.array_equal(lattice.material(np.array([-1e-17]), np.array([-1e-17])), [lattice.material(lattice.width - 1e-9, lattice.height - 1e-9)])
+
+    reactor = Reactor(100, 20, engine = "vector", rng = 4, geometry = geometry.homogeneous(2, 2, periodic = True))
+    reactor.startUp()
+    assert reactor.eventCounts["leak"] == 0
+
+def test_sweep_cache(tmp_path, monkeypatch):
+    grid = {"neutronStart": [50], "stepCount": [10], "engine": ["vector"], "thermal": [False, True]}
+    results = sweep.sweep(grid, seeds = [1, 2], workers = 1, cacheDirectory = tmp_path)
+
+    assert [(result["parameters"]["thermal"], result["seed"]) for result in results] == [(False, 1), (False, 2), (True, 1), (True, 2)]
+    assert len(results[0]["k_effData"]) == 11
+
+    # A second sweep over the same configurations is read from the cache, without running any reactor.
+    def fail(parameters, seed):
+        raise AssertionError("configuration was run again")
+    monkeypatch.setattr(sweep, "runConfiguration", fail)
+
+    cached = sweep.sweep(grid, seeds = [1, 2], workers = 1, cacheDirectory = tmp_path)
+    for result, again in zip(results, cached):
+        assert np.array_equal(result["k_effData"], again["k_effData"])
+        assert np.array_equal(result["tallies.stepMean"], again["tallies.stepMean"], equal_nan = True)
+
+def test_sweep_enrichment():
+    # With more U235 against the same hydrogen, fewer neutrons scatter from hydrogen for every one absorbed in the fuel.
+    assert sweep.reactorParameters({"thermal": True}) == {"thermal": True}
+
+    ratios = []
+    for enrichment in (0.02, 0.08):
+        counts = dict(zip(sweep.eventNames, sweep.runConfiguration({"neutronStart": 300, "stepCount": 40, "engine": "vector", "enrichment": enrichment}, 3)["eventCounts"]))
+        ratios.append(counts["scatterH"]/(counts["fission"] + counts["capture"]))
+    assert ratios[1] < ratios[0]
+
+@pytest.mark.parametrize("engine", ["history", "vector"])
+def test_iter_steps(engine):
+    # Iterating over the steps runs the same simulation as startUp, yielding a summary of each step.
+    reactor = Reactor(100, 20, engine = engine, rng = 6)
+    summaries = list(reactor.iterSteps())
+
+    finished = Reactor(100, 20, engine = engine, rng = 6)
+    finished.startUp()
+
+    assert [summary["step"] for summary in summaries] == list(range(1, 21))
+    assert [summary["k_eff"] for summary in summaries] == finished.k_effData[1:]
+    assert summaries[-1]["meanEnergy"] == finished.tallies.steps.means()[20]
+    assert reactor.eventCounts == finished.eventCounts
+
+@pytest.mark.parametrize("engine", ["history", "vector"])
+def test_iter_steps_paused(engine, tmp_path):
+    # Leaving the loop over the steps early pauses the run, which startUp then carries on to the same end as an unbroken run; a finished run cannot be run again.
+    reactor = Reactor(100, 20, engine = engine, rng = 6, output = RunWriter(tmp_path/"run"))
+    for summary in reactor.iterSteps():
+        if summary["step"] == 3:
+            break
+    reactor.startUp()
+
+    finished = Reactor(100, 20, engine = engine, rng = 6)
+    finished.startUp()
+
+    assert reactor.k_effData == finished.k_effData
+    assert reactor.eventCounts == finished.eventCounts
+    assert loadRun(tmp_path/"run").k_effData.tolist() == finished.k_effData
+    with pytest.raises(ValueError, match="finished"):
+        reactor.startUp()
+
+@pytest.mark.parametrize("engine", ["history", "vector"])
+def test_stopping_rules(engine, tmp_path):
+    reactor = Reactor(200, 1000, engine = engine, rng = 6, output = RunWriter(tmp_path/"run"))
+    reactor.startUp(stoppingRules = [RelativeError(0.05, window = 20, batches = 4)])
+
+    assert len(reactor.k_effData) - 1 < 1000
+    assert reactor.stopReason.startswith("relative error")
+    assert len(loadRun(tmp_path/"run").k_effData) == len(reactor.k_effData)
+
+    reactor = Reactor(200, 1000, engine = engine, rng = 6)
+    reactor.startUp(stoppingRules = [WallClock(0)])
+    assert len(reactor.k_effData) == 2
+
+    with pytest.raises(ValueError):
+        RelativeError(0.05, window = 3, batches = 4)
+
+@pytest.mark.parametrize("engine", ["history", "vector"])
+def test_multigroup(engine):
+    # Every energy is one of those representing the groups, and k_eff agrees with the continuous-energy reactor.
+    reactor = Reactor(300, 60, engine = engine, rng = 3, groups = 30)
+    reactor.startUp()
+    continuous = Reactor(300, 60, engine = engine, rng = 3)
+    continuous.startUp()
+
+    assert np.isin(reactor.neutronData()[0].energy if engine == "history" else reactor.population.energy[:reactor.population.size], reactor.multigroup.energies).all()
+    assert np.mean(reactor.k_effData[20:]) == pytest.approx(np.mean(continuous.k_effData[20:]), abs = 0.1)
+
+    with pytest.raises(ValueError):
+        Reactor(groups = 30, geometry = geometry.homogeneous())
+
+@pytest.mark.parametrize("engine", ["history", "vector"])
+def test_implicit_capture(engine, tmp_path):
+    # No neutron is captured or split beyond the window, the narrow window plays roulette, and k_eff agrees with the analog reactor. A checkpoint keeps the window, so a resumed run finishes as the whole run does.
+    settings = dict(engine = engine, rng = 3, implicitCapture = True, weightWindow = WeightWindow(0.998, upperRatio = 2))
+    reactor = Reactor(100, 24, **settings)
+    reactor.startUp()
+    analog = Reactor(100, 24, engine = engine, rng = 3)
+    analog.startUp()
+
+    assert reactor.eventCounts["capture"] == 0 and reactor.eventCounts["roulette"] > 0
+    weights = reactor.population.weight[:reactor.population.size] if engine == "vector" else [neutron.weight for neutron in reactor.activeNeutrons]
+    assert 0.998 <= np.min(weights) and np.max(weights) <= 2*0.998
+    assert np.mean(reactor.k_effData[4:]) == pytest.approx(np.mean(analog.k_effData[4:]), abs = 0.1)
+
+    path = str(tmp_path / "run.npz")
+    Reactor(100, 12, checkpointPath = path, checkpointEvery = 12, **settings).startUp()
+    resumed = Reactor.resume(path, stepCount = 24)
+    assert resumed.k_effData == reactor.k_effData
+
+    error, merit = figureOfMerit(reactor.k_effData, 2.0, inactive = 4, batches = 4)
+    assert merit == pytest.approx(1/(error**2*2.0))
+    assert figureOfMerit(reactor.k_effData, 2.0, inactive = 22, batches = 4) == (None, pytest.approx(np.nan, nan_ok = True))
+
+    with pytest.raises(ValueError):
+        Reactor(implicitCapture = True, weightWindow = WeightWindow(), populationTarget = 100)
+
+def test_batch_runner_reproducible():
+    # The merged results depend only on the master seed, not on how many processes run the batches.
+    serial = runBatches(200, 10, batches = 4, masterSeed = 1, workers = 1, engine = "vector")
+    parallel = runBatches(200, 10, batches = 4, masterSeed = 1, workers = 2, engine = "vector")
+
+    assert serial["k_eff"][0] == parallel["k_eff"][0]
+    assert np.array_equal(serial["meanEnergy"][0], parallel["meanEnergy"][0])
+    assert serial["k_eff"][1] > 0
+    assert sum(batch["eventCounts"][0] for batch in serial["batches"]) > 0
+
+def test_batch_runner_extinct():
+    # A batch whose population dies out still gives a value at every step, with no mean energy after it died, so that it merges with the others.
+    results = runBatches(6, 60, batches = 3, workers = 1, geometry = geometry.pinCellLattice((1,1)))
+
+    assert all(len(batch["meanEnergy"]) == 61 for batch in results["batches"])
+    assert any(np.isnan(batch["meanEnergy"][-1]) for batch in results["batches"])
+    assert results["meanEnergy"][0].shape == (61,)
+    assert results["k_effData"][0].shape == (61,)
+
+def test_power_iteration():
+    reactor = Reactor(500, rng = 2)
+    generations = reactor.powerIteration(inactive = 2, active = 6)
+
+    low, high = generations.confidenceInterval()
+    assert len(generations.k_cycles) == 8
+    assert len(generations.entropy) == 8
+    assert low < reactor.k_eff < high
+    assert 1 < reactor.k_eff < 1.5
@@ -0,0 +1,178 @@
+import numpy as np
+import json
+import os
+
+"""
+This file defines the on-disk format used to save a simulation run, replacing the pickled reactor and object array of neutrons. A run is a directory holding:
+
+- meta.json: the format version and the parameters of the reactor, written when the run begins and again when it ends.
+- one binary file per step-level column (k_eff, gain, loss and population), with one value appended per step, following a first value for the starting neutrons.
+- energyList.bin and energyOffsets.bin: the [energy, speed] rows of every step, written one after the other, and the number of rows written by the end of each step, so that the rows of step i lie between offsets i and i+1.
+- a trajectory folder, if the run keeps trajectories, which is the spill folder of a TrajectoryStore.
+- tally_<name>.npy: the arrays of the reactor's tallies (see tallies.py), and of its mesh tally if it has one (see meshTally.py), written when the run ends.
+
+Every column is appended to as the run progresses, rather than saved when it is finished, so even a very large run is saved without a pause at the end, and a run which stops early can still be read up to its last step. Reading is lazy: RunReader only memory-maps a column when it is first used, so a plot need only load the data it needs.
+"""
+
+from trajectoryStore import TrajectoryStore
+
+formatVersion = 1
+
+stepColumns = {"k_eff": np.float64, "gain": np.float64, "loss": np.float64, "population": np.int64}
+
+
+class RunWriter():
+    def __init__(self, path):
+        self.path = path
+        self.files = None
+        self.meta = None
+        self.rowCount = 0
+        self.store = None
+
+        os.makedirs(path, exist_ok=True)
+
+
+    # Returns a trajectory store which spills into the run's folder, so that trajectories are streamed to disk as part of the run.
+    def trajectoryStore(self, **kwargs):
+        self.store = TrajectoryStore(spillPath = os.path.join(self.path, "trajectory"), **kwargs)
+        return self.store
+
+
+    def writeMeta(self, complete):
+        self.meta["complete"] = complete
+        with open(os.path.join(self.path, "meta.json"), "w") as file:
+            json.dump(self.meta, file, indent = 2)
+
+
+    def begin(self, parameters):
+        # Called by the reactor as its run begins. Any previous run in the same folder is overwritten.
+        self.meta = {"version": formatVersion, "parameters": parameters, "trajectory": False}
+        self.writeMeta(complete = False)
+
+        names = list(stepColumns) + ["energyList", "energyOffsets"]
+        self.files = {name: open(os.path.join(self.path, F"{name}.bin"), "wb") for name in names}
+
+        self.rowCount = 0
+        self.files["energyOffsets"].write(np.array([0], dtype=np.int64).tobytes())
+
+
+    def writeStep(self, k_eff, gain, loss, population, energies):
+        # Appends one step: its k_eff, weighted gain and loss, live population, and the [energy, speed] rows of the neutrons which stepped.
+        values = {"k_eff": k_eff, "gain": gain, "loss": loss, "population": population}
+        for name, dtype in stepColumns.items():
+            self.files[name].write(np.array([values[name]], dtype=dtype).tobytes())
+
+        energies = np.asarray(energies, dtype=np.float64).reshape(-1, 2)
+        self.files["energyList"].write(energies.tobytes())
+
+        self.rowCount += len(energies)
+        self.files["energyOffsets"].write(np.array([self.rowCount], dtype=np.int64).tobytes())
+
+
+    def writeTallies(self, arrays):
+        # The tallies are small, holding one value per step or per bin, so they are saved whole when the run ends.
+        for name, values in arrays.items():
+            np.save(os.path.join(self.path, F"tally_{name}.npy"), values)
+        self.meta["tallies"] = list(arrays)
+
+
+    def close(self):
+        for file in self.files.values():
+            file.close()
+
+        if self.store is not None:
+            self.store.finalize()
+            self.store.close()
+            self.meta["trajectory"] = True
+
+        self.writeMeta(complete = True)
+
+
+class EnergyList():
+    # Gives the energy rows of a run indexed by step, as reactor.energyList was: energyList[i] is an (n, 2) array of [energy, speed] rows, here a view of the memory-mapped file.
+    def __init__(self, rows, offsets):
+        self.rows = rows
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, step):
+        if step < 0:
+            step += len(self)
+        return self.rows[self.offsets[step]:self.offsets[step + 1]]
+
+
+class RunReader():
+    def __init__(self, path):
+        self.path = path
+
+        with open(os.path.join(path, "meta.json")) as file:
+            self.meta = json.load(file)
+
+        if self.meta["version"] > formatVersion:
+            raise ValueError(F"Run in {path} has format version {self.meta['version']}; this code reads up to version {formatVersion}")
+
+        self.parameters = self.meta["parameters"]
+        self.complete = self.meta["complete"]
+        self.columns = {}
+        self.store = None
+        self.tallyArrays = {}
+
+
+    def column(self, name, dtype = np.float64, width = None):
+        # Memory-maps a column the first time it is asked for. The length is taken from the size of the file, so a run which was interrupted can be read up to its last complete step.
+        if name not in self.columns:
+            filePath = os.path.join(self.path, F"{name}.bin")
+            itemSize = np.dtype(dtype).itemsize*(width or 1)
+            count = os.path.getsize(filePath)//itemSize
+            shape = (count,) if width is None else (count, width)
+
+            if count == 0:
+                self.columns[name] = np.empty(shape, dtype=dtype)
+            else:
+                self.columns[name] = np.memmap(filePath, dtype=dtype, mode="r", shape=shape)
+
+        return self.columns[name]
+
+
+    def stepColumn(self, name):
+        return self.column(name, stepColumns[name])
+
+
+    # The first row of each step column is written for the starting neutrons, so that k_effData begins with the reactor's initial value as it does on the reactor.
+    @property
+    def k_effData(self):
+        return self.stepColumn("k_eff")
+
+    @property
+    def energyList(self):
+        offsets = self.column("energyOffsets", np.int64)
+        rows = self.column("energyList", np.float64, width = 2)
+
+        # A step whose rows were only partly written is dropped.
+        steps = np.searchsorted(offsets, len(rows), side="right")
+        return EnergyList(rows, offsets[:steps])
+
+    def tally(self, name):
+        if name not in self.tallyArrays:
+            if name not in self.meta.get("tallies", []):
+                raise ValueError(F"Run in {self.path} has no tally '{name}'")
+            self.tallyArrays[name] = np.load(os.path.join(self.path, F"tally_{name}.npy"))
+        return self.tallyArrays[name]
+
+    @property
+    def tallies(self):
+        return {name: self.tally(name) for name in self.meta.get("tallies", [])}
+
+    @property
+    def trajectory(self):
+        if self.store is None:
+            if not os.path.isdir(os.path.join(self.path, "trajectory")):
+                raise ValueError(F"Run in {self.path} was saved without trajectories")
+            self.store = TrajectoryStore.load(os.path.join(self.path, "trajectory"))
+        return self.store
+
+
+def loadRun(path):
+    return RunReader(path)
@@ -1,15 +1,13 @@
-import numpy as np
-import matplotlib.pyplot as plt
-import pickle
-
-from neutron import Neutron
 from reactor import Reactor
-import copy
+from runFormat import RunWriter
+from meshTally import MeshTally
 
 """
 This file takes in the desired starting parameters and runs and instance of the simulation. We create two reactors to create appropriate data ranges for different graphs.
 
-The data for the given parameters take approximately 60 seconds to collect for a Ryzen-7 Processor laptop with 16G RAM.
+The data for the given parameters take approximately 60 seconds to collect for a Ryzen-7 Processor laptop with 16G RAM. For timings on other machines, and after changes to the code, run benchmarks.py.
+
+Each run is saved in the format given in runFormat.py, to a folder named run_{neutronCount}_{stepCount}. The data is written as the run progresses, and the trajectories of the neutrons are saved alongside it.
 """
 
 # This data set characterises the random walk graph. Weere the variable thermal is set to True (its default is False) neutrons produced in a fission event will be given an energy 0.025. The report decsribed why this is appropriate here.
@@ -24,15 +22,10 @@ neutronList = []
 
 parameters.append([neutronCount, stepCount])
 
-reactor = Reactor(neutronCount, stepCount, thermal=True)
-reactor.startUp()
-
-neutrons = reactor.neutronData()
-
-np.save(F"neutronData_{neutronCount}_{stepCount}", neutrons, allow_pickle = True)
+writer = RunWriter(F"run_{neutronCount}_{stepCount}")
 
-filehandler = open(F"reactor_{neutronCount}_{stepCount}.obj", 'wb') 
-pickle.dump(reactor, filehandler)
+reactor = Reactor(neutronCount, stepCount, thermal=True, output=writer, trajectory=writer.trajectoryStore())
+reactor.startUp()
 
 
 
@@ -45,15 +38,11 @@ neutronList = []
 
 parameters.append([neutronCount, stepCount])
 
-reactor = Reactor(neutronCount, stepCount)
-reactor.startUp()
-
-neutrons = reactor.neutronData()
-
 # We save the data with names corresponding to initialNeutron and stepCounts. 
-np.save(F"neutronData_{neutronCount}_{stepCount}", neutrons, allow_pickle = True)
+writer = RunWriter(F"run_{neutronCount}_{stepCount}")
 
-filehandler = open(F"reactor_{neutronCount}_{stepCount}.obj", 'wb') 
-pickle.dump(reactor, filehandler)
+# A mesh tally over the reactor dimensions collects the flux map (8.).
+reactor = Reactor(neutronCount, stepCount, output=writer, trajectory=writer.trajectoryStore(), mesh=MeshTally())
+reactor.startUp()
 
-# Addition data files may be created by copy-pasting this save format and adjusting the neutron/step count as desired. The names will automatically adjust.
\ No newline at end of file
+# Addition data files may be created by copy-pasting this save format and adjusting the neutron/step count as desired. The names will automatically adjust. For a set of runs over a range of parameters, sweep.py runs them in parallel and keeps their results in a cache, so that they are never simulated twice.
\ No newline at end of file
@@ -1,9 +1,10 @@
 
 import numpy as np
 import matplotlib.pyplot as plt
-import pickle
 import scipy.stats, scipy.optimize
 
+from runFormat import loadRun
+
 
 """
 This file plots the graphs of interest for the simulation:
@@ -18,6 +19,8 @@ This file plots the graphs of interest for the simulation:
 
 7. Distances from a neutron's point of production as a function of step count
 
+8. The track-length estimate of the flux over the reactor
+
 All data plotted and printed is given to 3sf.
 
 The data for the given parameters takes approx 60 seconds to run for a AMD Ryzen 7 4800H laptop.
@@ -26,25 +29,22 @@ The data for the given parameters takes approx 60 seconds to run for a AMD Ryzen
 # This was initially brought into the file using "from simulationFile import parameters" however this would cause the simulation file to be run again; hence it is added here for convenience. I had a workaround planned; i didnt have time to implement it!!
 parameters = [[30,10],[100,400]]
 
-# Loading in the data created in simulation file
-neutronList1 = np.load(F"neutronData_{parameters[0][0]}_{parameters[0][1]}.npy", allow_pickle= True)
-neutronList2 = np.load(F"neutronData_{parameters[1][0]}_{parameters[1][1]}.npy", allow_pickle= True)
-filehandler1 = open(F"reactor_{parameters[0][0]}_{parameters[0][1]}.obj", 'rb')
-filehandler2 = open(F"reactor_{parameters[1][0]}_{parameters[1][1]}.obj", 'rb')  
-reactor1 = pickle.load(filehandler1)
-reactor2 = pickle.load(filehandler2)
-
+# Loading in the data created in simulation file. The runs are read lazily: each column is only loaded from disk when a plot first uses it.
+run1 = loadRun(F"run_{parameters[0][0]}_{parameters[0][1]}")
+run2 = loadRun(F"run_{parameters[1][0]}_{parameters[1][1]}")
 
 ### Plotting 1. Random walk using first set of data
 
 plt.figure(1)
 # This line iterates over all neutrons and plots their paths; each colour denotes a single neutron's motion (conceding repetitions).
-for neutron in neutronList1:
-    plt.plot(neutron.posDataX, neutron.posDataY)
+trajectory1 = run1.trajectory
+for neutronId in trajectory1.neutronIds():
+    path = trajectory1.forNeutron(neutronId)
+    plt.plot(path["x"], path["y"])
 
-# This line highlights the positon of the starting neutrons in the simulation, to see from where the random walk evolves.
-for i in range(reactor1.neutronStart):
-    plt.scatter(neutronList1[i].posDataX[0], neutronList1[i].posDataY[0], s=10)
+# This line highlights the positon of the starting neutrons in the simulation, to see from where the random walk evolves. These are the neutrons recorded at step 0.
+start = trajectory1.forStep(0)
+plt.scatter(start["x"], start["y"], s=10, c=range(len(start["x"])), cmap="tab10")
 
 plt.xlabel("x direction (cm)")
 plt.ylabel("y direction (cm)")
@@ -55,12 +55,11 @@ plt.show()
 
 ### Plotting 2 and 3. Thermal neutron energy distribution and thermal flux.
 
-# This sets the appropriate range for the *thermal* energy distribution (allowing thermal = (0.01eV, 1eV])
-therm_en = []
-for i in reactor2.energyList[reactor2.stepCount - 1]:
-
-    if 0.01 < i[0] < 1:
-        therm_en.append(i[0])
+# This sets the appropriate range for the *thermal* energy distribution (allowing thermal = (0.01eV, 1eV]). The [energy, speed] rows of the neutrons in the final step are read from the run's memory-mapped file, and serve the flux below as well.
+stepCount2 = run2.parameters["stepCount"]
+rows = np.asarray(run2.energyList[stepCount2 - 1])
+thermal = (0.01 < rows[:,0]) & (rows[:,0] < 1)
+therm_en = rows[thermal,0]
 
 def maxDistribution(x, a, b):
     return (x**(1/2))*a*np.exp(-b*x)
@@ -85,12 +84,7 @@ plt.show()
 def maxDistribution2(x, a, b):
     return a*np.exp(-b*x)
 
-flux = []
-for value in reactor2.energyList[reactor2.stepCount - 1]:
-    if 0.01 < value[0] < 1:
-        flux.append(value[0]*value[1])
-
-scaledFlux = 1e-6*np.array(flux)
+scaledFlux = 1e-6*rows[thermal,0]*rows[thermal,1]
 
 hist, bins = np.histogram(scaledFlux, bins = "auto", density = True)
 
@@ -109,18 +103,9 @@ plt.ylabel("Normalised histogram data")
 plt.show()
 
 
-### 4. Plotting average energy of neutron as a funtion of steps taken
-stepCount = []
-avgEnergy = []
-
-for step in range(len(reactor2.energyList)):
-    stepCount.append(step)
-    tempEnergies = []
-
-    for neutron in reactor2.energyList[step]:
-        tempEnergies.append(neutron[0])
-
-    avgEnergy.append(np.average(tempEnergies))
+### 4. Plotting average energy of neutron as a funtion of steps taken; the mean energy of each step is tallied as the run goes.
+avgEnergy = run2.tally("stepMean")
+stepCount = np.arange(len(avgEnergy))
 
 
 mean1, std1 = np.mean(avgEnergy), np.std(avgEnergy)
@@ -142,17 +127,17 @@ def reactivity(k):
     return (k-1)/k
 
 reactivityDat = []
-for k in reactor2.k_effData:
+for k in run2.k_effData:
     if k == 0:
         reactivityDat.append(None)
     else:
         reactivityDat.append(reactivity(k))
 
-mean2, std2 = np.mean(reactor2.k_effData), np.std(reactor2.k_effData)
+mean2, std2 = np.mean(run2.k_effData), np.std(run2.k_effData)
 mean3, std3 = np.mean(reactivityDat), np.std(reactivityDat)
 
 plt.figure(5)
-plt.plot(stepCount, reactor2.k_effData)
+plt.plot(stepCount, run2.k_effData)
 plt.hlines(y=mean2, xmin=[0], xmax=[len(stepCount)], color="k", label=F"mean = {mean2:.3}", lw=1)
 plt.hlines(y=[mean2-std2, mean2+std2], xmin=[0], xmax=[len(stepCount)], colors='red', linestyles='--', lw=1, label=F"std = {std2:.3}")
 plt.xlabel("Step count")
@@ -177,14 +162,30 @@ plt.show()
 
 """
 plt.figure()
-for neutron in neutronList2:
-    dX = neutron.posDataX[-1] - neutron.posDataX[0]  
-    dY = neutron.posDataY[-1] - neutron.posDataX[0] 
+trajectory2 = run2.trajectory
+for neutronId in trajectory2.neutronIds():
+    path = trajectory2.forNeutron(neutronId)
+    dX = path["x"][-1] - path["x"][0]  
+    dY = path["y"][-1] - path["x"][0] 
     avg = (dX**2 + dY**2)**(1/2)
 
-    plt.scatter(neutron.eventCount, avg, s=1, color="purple")
+    plt.scatter(len(path["x"]) - 1, avg, s=1, color="purple")
 
 plt.xlabel("Number of steps")
 plt.ylabel("Magnitude of displacement")
 plt.show()
-"""
\ No newline at end of file
+"""
+
+
+### Plotting 8. The flux map, from the mesh tally of the second run; the track length in each cell is divided by the cell area.
+meshEdgesX = run2.tally("meshEdgesX")
+meshEdgesY = run2.tally("meshEdgesY")
+cellArea = np.diff(meshEdgesX)[0]*np.diff(meshEdgesY)[0]
+
+plt.figure(8)
+plt.pcolormesh(meshEdgesX, meshEdgesY, run2.tally("meshTrackLength").T/cellArea)
+plt.colorbar(label="Track-length flux (cm-1)")
+plt.xlabel("x direction (cm)")
+plt.ylabel("y direction (cm)")
+#plt.savefig(F"fluxMap_{parameters[1][0]}_{parameters[1][1]}.png")
+plt.show()
@@ -0,0 +1,49 @@
+import numpy as np
+
+"""
+This file holds the rules which may end a reactor run before its last step, once its answer is good enough (see Reactor.iterSteps). They are given to the reactor as a list, as in Reactor(...).startUp(stoppingRules = [RelativeError(0.005), WallClock(60)]), and are checked at the end of every step; the first to be met ends the run.
+
+A rule is any callable rule(reactor, summary) of the reactor and the summary of the step just finished, returning None to carry on, or a description of why the run should stop, which is kept as reactor.stopReason. Two are given here:
+
+- RelativeError: the relative standard error of the mean k_eff over a trailing window of steps has fallen below a target. The k_eff of neighbouring steps are correlated, as the neutrons of one step are the children of the last, so the standard error of the raw values would be too small; instead the window is divided into batches of consecutive steps, and the error is found from the spread of the batch means, which are far closer to independent.
+- WallClock: the run has taken longer than a budget of wall time.
+"""
+
+
+class RelativeError():
+    def __init__(self, target, window = 100, batches = 10):
+        if batches < 2 or window < batches:
+            raise ValueError(F"The error is found from at least two batches of at least one step each; a window of {window} steps cannot hold {batches} batches")
+        self.target = target
+        self.window = window - window % batches
+        self.batches = batches
+
+
+    def error(self, k_effData):
+        # The relative standard error of the mean k_eff over the last window steps (the initial value is not a step), or None before there are enough of them.
+        values = np.asarray(k_effData[1:], dtype=float)
+        if len(values) < self.window:
+            return None
+
+        means = values[-self.window:].reshape(self.batches, -1).mean(axis=1)
+        mean = np.mean(means)
+        if mean == 0:
+            return None
+        return np.std(means, ddof=1)/np.sqrt(self.batches)/abs(mean)
+
+
+    def __call__(self, reactor, summary):
+        error = self.error(reactor.k_effData)
+        if error is not None and error < self.target:
+            return F"relative error of k_eff {error:.2e} below {self.target} over the last {self.window} steps"
+        return None
+
+
+class WallClock():
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, reactor, summary):
+        if summary["elapsed"] >= self.seconds:
+            return F"wall time of {summary['elapsed']:.1f}s beyond {self.seconds}s"
+        return None
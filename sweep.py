@@ -0,0 +1,114 @@
+import numpy as np
+import os
+import json
+import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
+"""
+This file runs a parameter sweep: a reactor for every configuration of a grid of parameters, each with one or more seeds, spread across the cores of the machine with a process pool. It replaces copying the save block of simulationFile.py for every new dataset. For example:
+
+results = sweep({"neutronStart": [100, 1000], "stepCount": [200], "thermal": [False, True], "moderatorTemperature": [300, 600, 900]}, seeds = [0, 1])
+
+The grid maps the name of each parameter to the values it takes, and every combination of them is run. Its parameters are those of Reactor, given as plain values, along with two which change the fuel:
+
+- enrichment: the fraction of U235 in the uranium of the fuel, 0.04 in the standard mixture.
+- densities: the number densities of U235 and H-1, as multiples of those of the standard mixture (see geometry.py).
+
+A reactor with other densities is an infinite medium of that material, given to the reactor as a periodic geometry (tracked by delta tracking, so its random numbers differ from those of the standard infinite reactor, though its physics is the same).
+
+Every result is stored in a cache on disk, in sweepCache, under a hash of its parameters, its seed and the hash of the cross-section data (see creatingDistribution.crossSectionHash). A configuration already in the cache is loaded rather than run again, so a sweep may be extended, or its results plotted again and again, without repeating a simulation; changing the data files or the constants converting them gives new hashes, and the affected runs are redone. The simulation code itself is not part of the hash, so sweepVersion must be raised when a change to it changes the results.
+
+Each result is a dictionary of the configuration's parameters, its seed and its arrays: k_effData, eventCounts (in the order of reactor.eventNames) and the tallies of the run (see Tallies.arrays), under names beginning "tallies.".
+"""
+
+from reactor import Reactor, eventNames
+import creatingDistribution
+import geometry
+
+sweepDirectory = "sweepCache"
+sweepVersion = 3
+
+# The enrichment of the fuel of the standard mixture, to which N_U in creatingDistribution.py corresponds.
+standardEnrichment = 0.04
+
+
+def configurations(grid):
+    # Every combination of the values of the grid, as a list of dictionaries of parameters.
+    return [dict(zip(grid, values)) for values in itertools.product(*grid.values())]
+
+
+def configurationKey(parameters, seed):
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps({"parameters": parameters, "seed": seed, "data": creatingDistribution.crossSectionHash(), "version": sweepVersion}, sort_keys = True).encode())
+    return hasher.hexdigest()[:16]
+
+
+def reactorParameters(parameters):
+    # The parameters of the reactor for a configuration, with any enrichment or densities turned into the geometry of an infinite medium.
+    parameters = dict(parameters)
+    u, h = parameters.pop("densities", (1, 1))
+    u *= parameters.pop("enrichment", standardEnrichment)/standardEnrichment
+
+    if (u, h) != (1, 1):
+        dimensions = parameters.get("dimensions", [10,10])
+        parameters["geometry"] = geometry.homogeneous(dimensions[0], dimensions[1], material = (u, h), periodic = True)
+
+    return parameters
+
+
+def runConfiguration(parameters, seed):
+    # Runs a single configuration, returning only the arrays of its result. Finished neutrons are not kept, as nothing here needs them.
+    reactor = Reactor(rng = seed, keepHistory = False, **reactorParameters(parameters))
+    reactor.startUp()
+
+    arrays = {
+        "k_effData": np.array(reactor.k_effData, dtype=float),
+        "eventCounts": np.array([reactor.eventCounts[name] for name in eventNames], dtype=np.int64),
+    }
+    arrays.update({F"tallies.{name}": values for name, values in reactor.tallies.arrays().items()})
+    return arrays
+
+
+# A result is saved as a directory of .npy files, as the cross-section table is, with its parameters and seed as a JSON string under "meta".
+def saveResult(path, parameters, seed, arrays):
+    meta = np.array(json.dumps({"parameters": parameters, "seed": seed}))
+    creatingDistribution.saveArrays(path, dict(arrays, meta = meta))
+
+
+def loadResult(path):
+    arrays = {name[:-len(".npy")]: np.load(os.path.join(path, name)) for name in os.listdir(path) if name.endswith(".npy")}
+    meta = json.loads(str(arrays.pop("meta")))
+    return dict(arrays, parameters = meta["parameters"], seed = meta["seed"])
+
+
+def sweep(grid, seeds = (0,), workers = None, cacheDirectory = sweepDirectory):
+    # Runs every configuration of the grid (or list of configurations) with every seed, over a pool of worker processes (as many as there are cores, unless workers is given), and returns their results in that order. Results already in the cache are loaded instead; with workers = 1 the rest are run one after the other in this process.
+    if isinstance(grid, dict):
+        grid = configurations(grid)
+
+    jobs = [(parameters, int(seed)) for parameters in grid for seed in seeds]
+    paths = [os.path.join(cacheDirectory, F"result_{configurationKey(parameters, seed)}") for parameters, seed in jobs]
+    missing = [i for i, path in enumerate(paths) if not os.path.isdir(path)]
+
+    # Each result is saved as soon as it is finished, so a sweep which is stopped keeps the results it had.
+    if missing:
+        os.makedirs(cacheDirectory, exist_ok = True)
+        missingJobs = [jobs[i] for i in missing]
+
+        if workers == 1:
+            for i, (parameters, seed) in zip(missing, missingJobs):
+                saveResult(paths[i], parameters, seed, runConfiguration(parameters, seed))
+        else:
+            with ProcessPoolExecutor(max_workers = workers) as executor:
+                for i, arrays in zip(missing, executor.map(runConfiguration, *zip(*missingJobs))):
+                    saveResult(paths[i], jobs[i][0], jobs[i][1], arrays)
+
+    return [loadResult(path) for path in paths]
+
+
+if __name__ == "__main__":
+    results = sweep({"neutronStart": [1000], "stepCount": [100], "engine": ["vector"], "moderatorTemperature": [300, 600, 900], "enrichment": [0.03, 0.04, 0.05]})
+
+    for result in results:
+        print(F"{result['parameters']}: k_eff = {np.mean(result['k_effData'][1:]):.4f}")
@@ -0,0 +1,157 @@
+import numpy as np
+
+"""
+This file holds the tallies a reactor accumulates as it runs, in place of storing the energy and speed of every neutron at every step. Each tally is updated once per step with the arrays of the neutrons which stepped, weighted by their statistical weights, and holds a fixed number of values however many neutrons are followed.
+
+1. StepTally: the weighted mean and variance of the neutron energy at each step, accumulated with Welford's method (in the form which combines a whole batch of values at once).
+
+2. HistogramTally: a histogram over fixed bins, holding both the total over every step and the histogram of the most recent step alone. Tallies uses these for the energy spectrum over logarithmic bins, and for the thermal energy distribution and thermal flux (the sum of n*v in each bin) over linear bins between 0.01eV and 1eV.
+"""
+
+
+class StepTally():
+    def __init__(self, stepCount = 0):
+        self.weight = np.zeros(stepCount + 1)
+        self.mean = np.zeros(stepCount + 1)
+        self.m2 = np.zeros(stepCount + 1)
+        self.count = np.zeros(stepCount + 1, dtype=np.int64)
+
+    def ensure(self, step):
+        # The arrays grow if a run goes beyond the number of steps it was created for.
+        if step < len(self.weight):
+            return
+        extra = max(step + 1 - len(self.weight), len(self.weight))
+        self.weight = np.concatenate((self.weight, np.zeros(extra)))
+        self.mean = np.concatenate((self.mean, np.zeros(extra)))
+        self.m2 = np.concatenate((self.m2, np.zeros(extra)))
+        self.count = np.concatenate((self.count, np.zeros(extra, dtype=np.int64)))
+
+    def add(self, step, values, weights):
+        values = np.asarray(values, dtype=float)
+        weights = np.broadcast_to(np.asarray(weights, dtype=float), values.shape)
+        total = weights.sum()
+
+        self.ensure(step)
+        if total <= 0:
+            return
+
+        # The mean and sum of squared deviations of the new batch are combined with those held for the step.
+        batchMean = np.dot(weights, values)/total
+        batchM2 = np.dot(weights, (values - batchMean)**2)
+
+        previous = self.weight[step]
+        combined = previous + total
+        delta = batchMean - self.mean[step]
+
+        self.mean[step] += delta*total/combined
+        self.m2[step] += batchM2 + delta**2*previous*total/combined
+        self.weight[step] = combined
+        self.count[step] += len(values)
+
+    # The accumulators, as saved in a checkpoint (see checkpoint.py).
+    def state(self):
+        return {"weight": self.weight, "mean": self.mean, "m2": self.m2, "count": self.count}
+
+    def restore(self, state):
+        for name, values in state.items():
+            setattr(self, name, np.array(values))
+
+    def steps(self):
+        # The number of steps which have been scored.
+        scored = np.flatnonzero(self.count)
+        return scored[-1] + 1 if len(scored) else 0
+
+    def means(self):
+        n = self.steps()
+        return np.where(self.weight[:n] > 0, self.mean[:n], np.nan)
+
+    def variances(self):
+        n = self.steps()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return np.where(self.weight[:n] > 0, self.m2[:n]/self.weight[:n], np.nan)
+
+
+class HistogramTally():
+    def __init__(self, edges):
+        self.edges = np.asarray(edges, dtype=float)
+        self.total = np.zeros(len(self.edges) - 1)
+        self.last = np.zeros(len(self.edges) - 1)
+        self.lastStep = None
+
+    def add(self, step, values, weights):
+        # Values outside the bins are not counted.
+        if step != self.lastStep:
+            self.last = np.zeros(len(self.edges) - 1)
+            self.lastStep = step
+
+        values = np.asarray(values, dtype=float)
+        weights = np.broadcast_to(np.asarray(weights, dtype=float), values.shape)
+
+        index = np.searchsorted(self.edges, values, side="right") - 1
+        inside = (index >= 0) & (index < len(self.last))
+        counts = np.bincount(index[inside], weights[inside], minlength=len(self.last))
+
+        self.total += counts
+        self.last += counts
+
+    def state(self):
+        return {"total": self.total, "last": self.last, "lastStep": np.array(-1 if self.lastStep is None else self.lastStep)}
+
+    def restore(self, state):
+        self.total = np.array(state["total"])
+        self.last = np.array(state["last"])
+        self.lastStep = None if state["lastStep"] < 0 else int(state["lastStep"])
+
+    def centres(self):
+        return (self.edges[1:] + self.edges[:-1])/2
+
+
+class Tallies():
+    def __init__(self, stepCount = 0, spectrumEdges = None, thermalEdges = None):
+        if spectrumEdges is None:
+            spectrumEdges = np.logspace(-5, 7.5, 251)
+        if thermalEdges is None:
+            thermalEdges = np.linspace(0.01, 1, 100)
+
+        self.steps = StepTally(stepCount)
+        self.spectrum = HistogramTally(spectrumEdges)
+        self.thermalEnergy = HistogramTally(thermalEdges)
+        self.thermalFlux = HistogramTally(thermalEdges)
+
+    def score(self, step, energies, speeds, weights = 1.0):
+        # Scores the neutrons of a step, given their energies (eV), speeds (cm/s) and weights.
+        energies = np.asarray(energies, dtype=float)
+        speeds = np.asarray(speeds, dtype=float)
+        weights = np.broadcast_to(np.asarray(weights, dtype=float), energies.shape)
+
+        self.steps.add(step, energies, weights)
+        self.spectrum.add(step, energies, weights)
+        self.thermalEnergy.add(step, energies, weights)
+        self.thermalFlux.add(step, energies, weights*speeds)
+
+    # The accumulators of every tally, named as tally.accumulator, for a checkpoint.
+    def state(self):
+        tallies = {"steps": self.steps, "spectrum": self.spectrum, "thermalEnergy": self.thermalEnergy, "thermalFlux": self.thermalFlux}
+        return {F"{name}.{key}": values for name, tally in tallies.items() for key, values in tally.state().items()}
+
+    def restore(self, state):
+        for name in ("steps", "spectrum", "thermalEnergy", "thermalFlux"):
+            getattr(self, name).restore({key[len(name) + 1:]: values for key, values in state.items() if key.startswith(F"{name}.")})
+
+    # The tallies as a dictionary of arrays, in the form they are saved by runFormat.py.
+    def arrays(self):
+        n = self.steps.steps()
+        return {
+            "stepWeight": self.steps.weight[:n],
+            "stepMean": self.steps.means(),
+            "stepVariance": self.steps.variances(),
+            "stepCount": self.steps.count[:n],
+            "spectrumEdges": self.spectrum.edges,
+            "spectrum": self.spectrum.total,
+            "spectrumLast": self.spectrum.last,
+            "thermalEdges": self.thermalEnergy.edges,
+            "thermalEnergy": self.thermalEnergy.total,
+            "thermalEnergyLast": self.thermalEnergy.last,
+            "thermalFlux": self.thermalFlux.total,
+            "thermalFluxLast": self.thermalFlux.last,
+        }
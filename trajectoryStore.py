@@ -0,0 +1,206 @@
+import numpy as np
+import os
+
+"""
+This class stores the trajectories of all the neutrons in a simulation in one place, as columns of typed numpy arrays, rather than as lists of floats held by every neutron object. Each row records one point of one neutron's walk: its integer id, the step of the simulation, its position, its energy over the step which led to that point, and the event which ended the step. A neutron's first row is its starting point, with no event (code 0).
+
+Rows are written into preallocated chunks of chunkSize rows; when a chunk is full it is either kept in memory or, if a spillPath is given, appended to one binary file per column and freed, so that very large runs need not fit in memory. Setting decimation = n keeps the points of only every nth step (starting points are always kept).
+
+Once the run has finished, finalize() joins the chunks (or memory-maps the spilled files) and the data may be read as whole columns, or as views of the rows for a single step or a single neutron. Rows are written in step order, so a step's rows are a contiguous slice of each column. A neutron's rows are scattered through the run, so the first call to forNeutron sorts the columns by neutron once; every neutron after that is again a slice.
+"""
+
+# The event codes are shared with the vectorised engine; eventCodes converts the event names used by the neutron class.
+from neutronPopulation import eventNames
+
+eventCodes = {name: code for code, name in enumerate(eventNames)}
+
+
+class TrajectoryStore():
+
+    columns = {"id": np.int64, "step": np.int32, "x": np.float64, "y": np.float64, "energy": np.float64, "event": np.int8}
+
+    def __init__(self, chunkSize = 2**16, decimation = 1, spillPath = None):
+
+        self.chunkSize = chunkSize
+        self.decimation = decimation
+        self.spillPath = spillPath
+
+        self.currentStep = 0
+        self.count = 0
+
+        self.chunks = []
+        self.chunk = self.newChunk()
+        self.fill = 0
+
+        # The joined columns and the columns sorted by neutron are made on demand, and forgotten whenever more rows are written.
+        self.arrays = None
+        self.neutronArrays = None
+
+        self.files = None
+        if spillPath is not None:
+            os.makedirs(spillPath, exist_ok=True)
+            self.files = {name: open(os.path.join(spillPath, F"{name}.bin"), "wb") for name in self.columns}
+
+
+    def __len__(self):
+        return self.count
+
+
+    def newChunk(self):
+        return {name: np.empty(self.chunkSize, dtype=dtype) for name, dtype in self.columns.items()}
+
+
+    # The reactor sets the current step at the start of each step; every row written until the next call belongs to it.
+    def setStep(self, step):
+        self.currentStep = step
+
+
+    def keepStep(self):
+        return self.currentStep % self.decimation == 0
+
+
+    def record(self, neutronId, x, y, energy, event):
+        # Writes a single row; this is used by the neutron class at every step. The event may be given as its name or its code.
+        if not isinstance(event, (int, np.integer)):
+            event = eventCodes[event]
+
+        if event != 0 and not self.keepStep():
+            return
+
+        i = self.fill
+        chunk = self.chunk
+        chunk["id"][i] = neutronId
+        chunk["step"][i] = self.currentStep
+        chunk["x"][i] = x
+        chunk["y"][i] = y
+        chunk["energy"][i] = energy
+        chunk["event"][i] = event
+
+        self.fill += 1
+        self.count += 1
+        self.arrays = self.neutronArrays = None
+
+        if self.fill == self.chunkSize:
+            self.flushChunk()
+
+
+    def append(self, neutronIds, x, y, energy, events):
+        # Writes a row for every entry of the given arrays at once; this is used by the vectorised engine.
+        events = np.broadcast_to(np.asarray(events, dtype=np.int8), np.shape(neutronIds))
+        rows = {"id": neutronIds, "x": x, "y": y, "energy": energy, "event": events}
+
+        if not self.keepStep():
+            keep = events == 0
+            rows = {name: np.asarray(values)[keep] for name, values in rows.items()}
+
+        total = len(rows["id"])
+        written = 0
+
+        while written < total:
+            count = min(total - written, self.chunkSize - self.fill)
+            part = slice(written, written + count)
+            space = slice(self.fill, self.fill + count)
+
+            for name, values in rows.items():
+                self.chunk[name][space] = values[part]
+            self.chunk["step"][space] = self.currentStep
+
+            self.fill += count
+            written += count
+
+            if self.fill == self.chunkSize:
+                self.flushChunk()
+
+        self.count += total
+        self.arrays = self.neutronArrays = None
+
+
+    def flushChunk(self):
+        # A full chunk is kept in memory, or written to the spill files and freed.
+        if self.fill == 0:
+            return
+
+        if self.files is not None:
+            for name, file in self.files.items():
+                file.write(self.chunk[name][:self.fill].tobytes())
+        else:
+            self.chunks.append({name: values[:self.fill] for name, values in self.chunk.items()})
+
+        self.chunk = self.newChunk()
+        self.fill = 0
+
+
+    def finalize(self):
+        # Returns a dictionary of whole columns. Spilled columns are memory-mapped from their files; otherwise the chunks are joined, once, into single arrays.
+        if self.arrays is not None:
+            return self.arrays
+
+        self.flushChunk()
+
+        if self.files is not None:
+            arrays = {}
+            for name, file in self.files.items():
+                file.flush()
+                if self.count == 0:
+                    arrays[name] = np.empty(0, dtype=self.columns[name])
+                else:
+                    arrays[name] = np.memmap(file.name, dtype=self.columns[name], mode="r", shape=(self.count,))
+        elif len(self.chunks) == 1:
+            arrays = self.chunks[0]
+        else:
+            arrays = {name: np.concatenate([chunk[name] for chunk in self.chunks]) if self.chunks else np.empty(0, dtype=dtype) for name, dtype in self.columns.items()}
+            self.chunks = [arrays] if self.count else []
+
+        self.arrays = arrays
+        return arrays
+
+
+    def column(self, name):
+        return self.finalize()[name]
+
+
+    def forStep(self, step):
+        # The rows written during a step, as views of the columns.
+        arrays = self.finalize()
+        start, stop = np.searchsorted(arrays["step"], [step, step + 1])
+        return {name: values[start:stop] for name, values in arrays.items()}
+
+
+    def forNeutron(self, neutronId):
+        # The rows of a single neutron in the order they were written (its walk from its starting point), as views of the columns sorted by neutron.
+        if self.neutronArrays is None:
+            arrays = self.finalize()
+            order = np.argsort(arrays["id"], kind="stable")
+            self.neutronArrays = {name: values[order] for name, values in arrays.items()}
+
+        ids = self.neutronArrays["id"]
+        start, stop = np.searchsorted(ids, [neutronId, neutronId + 1])
+        return {name: values[start:stop] for name, values in self.neutronArrays.items()}
+
+
+    def neutronIds(self):
+        return np.unique(self.column("id"))
+
+
+    # Opens the spill folder of a finished store for reading. As the columns are written one after the other, a store which was interrupted is read up to the last row present in every column.
+    @classmethod
+    def load(cls, path):
+        store = cls(chunkSize = 1)
+
+        count = min(os.path.getsize(os.path.join(path, F"{name}.bin"))//np.dtype(dtype).itemsize for name, dtype in cls.columns.items())
+        store.count = count
+        store.arrays = {}
+
+        for name, dtype in cls.columns.items():
+            if count == 0:
+                store.arrays[name] = np.empty(0, dtype=dtype)
+            else:
+                store.arrays[name] = np.memmap(os.path.join(path, F"{name}.bin"), dtype=dtype, mode="r", shape=(count,))
+
+        return store
+
+
+    def close(self):
+        if self.files is not None:
+            for file in self.files.values():
+                file.close()
@@ -0,0 +1,130 @@
+import numpy as np
+import time
+
+"""
+This file holds the variance reduction used with survival biasing (implicit capture), and the figure of merit by which its gain is judged.
+
+In an analog run every capture ends a history outright. With Reactor(..., implicitCapture=True) a neutron is never captured: at each collision its weight is reduced by the capture probability, the fraction C/T of the total cross section, and its event is chosen from the remaining ones, fission and scattering (see creatingDistribution.EventTable.chooseSurvival). The weight taken away is counted as captured, in the loss of the step and in the tallies at the energy of the collision, so that k_eff and the tallies are unchanged on average. Fission neutrons inherit the reduced weight of their parent. Power iteration counts neutrons rather than weights, and remains analog.
+
+Weights then fall with every collision, and a neutron of tiny weight costs as much to follow as any other. The weights are kept within bounds by a weight window, applied to the live neutrons at the end of every step:
+
+- a neutron below the lower bound plays Russian roulette: it survives with probability weight/survival, taking the survival weight, and is otherwise killed (counted as roulette in the reactor's eventCounts);
+- a neutron above the upper bound is split into copies, enough that each is within the bound (up to maxSplit of them), sharing its weight equally.
+
+Both keep the expected weight, so the window adds no bias. The bounds may depend on energy: given edges in eV, lower holds the lower bound of each bin between them, and energies beyond the edges take the bound of the nearest bin. The upper bound and survival weight are the multiples upperRatio and survivalRatio of the lower. Without a window, an implicit-capture run applies a plain weight cutoff, Russian roulette below weightCutoff with a survival weight of twice it, and no splitting.
+
+Bounds are weights relative to a starting neutron, of weight one. Population control (see populationControl.py) already sets every weight at the end of each step, leaving nothing for a window to do, so a reactor takes a weight window or a populationTarget but not both; an implicit-capture run with population control has its weights kept in bounds by the control alone.
+
+The gain of a variance reduction is measured by the figure of merit 1/(sigma^2 T), where sigma is the relative standard error of the mean k_eff and T the run time: a run with twice the figure of merit reaches the same error in half the time. figureOfMerit gives it for a single run, with the error found from batches of steps as in stoppingRules.RelativeError. figureOfMeritReport runs reactors of differing settings side by side, each with several seeds, and prints the speedup of each over the first, as when this file is run:
+
+python varianceReduction.py
+"""
+
+import stoppingRules
+
+
+class WeightWindow():
+    def __init__(self, lower = 0.25, edges = None, upperRatio = 5, survivalRatio = 2, maxSplit = 10):
+        self.lower = np.atleast_1d(np.asarray(lower, dtype=float))
+        self.edges = None if edges is None else np.asarray(edges, dtype=float)
+        self.upperRatio = upperRatio
+        self.survivalRatio = survivalRatio
+        self.maxSplit = maxSplit
+
+        bins = 1 if self.edges is None else len(self.edges) - 1
+        if len(self.lower) != bins:
+            raise ValueError(F"A weight window with {bins} energy bins needs as many lower bounds, not {len(self.lower)}")
+        if not 1 <= survivalRatio <= upperRatio:
+            raise ValueError(F"The survival weight must lie within the window; survivalRatio {survivalRatio} is not between 1 and upperRatio {upperRatio}")
+
+
+    # A window with no upper bound, which only plays Russian roulette below the cutoff.
+    @classmethod
+    def cutoff(cls, weightCutoff):
+        return cls(weightCutoff, upperRatio = np.inf)
+
+
+    def lowerBounds(self, energies):
+        if self.edges is None:
+            return np.full(len(energies), self.lower[0])
+        index = np.searchsorted(self.edges, energies, side="right") - 1
+        return self.lower[np.clip(index, 0, len(self.lower) - 1)]
+
+
+    def apply(self, weights, energies, rng):
+        # Plays roulette with, and splits, the neutrons of the given weights and energies. As with the methods of populationControl.py, returns the indices of the neutrons to carry forward, in order and repeated for copies, and their new weights; a neutron killed by roulette does not appear.
+        weights = np.asarray(weights, dtype=float)
+        lower = self.lowerBounds(energies)
+        newWeights = weights.copy()
+        copies = np.ones(len(weights), dtype=np.int64)
+
+        low = np.flatnonzero(weights < lower)
+        survival = self.survivalRatio*lower[low]
+        survives = rng.random(len(low))*survival < weights[low]
+        copies[low] = survives
+        newWeights[low] = survival
+
+        high = np.flatnonzero(weights > self.upperRatio*lower)
+        copies[high] = np.minimum(np.ceil(weights[high]/(self.upperRatio*lower[high])), self.maxSplit)
+        newWeights[high] /= copies[high]
+
+        index = np.repeat(np.arange(len(weights)), copies)
+        return index, newWeights[index]
+
+
+    # The window as plain values, saved with the parameters of a run; Reactor takes either form.
+    def parameters(self):
+        return {
+            "lower": self.lower.tolist(),
+            "edges": None if self.edges is None else self.edges.tolist(),
+            "upperRatio": self.upperRatio,
+            "survivalRatio": self.survivalRatio,
+            "maxSplit": self.maxSplit,
+        }
+
+
+def figureOfMerit(k_effData, seconds, inactive = 0, batches = 10):
+    # The figure of merit of a run from its k_effData, over the steps after the first inactive ones, and its run time. The relative error is found from batch means, as by stoppingRules.RelativeError; a run of fewer active steps than batches has neither.
+    steps = len(k_effData) - 1 - inactive
+    if steps < batches:
+        return None, np.nan
+    error = stoppingRules.RelativeError(0, steps, batches).error(k_effData)
+    if error is None or error == 0:
+        return error, np.nan
+    return error, 1/(error**2*seconds)
+
+
+def figureOfMeritReport(runs, seeds = range(8), inactive = 20):
+    # Runs a reactor for each of the named sets of parameters with each seed, and returns a report of the mean k_eff, its relative error, the total run time, the figure of merit and the speedup over the first run. The runs of different seeds are independent, so the relative error is found from the spread of their mean k_eff, which is more trustworthy than the batch error of a single run. Finished neutrons are not kept.
+    from reactor import Reactor
+
+    lines = [F"{'run':<24}{'k_eff':>10}{'error':>12}{'seconds':>10}{'FOM':>12}{'speedup':>10}"]
+    first = None
+
+    for name, parameters in runs.items():
+        means = []
+        seconds = 0
+        for seed in seeds:
+            reactor = Reactor(keepHistory = False, rng = seed, **parameters)
+            start = time.perf_counter()
+            reactor.startUp()
+            seconds += time.perf_counter() - start
+            means.append(np.mean(reactor.k_effData[1 + inactive:]))
+
+        mean = np.mean(means)
+        error = np.std(means, ddof=1)/np.sqrt(len(means))/mean
+        merit = 1/(error**2*seconds)
+        if first is None:
+            first = merit
+
+        lines.append(F"{name:<24}{mean:>10.4f}{error:>12.2e}{seconds:>10.2f}{merit:>12.1f}{merit/first:>10.2f}")
+
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    settings = {"neutronStart": 2000, "stepCount": 150, "engine": "vector", "populationTarget": 2000}
+    print(figureOfMeritReport({
+        "analog": settings,
+        "implicit capture": dict(settings, implicitCapture = True),
+    }))